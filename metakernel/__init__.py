@@ -1,21 +1,64 @@
 """A Jupyter kernel base class in Python which includes core magic functions (including help, command and file path completion, parallel and distributed processing, downloads, and much more)."""
 
-from importlib.metadata import version as _version
-from typing import Any
-
-from . import pexpect
-from ._metakernel import (
-    ExceptionWrapper,
-    IPythonKernel,
-    MetaKernel,
-    MetaKernelApp,
-    get_metakernel,
-    register_ipython_magics,
-)
-from .magic import Magic, get_ipython, option
-from .parser import Parser
-from .process_metakernel import ProcessMetaKernel
-from .replwrap import REPLWrapper
+from __future__ import annotations
+
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from . import pexpect
+    from ._metakernel import (
+        ExceptionWrapper,
+        IPythonKernel,
+        MetaKernel,
+        MetaKernelApp,
+        get_metakernel,
+        plain_text,
+        register_ipython_magics,
+    )
+    from .magic import Magic, get_ipython, option
+    from .parser import MagicInfo, ParseInfo, Parser
+    from .process_metakernel import ProcessMetaKernel
+    from .replwrap import REPLWrapper
+
+# Names are imported from their modules on first access, so that modules
+# which need little of metakernel (e.g. metakernel.forkserver) load fast.
+_LAZY_NAMES = {
+    "ExceptionWrapper": "._metakernel",
+    "IPythonKernel": "._metakernel",
+    "MetaKernel": "._metakernel",
+    "MetaKernelApp": "._metakernel",
+    "get_metakernel": "._metakernel",
+    "plain_text": "._metakernel",
+    "register_ipython_magics": "._metakernel",
+    "Magic": ".magic",
+    "get_ipython": ".magic",
+    "option": ".magic",
+    "MagicInfo": ".parser",
+    "ParseInfo": ".parser",
+    "Parser": ".parser",
+    "ProcessMetaKernel": ".process_metakernel",
+    "REPLWrapper": ".replwrap",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _LAZY_NAMES:
+        value = getattr(import_module(_LAZY_NAMES[name], __name__), name)
+    elif name == "pexpect":
+        value = import_module(".pexpect", __name__)
+    elif name == "__version__":
+        from importlib.metadata import version
+
+        value = version("metakernel")
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_LAZY_NAMES, "pexpect", "__version__"])
 
 
 def u(s: Any) -> Any:
@@ -27,8 +70,10 @@ __all__ = [
     "ExceptionWrapper",
     "IPythonKernel",
     "Magic",
+    "MagicInfo",
     "MetaKernel",
     "MetaKernelApp",
+    "ParseInfo",
     "Parser",
     "ProcessMetaKernel",
     "REPLWrapper",
@@ -36,8 +81,7 @@ __all__ = [
     "get_metakernel",
     "option",
     "pexpect",
+    "plain_text",
     "register_ipython_magics",
     "u",
 ]
-
-__version__ = _version("metakernel")
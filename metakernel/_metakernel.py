@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import asyncio
+import contextvars
+import functools
 import glob
 import importlib
 import inspect
@@ -8,30 +10,48 @@ import json
 import logging
 import os
 import pkgutil
+import re
+import signal
 import subprocess
 import sys
+import threading
+import time
 import warnings
 from collections import OrderedDict
-from collections.abc import Callable
+from collections.abc import Callable, Iterator, MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from subprocess import CalledProcessError
 from typing import TYPE_CHECKING, Any
 
 import comm
-from ipykernel.kernelapp import IPKernelApp
+from ipykernel.kernelapp import IPKernelApp, kernel_flags
 from ipykernel.kernelbase import Kernel
-from IPython.core.formatters import DisplayFormatter
 from IPython.display import publish_display_data
 from IPython.paths import get_ipython_dir
 from IPython.utils.tempdir import TemporaryDirectory  # type:ignore[attr-defined]
 from jupyter_core.paths import jupyter_config_dir, jupyter_config_path
-from traitlets import Dict, Unicode
+from traitlets import Bool, Dict, Float, Int, List, Unicode
 from traitlets.config import Application
 
-from .config import get_history_file, get_local_magics_dir
+from .config import get_history_file, get_local_magics_dir, get_magics_index_file
+from .forkserver import ForkServer, kernel_name, launcher_argv
+from .history import HistoryStore
 from .magic import get_ipython
-from .parser import Parser
+from .output_cache import OutputCache
+from .parser import ParseInfo, Parser
+from .registry import (
+    MagicDict,
+    MagicIndex,
+    MagicManifest,
+    MagicWatcher,
+    find_magic_module,
+)
+from .streams import StreamBuffer
 
 if TYPE_CHECKING:
+    from IPython.core.formatters import DisplayFormatter
+
     from .magic import Magic
 
 warnings.filterwarnings("ignore", module="IPython.html.widgets")
@@ -51,11 +71,59 @@ def _is_mime_bundle(obj: Any) -> bool:
     )
 
 
-try:
-    import ipywidgets as widgets  #  type:ignore[import-untyped]
-    from ipywidgets.widgets.widget import Widget  #  type:ignore[import-untyped]
-except ImportError:
-    Widget = None
+def plain_text(obj: Any) -> str:
+    """Return the "text/plain" that IPython's formatter gives *obj*.
+
+    IPython prints the lines of ``repr(obj)`` for objects without
+    pretty-printers, which drops a trailing newline. Kernels can use this
+    for their own ``MetaKernel.plain_text_types``.
+    """
+    return "\n".join(repr(obj).splitlines())
+
+
+_WORD_CHARS = re.compile(r"\w*\Z")
+# ipykernel calls shell_main from 7.0, and dispatches a request while a
+# cell runs (dispatch_shell(concurrent=True)) from 7.4
+_CONCURRENT_DISPATCH = (
+    "concurrent" in inspect.signature(Kernel.dispatch_shell).parameters
+)
+_HISTORY_NAME = re.compile(r"(?<![\w.])_(?:_{0,2}|i{1,3}|i?\d+)(?!\w)")
+
+
+def _async_raise(thread_id: int, exc_type: type[BaseException] | None) -> None:
+    """Raise *exc_type* in the thread *thread_id* when it next runs Python code.
+
+    With None, an exception that is still pending is dropped.
+    """
+    import ctypes
+
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(thread_id), ctypes.py_object(exc_type) if exc_type else None
+    )
+
+
+def _is_widget(obj: Any) -> bool:
+    """Return True if *obj* is an ipywidgets ``Widget``.
+
+    No object can be a widget before ipywidgets has been imported, so this
+    never imports ipywidgets itself.
+    """
+    module = sys.modules.get("ipywidgets.widgets.widget")
+    widget = getattr(module, "Widget", None)
+    return widget is not None and isinstance(obj, widget)
+
+
+def _import_widget_class() -> Any:
+    """Import and return ipywidgets' ``Widget``, or None if not installed."""
+    try:
+        from ipywidgets.widgets.widget import Widget  # type:ignore[import-untyped]
+    except ImportError:
+        return None
+    return Widget
+
+
+# The (path, digest) each magic module in sys.modules was imported from
+_magic_module_sources: dict[str, tuple[str, str | None]] = {}
 
 # Inlined from IPython TermColors after its removal.
 RED = "\033[0;31m"
@@ -79,11 +147,19 @@ class ExceptionWrapper:
 
 
 def lazy_import_handle_comm_opened(*args: Any, **kwargs: Any) -> None:
+    Widget = _import_widget_class()
     if Widget is None:
         return
     Widget.handle_comm_opened(*args, **kwargs)
 
 
+def lazy_import_handle_control_comm_opened(*args: Any, **kwargs: Any) -> None:
+    Widget = _import_widget_class()
+    if Widget is None:
+        return
+    Widget.handle_control_comm_opened(*args, **kwargs)
+
+
 def get_metakernel() -> MetaKernel | None:
     """
     Get the MetaKernel instance.
@@ -119,6 +195,118 @@ class MetaKernel(Kernel):
         "help_links": help_links,
     }
     plot_settings: dict[str, Any] = Dict({"backend": "inline"}).tag(config=True)  # type: ignore[assignment]
+    magic_watch_interval: float = Float(  # type: ignore[assignment]
+        0.0,
+        help="""Seconds between checks of the magic search paths for changed
+        magic files, which are then reloaded automatically. 0 disables it.""",
+    ).tag(config=True)
+    fast_restart: bool = Bool(  # type: ignore[assignment]
+        True,
+        help="""On restart, keep the loaded magics and instantiate again only
+        those that set `reset_on_restart`. If False, all magics are reloaded
+        from their files, as on startup.""",
+    ).tag(config=True)
+    execute_in_thread: bool = Bool(  # type: ignore[assignment]
+        False,
+        help="""Run synchronous `do_execute_direct` implementations in a worker
+        thread, so that the event loop keeps handling comm messages and
+        scheduled output while a cell runs. Output sent from the worker is
+        passed on to the event loop.""",
+    ).tag(config=True)
+    concurrent_requests: list[str] = List(  # type: ignore[assignment]
+        Unicode(),
+        [
+            "complete_request",
+            "inspect_request",
+            "is_complete_request",
+            "history_request",
+        ],
+        help="""Shell requests that are answered while a cell runs, instead of
+        after it. This needs ipykernel 7.4 or later, and a free event loop,
+        i.e. `execute_in_thread` or an async `do_execute_direct`.""",
+    ).tag(config=True)
+    stream_flush_interval: float = Float(  # type: ignore[assignment]
+        0.05,
+        help="""Seconds that text from Print, Write and Error may be held back
+        while a cell runs, so that it is sent in fewer stream messages. This
+        needs a free event loop, i.e. `execute_in_thread` or an async
+        `do_execute_direct`; otherwise every call is a message of its own,
+        as with 0.""",
+    ).tag(config=True)
+    output_limit: int = Int(  # type: ignore[assignment]
+        0,
+        help="""Characters of stream output that a cell may send; the rest is
+        dropped and summarized when the cell ends. 0 means no limit.""",
+    ).tag(config=True)
+    output_message_limit: int = Int(  # type: ignore[assignment]
+        0,
+        help="""Stream messages that a cell may send before its output is
+        dropped, as for `output_limit`. 0 means no limit.""",
+    ).tag(config=True)
+    output_spill_dir: str = Unicode(  # type: ignore[assignment]
+        "",
+        help="""Directory to write the output that a cell drops over its limit
+        to, in a file named in the summary. Empty to not keep it.""",
+    ).tag(config=True)
+    max_path_matches: int = Int(  # type: ignore[assignment]
+        1000,
+        help="""Most file system paths offered as completions, the first in
+        sorted order. 0 means no limit.""",
+    ).tag(config=True)
+    inspect_cache_size: int = Int(  # type: ignore[assignment]
+        128,
+        help="""Inspection replies (e.g. for Shift-Tab) that are kept, so
+        that asking again at the same place doesn't look up the help again,
+        until a cell runs. 0 disables it.""",
+    ).tag(config=True)
+    supersede_completions: bool = Bool(  # type: ignore[assignment]
+        True,
+        help="""Answer a completion request with no matches, instead of
+        computing them, if a newer one from the same client is waiting,
+        as when the user types on. This needs ipykernel 7 or later.""",
+    ).tag(config=True)
+    completion_timeout: float = Float(  # type: ignore[assignment]
+        0.0,
+        help="""Seconds that `get_completions` and the completions of a magic
+        may take. They run in a worker thread, and the completions found
+        until then (e.g. file paths) are sent if they take longer; the call
+        goes on in the background. 0 means no limit.""",
+    ).tag(config=True)
+    lazy_history_variables: bool = Bool(  # type: ignore[assignment]
+        False,
+        help="""Keep the history variables (`_`, `__`, `___`, `_N`, `_i`,
+        `_ii`, `_iii`, `_iN`) in the kernel, and pass them to `set_variables`
+        only when a cell refers to them, instead of after every cell.""",
+    ).tag(config=True)
+    output_cache_size: int = Int(  # type: ignore[assignment]
+        1000,
+        help="""Results of cells that are kept as `_N` variables; those used
+        least recently are removed first. 0 disables the `_N` variables.""",
+    ).tag(config=True)
+    output_cache_bytes: int = Int(  # type: ignore[assignment]
+        0,
+        help="""Estimated bytes that the results kept as `_N` variables may
+        take, as for `output_cache_size`. 0 means no limit.""",
+    ).tag(config=True)
+    # Whether get_completions and get_kernel_help_on may be called while
+    # do_execute_direct runs; if not, they are skipped until it returns.
+    thread_safe_backend = False
+    # Whether the completions of a longer name are among those of a shorter
+    # one (as with completion by prefix), so that do_complete can narrow
+    # down its last results as more of a name is typed, until a cell runs.
+    cache_completions = True
+    # Event loop iterations that a completion request waits for newer ones
+    # to be received, see supersede_completions.
+    _completion_yields = 4
+    # Types whose results are shown as "text/plain" only, without running
+    # IPython's formatter. Keyed on the exact type, so subclasses that add
+    # _repr_*_ methods are formatted as usual.
+    plain_text_types: dict[type, Callable[[Any], str]] = {
+        str: plain_text,
+        int: plain_text,
+        float: plain_text,
+        bool: plain_text,
+    }
 
     meta_kernel = None
 
@@ -134,8 +322,36 @@ class MetaKernel(Kernel):
         kwargs["app_name"] = cls.app_name
         MetaKernelApp.launch_instance(kernel_class=cls, *args, **kwargs)  # noqa: B026
 
+    @classmethod
+    def prewarm(cls) -> None:
+        """Do the work that every kernel of this class repeats at startup.
+
+        This is used by fork servers (see :mod:`metakernel.forkserver`): a
+        kernel is created and all its magics are imported, so that kernels
+        forked afterwards find the modules imported, the regexes compiled
+        and the magic index read. Subclasses can extend this to load more,
+        but must not start threads or subprocesses, which don't survive a
+        fork.
+        """
+        create_comm = comm.create_comm
+        meta_kernel = MetaKernel.meta_kernel
+        try:
+            kernel = cls()
+            kernel.line_magics.load_all()
+            kernel.cell_magics.load_all()
+            kernel._display_formatter  # noqa: B018
+        finally:
+            # Forked kernels must not refer to this one
+            comm.create_comm = create_comm
+            MetaKernel.meta_kernel = meta_kernel
+
     def __init__(self, *args: Any, **kwargs: Any) -> None:
+        started = time.perf_counter()
         super().__init__(*args, **kwargs)  # type:ignore[no-untyped-call]
+        # Seconds spent in each phase of construction, see --profile-startup
+        self.startup_times: dict[str, float] = {
+            "kernel_init": time.perf_counter() - started
+        }
         if MetaKernel.meta_kernel is None:
             MetaKernel.meta_kernel = self
         if self.log is None:
@@ -162,69 +378,177 @@ class MetaKernel(Kernel):
         self._: Any = None
         self.__: Any = None
         self.___: Any = None
+        #: The history variables, while ``lazy_history_variables`` is set
+        self.history_variables: dict[str, Any] = {}
+        self._pushed_variables: set[str] = set()
+        #: The results kept as ``_N`` variables, see ``output_cache_size``
+        self.output_cache = OutputCache()
         self.max_hist_cache = 1000
         self.hist_cache: list[str] = []
-        kwargs = {"parent": self, "kernel": self}
-        self.comm_manager = comm.get_comm_manager()
-        # widgets have changed target name in 8.x, keeping for compatibility
-        self.comm_manager.register_target(
-            "ipython.widget", lazy_import_handle_comm_opened
+        self._history_store: HistoryStore | None = None
+        # (state, code before the name, name, code after the cursor, reply)
+        # of the last completion that can be narrowed down, see
+        # _completion_state
+        self._completion_cache: (
+            tuple[tuple[Any, ...], str, str, str, dict[str, Any]] | None
+        ) = None
+        # Replies of do_inspect by (code, cursor_pos, detail_level)
+        self._inspect_cache: OrderedDict[tuple[str, int, int], dict[str, Any]] = (
+            OrderedDict()
         )
+        # The newest complete_request received from each client session
+        self._completion_requests: dict[str, str] = {}
+        self._completion_executor: ThreadPoolExecutor | None = None
+        kwargs = {"parent": self, "kernel": self}
+        with self._startup_phase("comm_registration"):
+            self.comm_manager = comm.get_comm_manager()
+            # widgets have changed target name in 8.x, keeping for compatibility
+            self.comm_manager.register_target(
+                "ipython.widget", lazy_import_handle_comm_opened
+            )
 
-        # compatible with widgets 8.x
-        if Widget is not None:
-            widgets.register_comm_target()
+            # compatible with widgets 8.x; ipywidgets is only imported once
+            # a frontend actually opens a widget comm
+            self.comm_manager.register_target(
+                "jupyter.widget", lazy_import_handle_comm_opened
+            )
+            self.comm_manager.register_target(
+                "jupyter.widget.control", lazy_import_handle_control_comm_opened
+            )
 
         # Ensure comm objects created by this kernel have kernel=self set at
         # construction time. This allows ipywidgets.Output context manager to
         # reach kernel.get_parent() and correctly set msg_id (issue #217).
-        try:
-            _kernel_ref = self
-            _base_create_comm = comm.create_comm
-
-            def _create_comm_with_kernel(*args: Any, **kwargs: Any) -> Any:
-                c = _base_create_comm(*args, **kwargs)
-                if getattr(c, "kernel", None) is None:
-                    c.kernel = _kernel_ref  # type: ignore[attr-defined]
-                return c
+        with self._startup_phase("create_comm_wrapper"):
+            try:
+                _kernel_ref = self
+                _base_create_comm = comm.create_comm
 
-            comm.create_comm = _create_comm_with_kernel
-        except Exception:  # noqa: S110
-            pass
+                def _create_comm_with_kernel(*args: Any, **kwargs: Any) -> Any:
+                    c = _base_create_comm(*args, **kwargs)
+                    if getattr(c, "kernel", None) is None:
+                        c.kernel = _kernel_ref  # type: ignore[attr-defined]
+                    return c
 
-        self.hist_file = get_history_file(self)
-        self.parser = Parser(
-            self.identifier_regex,
-            self.func_call_regex,
-            self.magic_prefixes,
-            self.help_suffix,
-        )
+                comm.create_comm = _create_comm_with_kernel
+            except Exception:  # noqa: S110
+                pass
+
+        with self._startup_phase("history_file"):
+            self.hist_file = get_history_file(self)
+        with self._startup_phase("parser"):
+            self.parser = Parser(
+                self.identifier_regex,
+                self.func_call_regex,
+                self.magic_prefixes,
+                self.help_suffix,
+            )
+            self.parser.max_path_matches = self.max_path_matches
         comm_msg_types = ["comm_open", "comm_msg", "comm_close"]
         for msg_type in comm_msg_types:
             self.shell_handlers[msg_type] = getattr(self.comm_manager, msg_type)
-        self._display_formatter = DisplayFormatter()  # pass kwargs?
+        self._formatter: DisplayFormatter | None = None
+        self._default_printers: dict[str, dict[type, Any]] = {}
         self.env: dict[str, Any] = {}
         self.magic_search_paths: list[str] = []
         self.magic_load_errors: list[tuple[str, str]] = []
-        self.reload_magics()
+        self.magic_load_times: dict[str, float] = {}
+        self.magic_watcher: MagicWatcher | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_loop: asyncio.AbstractEventLoop | None = None
+        self._executor_thread: int | None = None
+        self._executor_loop_thread: int | None = None
+        self._executor_lock = threading.Lock()
+        self.backend_lock = threading.Lock()
+        # Held while magics run in a cell, and while they complete in the
+        # worker thread (see completion_timeout)
+        self._magic_lock = threading.Lock()
+        self._stream_buffer = StreamBuffer(
+            self._send_stream, call_later=self._call_later
+        )
+        with self._startup_phase("reload_magics"):
+            self.reload_magics()
+        if self.magic_watch_interval > 0:
+            self.start_magic_watcher()
         # provide a way to get the current instance
         self.set_variable("kernel", self)
         # Run command line filenames, if given:
         if self.parent is not None and self.parent.extra_args:
-            level = self.log.level
-            self.log.setLevel("INFO")
-            self.redirect_to_log = True
-            self.Write("Executing files...")
-            for filename in self.parent.extra_args:
-                self.Write(f"    {filename}...")
-                try:
-                    self.do_execute_file(filename)
-                except Exception as exc:
-                    self.log.info(f"    {exc}")
-            self.Write("Executing files: done!")
-            self.log.setLevel(level)
+            with self._startup_phase("extra_args"):
+                level = self.log.level
+                self.log.setLevel("INFO")
+                self.redirect_to_log = True
+                self.Write("Executing files...")
+                for filename in self.parent.extra_args:
+                    self.Write(f"    {filename}...")
+                    try:
+                        self.do_execute_file(filename)
+                    except Exception as exc:
+                        self.log.info(f"    {exc}")
+                self.Write("Executing files: done!")
+                self.log.setLevel(level)
             self.redirect_to_log = False
 
+    @contextmanager
+    def _startup_phase(self, name: str) -> Iterator[None]:
+        """Record the time spent in a phase of construction."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_times[name] = time.perf_counter() - started
+
+    def get_startup_profile(self) -> dict[str, Any]:
+        """Return how long constructing this kernel took, in seconds.
+
+        ``phases`` breaks ``MetaKernel.__init__`` down into its steps and
+        ``magic_modules`` gives the time spent registering each magic
+        module during the last :meth:`reload_magics`.
+        """
+        return {
+            "kernel": f"{type(self).__module__}.{type(self).__qualname__}",
+            "phases": dict(self.startup_times),
+            "magic_modules": dict(self.magic_load_times),
+        }
+
+    @property
+    def _display_formatter(self) -> DisplayFormatter:
+        """IPython's DisplayFormatter, created on first display."""
+        if self._formatter is None:
+            from IPython.core.formatters import DisplayFormatter
+
+            self._formatter = DisplayFormatter()  # pass kwargs?
+            self._default_printers = {
+                mime: dict(formatter.type_printers)
+                for mime, formatter in self._formatter.formatters.items()
+            }
+        return self._formatter
+
+    def _format(self, obj: Any) -> tuple[dict[str, Any], dict[str, Any]]:
+        """Return the MIME bundle and metadata to display *obj*.
+
+        Objects of the ``plain_text_types`` skip IPython's formatter,
+        unless a printer for their type was registered with it.
+        """
+        cls = type(obj)
+        to_text = self.plain_text_types.get(cls)
+        if to_text is not None and not self._has_printer(cls):
+            return {"text/plain": to_text(obj)}, {}
+        return self._display_formatter.format(obj)  # type:ignore[no-untyped-call,no-any-return]
+
+    def _has_printer(self, cls: type) -> bool:
+        """Whether a printer for *cls* was registered with the formatter."""
+        if self._formatter is None:
+            return False
+        name = (cls.__module__, cls.__name__)
+        for mime, formatter in self._formatter.formatters.items():
+            printer = formatter.type_printers.get(cls)
+            if printer is not self._default_printers[mime].get(cls):
+                return True
+            if name in formatter.deferred_printers:
+                return True
+        return False
+
     def makeSubkernel(self, kernel: MetaKernel) -> None:
         """
         Run this method in an IPython kernel to set
@@ -250,6 +574,22 @@ class MetaKernel(Kernel):
         Set a variable to a Python-typed value.
         """
 
+    def set_variables(self, variables: dict[str, Any]) -> None:
+        """
+        Set several variables at once, e.g. in one round trip.
+
+        By default, calls set_variable for each of them.
+        """
+        for name, value in variables.items():
+            self.set_variable(name, value)
+
+    def del_variables(self, names: list[str]) -> None:
+        """
+        Remove variables, such as results dropped from the output cache.
+
+        Names that are not set are ignored.
+        """
+
     def get_variable(self, name: str) -> Any:
         """
         Lookup a variable name and return a Python-typed value.
@@ -264,7 +604,10 @@ class MetaKernel(Kernel):
         return "This is a usage statement."
 
     def get_kernel_help_on(
-        self, info: dict[str, Any], level: int = 0, none_on_fail: bool = False
+        self,
+        info: MutableMapping[str, Any],
+        level: int = 0,
+        none_on_fail: bool = False,
     ) -> str | None:
         """Get help on an object.  Called by the help magic."""
         if none_on_fail:
@@ -282,12 +625,30 @@ class MetaKernel(Kernel):
         base = get_ipython_dir()
         return os.path.join(base, "metakernel", "magics")
 
-    def get_completions(self, info: dict[str, Any]) -> list[str]:
+    def get_completions(self, info: MutableMapping[str, Any]) -> list[str]:
         """
         Get completions from kernel based on info dict.
         """
         return []
 
+    def query_backend(
+        self, func: Callable[..., Any], *args: Any, default: Any = None
+    ) -> Any:
+        """Call *func* unless it would use the backend while a cell runs.
+
+        Completion and inspection requests can be answered while
+        do_execute_direct runs (see ``concurrent_requests``). They get
+        *default* from backend hooks then, unless ``thread_safe_backend``.
+        """
+        if self.thread_safe_backend:
+            return func(*args)
+        if not self.backend_lock.acquire(blocking=False):
+            return default
+        try:
+            return func(*args)
+        finally:
+            self.backend_lock.release()
+
     def do_execute_direct(self, code: str, silent: bool = False) -> Any:
         """
         Execute code in the kernel language.
@@ -339,6 +700,27 @@ class MetaKernel(Kernel):
     def restart_kernel(self) -> None:
         """Restart the kernel"""
 
+    def restart_session(self) -> None:
+        """Restart the language backend and reset the magics.
+
+        With ``fast_restart`` (the default), only :meth:`restart_kernel`
+        does real work: magics keep their instances, except for those that
+        opt into being reset (see :meth:`reset_magics`).
+        """
+        self.restart_kernel()
+        # The results of the old session are gone with its variables
+        self.output_cache.clear()
+        self.history_variables.clear()
+        self._pushed_variables.clear()
+        self._completion_cache = None
+        self._inspect_cache.clear()
+        if self._history_store is not None:
+            self._history_store.new_session()
+        if self.fast_restart:
+            self.reset_magics()
+        else:
+            self.reload_magics(reset=True)
+
     def _request_shutdown(self) -> None:
         """Send an ask_exit payload and schedule kernel shutdown.
 
@@ -386,6 +768,25 @@ class MetaKernel(Kernel):
 
         https://jupyter-client.readthedocs.io/en/stable/messaging.html#execute
         """
+        self._completion_cache = None
+        self._inspect_cache.clear()
+        self._stream_buffer.open(
+            0,
+            self.output_limit,
+            self.output_message_limit,
+            self.output_spill_dir,
+        )
+        try:
+            return await self._do_execute(code, silent, store_history, allow_stdin)
+        finally:
+            self._stream_buffer.close()
+            # The cell may have changed what can be completed or inspected
+            self._completion_cache = None
+            self._inspect_cache.clear()
+
+    async def _do_execute(
+        self, code: Any, silent: Any, store_history: Any, allow_stdin: Any
+    ) -> Any:
         # Set the ability for the kernel to get standard-in:
         self._allow_stdin = allow_stdin
         # Create a default response:
@@ -404,11 +805,16 @@ class MetaKernel(Kernel):
 
         if code and store_history:
             self.hist_cache.append(code.strip())
+            del self.hist_cache[: -self.max_hist_cache]
+            self.store_history(code.strip())
 
         if not code.strip():
             return self.kernel_resp
 
-        info = self.parse_code(code)
+        if self.history_variables or self.output_cache:
+            self.push_history_variables(code)
+
+        info = self.parse_magic(code)
         self.payload = []
         retval = None
 
@@ -434,47 +840,69 @@ class MetaKernel(Kernel):
         elif info["magic"] or self.sticky_magics:
             retval = None
             if self.sticky_magics:
-                magics, code = _split_magics_code(code, self.magic_prefixes)
-                code = magics + self._get_sticky_magics() + code
+                end = _magic_header_end(code, self.magic_prefixes)
+                magics = code[:end]
+                if magics and not magics.endswith("\n"):
+                    magics += "\n"
+                code = magics + self._get_sticky_magics() + code[end:]
             stack = []
             # Handle magics:
             magic = None
             prefixes = (self.magic_prefixes["shell"], self.magic_prefixes["magic"])
-            while code.startswith(prefixes):
-                magic = self.get_magic(code)
-                if magic is not None:
-                    stack.append(magic)
-                    code = str(magic.get_code())
-                    # signal to exit, maybe error or no block
-                    if not magic.evaluate:
+            cell = code
+            chain = self.parser.parse_magic_chain(cell)
+            chain.reverse()
+            # Completions of the magics may still run, see _complete_in_time
+            await self._acquire(self._magic_lock)
+            try:
+                while code.startswith(prefixes):
+                    if chain:
+                        # code is the rest of the cell after the previous magic
+                        minfo = chain.pop()
+                        minfo["code"] = cell[minfo.pop("offset") : minfo.pop("end")]
+                        magic = self.line_magics["magic"].get_magic({"magic": minfo})
+                    else:
+                        minfo = None
+                        magic = self.get_magic(code)
+                    if magic is not None:
+                        stack.append(magic)
+                        block = magic.get_code()
+                        if minfo is None or block is not minfo["code"]:
+                            # The magic changed its block, which must be parsed again
+                            chain = []
+                        code = str(block)
+                        # signal to exit, maybe error or no block
+                        if not magic.evaluate:
+                            break
+                    else:
                         break
-                else:
-                    break  # type:ignore[unreachable]
+            finally:
+                self._magic_lock.release()
             # Execute code, if any:
             if (magic is None or magic.evaluate) and code.strip() != "":
                 if code.startswith("~~META~~:"):
                     retval = self.do_execute_meta(code[9:].strip())
                 else:
                     try:
-                        retval = self.do_execute_direct(code)
-                        if inspect.isawaitable(retval):
-                            retval = await retval
+                        retval = await self._execute_direct(code)
                     except SystemExit:
                         self._request_shutdown()
                         return self.kernel_resp
                     except Exception as e:
                         retval = ExceptionWrapper(type(e).__name__, str(e), [])
             # Post-process magics:
-            for magic in reversed(stack):
-                retval = magic.post_process(retval)
+            await self._acquire(self._magic_lock)
+            try:
+                for magic in reversed(stack):
+                    retval = magic.post_process(retval)
+            finally:
+                self._magic_lock.release()
         else:
             if code.startswith("~~META~~:"):
                 retval = self.do_execute_meta(code[9:].strip())
             else:
                 try:
-                    retval = self.do_execute_direct(code)
-                    if inspect.isawaitable(retval):
-                        retval = await retval
+                    retval = await self._execute_direct(code)
                 except SystemExit:
                     self._request_shutdown()
                     return self.kernel_resp
@@ -488,27 +916,148 @@ class MetaKernel(Kernel):
 
         return self.kernel_resp
 
+    async def _execute_direct(self, code: str) -> Any:
+        """Call do_execute_direct, in the worker thread if execute_in_thread."""
+        await self._acquire(self.backend_lock)
+        try:
+            if self.execute_in_thread and not inspect.iscoroutinefunction(
+                self.do_execute_direct
+            ):
+                with self._stream_buffer.batching(self.stream_flush_interval):
+                    retval = await self._run_in_executor(self.do_execute_direct, code)
+            else:
+                retval = self.do_execute_direct(code)
+            if inspect.isawaitable(retval):
+                with self._stream_buffer.batching(self.stream_flush_interval):
+                    retval = await retval
+        finally:
+            self.backend_lock.release()
+        return retval
+
+    async def _acquire(self, lock: threading.Lock) -> None:
+        """Acquire *lock*, waiting for it in a thread, not on the event loop."""
+        if lock.acquire(blocking=False):
+            return
+        future = asyncio.get_running_loop().run_in_executor(None, lock.acquire)
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Give the lock back once the thread has it
+            future.add_done_callback(lambda f: lock.release())
+            raise
+
+    async def _run_in_executor(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run *func* in the worker thread while the event loop keeps running.
+
+        The worker sees the context of the current request (so get_parent
+        works), its output is sent from the event loop (see send_response),
+        and SIGINT raises KeyboardInterrupt in the worker, as it would in a
+        cell running on the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="metakernel-execute"
+            )
+        context = contextvars.copy_context()
+
+        def run() -> Any:
+            with self._executor_lock:
+                self._executor_thread = threading.get_ident()
+            try:
+                return context.run(func, *args)
+            finally:
+                with self._executor_lock:
+                    self._executor_thread = None
+                    # Drop an interrupt that came too late to be raised
+                    _async_raise(threading.get_ident(), None)
+
+        def interrupt(signum: int, frame: Any) -> None:
+            with self._executor_lock:
+                if self._executor_thread is not None:
+                    _async_raise(self._executor_thread, KeyboardInterrupt)
+
+        previous = None
+        if threading.current_thread() is threading.main_thread():
+            previous = signal.signal(signal.SIGINT, interrupt)
+        self._executor_loop_thread = threading.get_ident()
+        self._executor_loop = loop
+        try:
+            return await loop.run_in_executor(self._executor, run)
+        finally:
+            self._executor_loop = None
+            with self._executor_lock:
+                self._executor_thread = None
+            if previous is not None:
+                signal.signal(signal.SIGINT, previous)
+
+    def push_history_variables(self, code: str) -> None:
+        """Set the history variables that *code* refers to.
+
+        Called before a cell runs. The results it uses become the most
+        recently used in the output cache, and with
+        ``lazy_history_variables``, the variables it names are set.
+        """
+        names = set(_HISTORY_NAME.findall(code))
+        for name in names:
+            if name[1:].isdigit():
+                self.output_cache.touch(int(name[1:]))
+        names &= self.history_variables.keys()
+        if names:
+            self.set_variables({name: self.history_variables[name] for name in names})
+            self._pushed_variables |= names
+
+    def evict_outputs(self, keys: list[int]) -> None:
+        """Remove the ``_N`` variables of the results of cells *keys*."""
+        names = ["_" + str(key) for key in keys]
+        if not names:
+            return
+        if self.lazy_history_variables:
+            for name in names:
+                self.history_variables.pop(name, None)
+            names = [name for name in names if name in self._pushed_variables]
+            self._pushed_variables.difference_update(names)
+            if not names:
+                return
+        self.del_variables(names)
+
     async def post_execute(self, retval: Any, code: str, silent: bool) -> None:
         """Post-execution actions
 
         Handle special kernel variables and display response if not silent.
         """
         # Handle in's
-        self.set_variable("_iii", self._iii)
-        self.set_variable("_ii", self._ii)
-        self.set_variable("_i", code)
-        self.set_variable("_i" + str(self.execution_count), code)
+        variables = {
+            "_iii": self._iii,
+            "_ii": self._ii,
+            "_i": code,
+            "_i" + str(self.execution_count): code,
+        }
         self._iii = self._ii
         self._ii = code
         if retval is not None:
             # --------------------------------------
             # Handle out's (only when non-null)
-            self.set_variable("___", self.___)
-            self.set_variable("__", self.__)
-            self.set_variable("_", retval)
-            self.set_variable("_" + str(self.execution_count), retval)
+            variables["___"] = self.___
+            variables["__"] = self.__
+            variables["_"] = retval
+            if self.output_cache_size:
+                variables["_" + str(self.execution_count)] = retval
             self.___ = self.__
             self.__ = retval
+        if self.lazy_history_variables:
+            self.history_variables.update(variables)
+            # Keep the inputs of the last max_hist_cache cells, as hist_cache
+            old = self.execution_count - self.max_hist_cache
+            self.history_variables.pop("_i" + str(old), None)
+        else:
+            self.set_variables(variables)
+        if retval is not None:
+            if self.output_cache_size:
+                cache = self.output_cache
+                cache.size = self.output_cache_size
+                cache.byte_limit = self.output_cache_bytes
+                self.evict_outputs(cache.add(self.execution_count, retval))
             self.log.debug(retval)
             if isinstance(retval, ExceptionWrapper):
                 self.kernel_resp["status"] = "error"
@@ -530,7 +1079,7 @@ class MetaKernel(Kernel):
                     self.send_response(self.iopub_socket, "execute_result", content)
             else:
                 try:
-                    data = self._display_formatter.format(retval)  # type:ignore[no-untyped-call]
+                    data = self._format(retval)
                 except Exception as e:
                     self.Error(e)
                     return
@@ -540,15 +1089,116 @@ class MetaKernel(Kernel):
                     "metadata": data[1],
                 }
                 if not silent:
-                    if Widget and isinstance(retval, Widget):
+                    if _is_widget(retval):
                         self.Display(retval)
                         return
                     self.send_response(self.iopub_socket, "execute_result", content)
 
+    async def shell_main(self, subshell_id: str | None, msg: Any) -> None:
+        """Answer ``concurrent_requests`` while a cell runs, as comms are.
+
+        Also notes the newest completion request of each client, see
+        ``supersede_completions``.
+
+        This uses ipykernel internals: with ipykernel before 7.4, requests
+        are answered in turn, and before 7.0, this isn't called at all.
+        """
+        lock = getattr(self, "_main_asyncio_lock", None)
+        concurrent = (
+            _CONCURRENT_DISPATCH
+            and subshell_id is None
+            and lock is not None
+            and hasattr(self, "_get_shell_context_var")
+            and hasattr(self, "_shell_parent_ident")
+            and lock.locked()
+            and bool(self.concurrent_requests)
+        )
+        if self.session is not None and (concurrent or self.supersede_completions):
+            try:
+                _, frames = self.session.feed_identities(msg, copy=False)
+                header = self.session.deserialize(frames, content=False, copy=False)[
+                    "header"
+                ]
+            except Exception:
+                header = {}
+            msg_type = header.get("msg_type")
+            if msg_type == "complete_request" and self.supersede_completions:
+                self._completion_requests[header.get("session", "")] = header.get(
+                    "msg_id", ""
+                )
+            if concurrent and msg_type in self.concurrent_requests:
+                shell_parent = self.get_parent("shell")  # type:ignore[no-untyped-call]
+                shell_ident = self._get_shell_context_var(self._shell_parent_ident)
+                try:
+                    # The task runs in a copy of the context, with its own parent
+                    await asyncio.create_task(
+                        self.dispatch_shell(msg, subshell_id=None, concurrent=True)
+                    )
+                finally:
+                    self.set_parent(shell_ident, shell_parent, channel="shell")  # type:ignore[no-untyped-call]
+                return
+        await super().shell_main(subshell_id, msg)
+
+    async def complete_request(self, stream: Any, ident: Any, parent: Any) -> None:
+        """Handle a completion request, unless a newer one has come in."""
+        header = parent["header"]
+        key = header.get("session", "")
+        if self.session is not None and await self._completion_superseded(
+            key, header.get("msg_id", "")
+        ):
+            content = parent["content"]
+            cursor_pos = content.get("cursor_pos")
+            if cursor_pos is None:
+                cursor_pos = len(content.get("code", ""))
+            reply = {
+                "matches": [],
+                "cursor_start": cursor_pos,
+                "cursor_end": cursor_pos,
+                "status": "ok",
+                "metadata": {},
+            }
+            self.session.send(stream, "complete_reply", reply, parent, ident)
+            return
+        try:
+            await super().complete_request(stream, ident, parent)  # type:ignore[no-untyped-call]
+        finally:
+            if self._completion_requests.get(key) == header.get("msg_id", ""):
+                del self._completion_requests[key]
+
+    async def _completion_superseded(self, key: str, msg_id: str) -> bool:
+        """Whether a newer completion request of client *key* is waiting."""
+        if not self.supersede_completions or key not in self._completion_requests:
+            return False
+        # Messages that arrived while the event loop was busy (e.g. with the
+        # last completion) are received one per iteration; let those that
+        # are already here be noted before comparing.
+        for _ in range(self._completion_yields):
+            await asyncio.sleep(0)
+        return self._completion_requests.get(key, msg_id) != msg_id
+
+    @property
+    def history_store(self) -> HistoryStore | None:
+        """The database of ``hist_file``, or None without one."""
+        if not self.hist_file:
+            return None
+        if self._history_store is None or self._history_store.path != self.hist_file:
+            self._history_store = HistoryStore(self.hist_file)
+        return self._history_store
+
+    def store_history(self, code: str) -> None:
+        """Add *code* to the history, as the current execution count."""
+        store = self.history_store
+        if store is None:
+            return
+        try:
+            store.store(self.execution_count, code)
+        except Exception as e:
+            self.log.warning("Cannot store history in %s: %s", self.hist_file, e)
+
     async def do_history(
         self,
         hist_access_type: str | None,
-        output: str | None,
+        output: bool | None,
         raw: bool | None,
         session: Any = None,
         start: int | None = None,
@@ -558,28 +1208,49 @@ class MetaKernel(Kernel):
         unique: bool = False,
     ) -> dict[str, str | list[Any]]:
         """
-        Access history at startup.
+        Access history, e.g. at startup.
+
+        Handles "tail", "range" and "search" requests. Outputs aren't
+        stored, so with `output` an entry's output is None.
 
         https://jupyter-client.readthedocs.io/en/stable/messaging.html#history
         """
-        with open(self.hist_file) as fid:  # noqa: ASYNC230 -- small file, infrequent call
-            self.hist_cache = json.loads(fid.read() or "[]")
-        return {"status": "ok", "history": [(None, None, h) for h in self.hist_cache]}
+        store = self.history_store
+        if store is None:
+            return {"status": "ok", "history": []}
+        try:
+            if hist_access_type == "range":
+                rows = store.range(session or 0, start or 0, stop)
+            elif hist_access_type == "search":
+                rows = store.search(pattern or "*", n, unique)
+            else:
+                rows = store.tail(n or self.max_hist_cache, unique)
+        except Exception as e:
+            self.log.warning("Cannot read history from %s: %s", self.hist_file, e)
+            rows = []
+        history: list[Any] = list(rows)
+        if output:
+            history = [(s, line, (source, None)) for s, line, source in rows]
+        return {"status": "ok", "history": history}
 
     async def do_shutdown(self, restart: bool) -> dict[str, Any]:
         """
-        Shut down the app gracefully, saving history.
+        Shut down the app gracefully.
 
         https://jupyter-client.readthedocs.io/en/stable/messaging.html#kernel-shutdown
         """
-        if self.hist_file:
-            with open(self.hist_file, "w") as fid:  # noqa: ASYNC230 -- small file, infrequent call
-                json.dump(self.hist_cache[-self.max_hist_cache :], fid)
         if restart:
             self.Print("Restarting kernel...")
-            self.restart_kernel()
-            self.reload_magics()
+            self.restart_session()
             self.Print("Done!")
+        else:
+            self.stop_magic_watcher()
+            for executor in (self._executor, self._completion_executor):
+                if executor is not None:
+                    executor.shutdown(wait=False)
+            self._executor = self._completion_executor = None
+            if self._history_store is not None:
+                self._history_store.close()
         return {"status": "ok", "restart": restart}
 
     async def do_is_complete(self, code: str) -> dict[str, str]:
@@ -619,7 +1290,11 @@ class MetaKernel(Kernel):
 
         https://jupyter-client.readthedocs.io/en/stable/messaging.html#completion
         """
-        info = self.parse_code(code, 0, cursor_pos)
+        cached = self._narrow_completions(code, cursor_pos)
+        if cached is not None:
+            return cached
+        info = top = self.parse_code(code, 0, cursor_pos)
+        busy = False
         content = {
             "matches": [],
             "cursor_start": info["start"],
@@ -635,7 +1310,7 @@ class MetaKernel(Kernel):
         if not info["obj"] and info["path_matches"]:
             content["cursor_start"] = content["cursor_end"]
 
-        matches = info["path_matches"]
+        matches = list(info["path_matches"])
 
         if info["magic"]:
             # if the last line contains another magic, use that
@@ -648,15 +1323,23 @@ class MetaKernel(Kernel):
             else:
                 magics = self.cell_magics
 
-            if info["magic"]["name"] in magics:
-                magic = magics[info["magic"]["name"]]
-                info = info["magic"]
-                if info["type"] == "cell" and info["code"]:
-                    info = self.parse_code(info["code"])
+            magic = magics.get(info["magic"]["name"])
+            if magic is not None:
+                # The cell block is parsed in place, without copying it
+                minfo = info["magic"]
+                code_info = minfo.parse_code() if minfo["type"] == "cell" else None
+                if code_info is not None:
+                    info = code_info
                 else:
-                    info = self.parse_code(info["args"])
+                    info = self.parse_code(minfo["args"])
 
-                matches.extend(magic.get_completions(info))
+                # Magics such as %shell complete with the process that
+                # their cells use
+                completions = await self._complete_in_time(
+                    magic.get_completions, info, locked=True
+                )
+                busy = completions is None
+                matches.extend(completions or [])
 
             elif not info["magic"]["code"] and not info["magic"]["args"]:
                 matches = []
@@ -669,7 +1352,11 @@ class MetaKernel(Kernel):
                         info["obj"] = pre + info["obj"]
 
         else:
-            matches.extend(self.get_completions(info))
+            completions = await self._complete_in_time(
+                self.query_backend, self.get_completions, info
+            )
+            busy = completions is None
+            matches.extend(completions or [])
 
         if info["full_obj"] and len(info["full_obj"]) > len(info["obj"]):
             new_list = [m for m in matches if m.startswith(info["full_obj"])]
@@ -688,8 +1375,103 @@ class MetaKernel(Kernel):
 
         content["matches"] = sorted(matches)
 
+        obj, end = top["obj"], top["end"]
+        if (
+            self.cache_completions
+            and obj
+            and not busy
+            and not top["path_matches"]
+            and content["cursor_start"] == end - len(obj)
+            and content["cursor_end"] == end
+            and all(match.startswith(obj) for match in content["matches"])
+        ):
+            self._completion_cache = (
+                self._completion_state(),
+                code[: end - len(obj)],
+                obj,
+                code[end:],
+                content,
+            )
+        return content
+
+    async def _complete_in_time(
+        self, func: Callable[..., Any], *args: Any, locked: bool = False
+    ) -> list[str] | None:
+        """Call the completion hook *func*, within ``completion_timeout``.
+
+        Returns None if it took longer; it then goes on in the worker thread,
+        and its result is dropped. With *locked*, the worker holds the lock
+        that magic cells take while it calls *func*, so that they wait for it.
+        """
+        if self.completion_timeout <= 0:
+            return func(*args)  # type:ignore[no-any-return]
+        if locked:
+            func = functools.partial(self._call_locked, func)
+        if self._completion_executor is None:
+            self._completion_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="metakernel-complete"
+            )
+        context = contextvars.copy_context()
+        future = asyncio.get_running_loop().run_in_executor(
+            self._completion_executor, functools.partial(context.run, func, *args)
+        )
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(future), self.completion_timeout
+            )
+        except TimeoutError:
+            self.log.debug("Completion took over %ss", self.completion_timeout)
+            # Don't leave an exception unretrieved
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            return None
+
+    def _call_locked(self, func: Callable[..., Any], *args: Any) -> Any:
+        with self._magic_lock:
+            return func(*args)
+
+    def _narrow_completions(self, code: str, cursor_pos: int) -> dict[str, Any] | None:
+        """Answer a completion from the last one if only more of the name was typed.
+
+        Returns None if the completions have to be computed.
+        """
+        if self._completion_cache is None:
+            return None
+        state, pre, obj, post, content = self._completion_cache
+        start = len(pre)
+        if (
+            state != self._completion_state()
+            or cursor_pos != len(code) - len(post)
+            or cursor_pos < start + len(obj)
+            or not code.startswith(pre)
+            or not code.startswith(obj, start)
+            or not code.endswith(post)
+            or not _WORD_CHARS.match(code, start + len(obj), cursor_pos)
+        ):
+            return None
+        name = code[start:cursor_pos]
+        content = {
+            "matches": [m for m in content["matches"] if m.startswith(name)],
+            "cursor_start": start,
+            "cursor_end": cursor_pos,
+            "status": "ok",
+            "metadata": {},
+        }
+        self._completion_cache = (state, pre, name, post, content)
         return content
 
+    def _completion_state(self) -> tuple[Any, ...]:
+        """What completions depend on besides the code.
+
+        That is the namespace (through the execution count), the working
+        directory and the magics.
+        """
+        return (
+            self.execution_count,
+            os.getcwd(),
+            self.line_magics.generation,
+            self.cell_magics.generation,
+        )
+
     async def do_inspect(
         self, code: str, cursor_pos: int, detail_level: int = 0, omit_sections: Any = ()
     ) -> dict[str, Any] | None:
@@ -700,6 +1482,12 @@ class MetaKernel(Kernel):
         if cursor_pos > len(code):
             return None
 
+        key = (code, cursor_pos, detail_level)
+        cached = self._inspect_cache.get(key)
+        if cached is not None:
+            self._inspect_cache.move_to_end(key)
+            return cached
+
         content = {"status": "aborted", "data": {}, "found": False, "metadata": {}}
         docstring = self.get_help_on(
             code, detail_level, none_on_fail=True, cursor_pos=cursor_pos
@@ -714,6 +1502,11 @@ class MetaKernel(Kernel):
             else:
                 content["data"] = {"text/plain": docstring}
                 self.log.debug(docstring)
+            # Not found may mean that the backend was busy; ask again then
+            if self.inspect_cache_size > 0:
+                self._inspect_cache[key] = content
+                while len(self._inspect_cache) > self.inspect_cache_size:
+                    self._inspect_cache.popitem(last=False)
 
         return content
 
@@ -722,7 +1515,10 @@ class MetaKernel(Kernel):
         self.send_response(self.iopub_socket, "clear_output", {"wait": wait})
 
     def DisplayData(
-        self, data: dict[str, Any], metadata: dict[str, Any] | None = None
+        self,
+        data: dict[str, Any],
+        metadata: dict[str, Any] | None = None,
+        buffers: list[Any] | None = None,
     ) -> None:
         """Display a raw MIME bundle directly without going through IPython's formatter.
 
@@ -734,6 +1530,9 @@ class MetaKernel(Kernel):
             data: A dict mapping MIME types to content.
                   Example: ``{'text/html': '<b>hello</b>', 'text/plain': 'hello'}``
             metadata: Optional dict of per-MIME-type metadata.
+            buffers: Optional list of bytes-like objects, sent as binary
+                  frames of the message without copying or base64 encoding.
+                  See :func:`metakernel.display.binary_display_data`.
 
         Example::
 
@@ -744,7 +1543,12 @@ class MetaKernel(Kernel):
         """
         self.log.debug("DisplayData: %s", list(data.keys()))
         content = {"data": data, "metadata": metadata or {}}
-        self.send_response(self.iopub_socket, "display_data", content)
+        if buffers:
+            self.send_response(
+                self.iopub_socket, "display_data", content, buffers=buffers
+            )
+        else:
+            self.send_response(self.iopub_socket, "display_data", content)
 
     def Display(self, *objects: Any, **kwargs: Any) -> None:
         """Display one or more objects using rich display.
@@ -753,7 +1557,7 @@ class MetaKernel(Kernel):
 
         If an object is a dict whose keys are all MIME types (strings containing ``/``),
         it is treated as a raw MIME bundle and sent directly — equivalent to calling
-        :meth:`DisplayData`.
+        :meth:`DisplayData`, with the `buffers` keyword argument, if given.
 
         See https://ipython.readthedocs.io/en/stable/config/integrating.html?highlight=display#rich-display
         """
@@ -761,7 +1565,7 @@ class MetaKernel(Kernel):
             self.send_response(self.iopub_socket, "clear_output", {"wait": True})
 
         for item in objects:
-            if Widget and isinstance(item, Widget):
+            if _is_widget(item):
                 self.log.debug("Display Widget")
                 data = {
                     "text/plain": repr(item),
@@ -775,15 +1579,15 @@ class MetaKernel(Kernel):
                 self.send_response(self.iopub_socket, "display_data", content)
             elif _is_mime_bundle(item):
                 self.log.debug("Display raw MIME bundle")
-                self.DisplayData(item)
+                self.DisplayData(item, buffers=kwargs.get("buffers"))
             else:
                 self.log.debug("Display Data")
                 try:
-                    data = self._display_formatter.format(item)  # type:ignore[no-untyped-call]
+                    bundle, metadata = self._format(item)
                 except Exception as e:
                     self.Error(e)
                     return
-                content = {"data": data[0], "metadata": data[1]}
+                content = {"data": bundle, "metadata": metadata}
                 self.send_response(self.iopub_socket, "display_data", content)
 
     def Print(self, *objects: Any, **kwargs: Any) -> None:
@@ -792,27 +1596,25 @@ class MetaKernel(Kernel):
         Items can be strings or `Widget` instances.
         """
         for item in objects:
-            if Widget and isinstance(item, Widget):
+            if _is_widget(item):
                 self.Display(item)
 
-        non_widgets = [i for i in objects if not (Widget and isinstance(i, Widget))]
+        non_widgets = [i for i in objects if not _is_widget(i)]
         message = format_message(*non_widgets, **kwargs)
 
-        stream_content = {"name": "stdout", "text": message}
         self.log.debug(f"Print: {message.rstrip()}")
         if self.redirect_to_log:
             self.log.info(message.rstrip())
         else:
-            self.send_response(self.iopub_socket, "stream", stream_content)
+            self._stream_buffer.write("stdout", message)
 
     def Write(self, message: str) -> None:
         """Write message directly to the iopub stdout with no added end character."""
-        stream_content = {"name": "stdout", "text": message}
         self.log.debug(f"Write: {message}")
         if self.redirect_to_log:
             self.log.info(message)
         else:
-            self.send_response(self.iopub_socket, "stream", stream_content)
+            self._stream_buffer.write("stdout", message)
 
     def Error(self, *objects: Any, **kwargs: Any) -> None:
         """Print `objects` to stdout, separated by `sep` and followed by `end`.
@@ -821,11 +1623,10 @@ class MetaKernel(Kernel):
         """
         message = format_message(*objects, **kwargs)
         self.log.debug(f"Error: {message.rstrip()}")
-        stream_content = {"name": "stderr", "text": RED + message + NORMAL}
         if self.redirect_to_log:
             self.log.info(message.rstrip())
         else:
-            self.send_response(self.iopub_socket, "stream", stream_content)
+            self._stream_buffer.write("stderr", RED + message + NORMAL)
 
     def Error_display(self, *objects: Any, **kwargs: Any) -> None:
         """Print `objects` to stdout is they area strings, separated by `sep` and followed by `end`.
@@ -852,11 +1653,10 @@ class MetaKernel(Kernel):
         if len(msg_dict.keys()) > 0:
             message = format_message(" ".join(msg), msg_dict)
         self.log.debug(f"Error: {message.rstrip()}")
-        stream_content = {"name": "stderr", "text": RED + message + NORMAL}
         if self.redirect_to_log:
             self.log.info(message.rstrip())
         else:
-            self.send_response(self.iopub_socket, "stream", stream_content)
+            self._stream_buffer.write("stderr", RED + message + NORMAL)
 
     def schedule_display_output(self, callback: Callable[[], None]) -> None:
         """Schedule a display output callback to run on the kernel's main IO loop.
@@ -893,11 +1693,23 @@ class MetaKernel(Kernel):
     ##############################
     # Private API and methods not likely to be overridden
 
-    def reload_magics(self) -> None:
-        """Reload all of the line and cell magics."""
-        self.line_magics: dict[str, Any] = {}
-        self.cell_magics: dict[str, Any] = {}
+    def reload_magics(self, reset: bool = False) -> None:
+        """Reload the line and cell magics.
+
+        Magic modules are not imported here. Their magic names are read from
+        the source, and each module is imported the first time one of its
+        magics is looked up (see :class:`metakernel.registry.MagicDict`).
+
+        Modules that were already imported and whose source hasn't changed
+        keep their Magic instances, and with them any state. Pass
+        ``reset=True`` to instantiate every magic again.
+        """
+        loaded = {} if reset else getattr(self, "_magic_modules", {})
+        self._magic_modules: dict[str, dict[str, Any]] = {}
+        self.line_magics: MagicDict = MagicDict("line", self._load_magic_module)
+        self.cell_magics: MagicDict = MagicDict("cell", self._load_magic_module)
         self.magic_load_errors = []
+        self.magic_load_times = {}
 
         # get base magic files and those relative to the current class
         # directory
@@ -920,20 +1732,167 @@ class MetaKernel(Kernel):
         ]
         self.magic_search_paths = list(paths)
         for magic_dir in paths:
-            sys.path.append(magic_dir)
+            if magic_dir not in sys.path:
+                sys.path.append(magic_dir)
             magic_files.extend(glob.glob(os.path.join(magic_dir, "*.py")))
 
+        index = MagicIndex(get_magics_index_file())
+        seen = set()
         for magic in magic_files:
             basename = os.path.basename(magic)
             if basename == "__init__.py":
                 continue
-            try:
-                module = __import__(os.path.splitext(basename)[0])
-                importlib.reload(module)
-                module.register_magics(self)
-            except Exception as e:
-                self.log.error(f"Can't load '{magic}': error: {e}")
-                self.magic_load_errors.append((magic, str(e)))
+            module = os.path.splitext(basename)[0]
+            # Several directories may hold a module of the same name;
+            # only the one found first on sys.path is ever imported.
+            if module in seen:
+                continue
+            seen.add(module)
+            path = find_magic_module(module) or magic
+            started = time.perf_counter()
+            self._reload_magic_module(module, path, index, loaded)
+            self.magic_load_times[module] = time.perf_counter() - started
+        index.save(paths)
+
+    def _reload_magic_module(
+        self,
+        module: str,
+        path: str,
+        index: MagicIndex,
+        loaded: dict[str, dict[str, Any]],
+    ) -> None:
+        """Register the magics of one module found by :meth:`reload_magics`."""
+        digest = index.get_digest(path)
+        previous = loaded.get(module)
+        if (
+            previous is not None
+            and previous["path"] == path
+            and previous["digest"] == digest
+        ):
+            # Unchanged since it was imported: keep the instances
+            self._magic_modules[module] = previous
+            for mtype, magics in (
+                ("line", self.line_magics),
+                ("cell", self.cell_magics),
+            ):
+                magics.update(previous["magics"][mtype])
+            return
+        manifest = index.get_manifest(module, path)
+        if manifest is None:
+            self._import_magic_module(module, path, digest)
+            return
+        for mtype, magics in (
+            ("line", self.line_magics),
+            ("cell", self.cell_magics),
+        ):
+            for name in manifest.magics[mtype]:
+                magics[name] = manifest
+
+    def start_magic_watcher(self, interval: float | None = None) -> None:
+        """Reload magics automatically when files in the search paths change.
+
+        The magic search paths are polled every *interval* seconds
+        (default: ``magic_watch_interval``, or 2 seconds), and the reload
+        runs on the kernel's IO loop.
+        """
+        self.stop_magic_watcher()
+        self.magic_watcher = MagicWatcher(
+            self.magic_search_paths,
+            lambda: self.schedule_display_output(self.reload_magics),
+            interval or self.magic_watch_interval or 2.0,
+        )
+        self.magic_watcher.start()
+
+    def stop_magic_watcher(self) -> None:
+        """Stop watching the magic search paths."""
+        if getattr(self, "magic_watcher", None) is not None:
+            self.magic_watcher.stop()  # type:ignore[union-attr]
+            self.magic_watcher = None
+
+    def _load_magic_module(self, manifest: MagicManifest) -> None:
+        """Import the magic module behind a placeholder and register it."""
+        self._import_magic_module(
+            manifest.module, manifest.path, manifest.digest, manifest
+        )
+
+    def _import_magic_module(
+        self,
+        module_name: str,
+        path: str,
+        digest: str | None,
+        manifest: MagicManifest | None = None,
+    ) -> None:
+        """Import (or reload) a magic module and call its register_magics.
+
+        When loading the module behind a *manifest* placeholder, only the
+        names that still point at the placeholder are updated, so a magic
+        registered by a module later in the search order keeps precedence,
+        just as when every module was imported up front.
+        """
+        magic_dicts = (self.line_magics, self.cell_magics)
+        before = [dict.copy(magics) for magics in magic_dicts]
+        loaded = False
+        try:
+            module = sys.modules.get(module_name)
+            if (
+                module is not None
+                and digest is not None
+                and _magic_module_sources.get(module_name) == (path, digest)
+            ):
+                # Already imported from this very source, by another kernel
+                # in this process or by a fork server before forking
+                pass
+            elif module is not None:
+                module = importlib.reload(module)
+            else:
+                module = importlib.import_module(module_name)
+            _magic_module_sources[module_name] = (path, digest)
+            module.register_magics(self)
+            loaded = True
+        except Exception as e:
+            self.log.error(f"Can't load '{path}': error: {e}")
+            self.magic_load_errors.append((path, str(e)))
+
+        registered: dict[str, dict[str, Any]] = {}
+        for mtype, magics, previous in zip(
+            ("line", "cell"), magic_dicts, before, strict=True
+        ):
+            registered[mtype] = {}
+            for name, value in list(dict.items(magics)):
+                old = previous.get(name, manifest)
+                if manifest is not None and old is not manifest:
+                    dict.__setitem__(magics, name, old)
+                elif value is manifest:
+                    # The module failed to load or didn't register this name
+                    dict.__delitem__(magics, name)
+                elif value is not previous.get(name):
+                    registered[mtype][name] = value
+        if loaded:
+            self._magic_modules[module_name] = {
+                "path": path,
+                "digest": digest,
+                "magics": registered,
+            }
+
+    def reset_magics(self) -> None:
+        """Instantiate again the magics whose class sets ``reset_on_restart``.
+
+        All other magics keep their instances and state, and magics that
+        were never used stay unloaded.
+        """
+        replaced: dict[int, Magic] = {}
+        for magics in (self.line_magics, self.cell_magics):
+            for name, magic in list(dict.items(magics)):
+                if getattr(magic, "reset_on_restart", False):
+                    if id(magic) not in replaced:
+                        replaced[id(magic)] = type(magic)(self)
+                    dict.__setitem__(magics, name, replaced[id(magic)])
+        # Keep the instances known to reload_magics() up to date
+        for record in self._magic_modules.values():
+            for registered in record["magics"].values():
+                for name, magic in registered.items():
+                    if id(magic) in replaced:
+                        registered[name] = replaced[id(magic)]
 
     def register_magics(self, magic_klass: type[Magic]) -> None:
         """Register magics for a given magic_klass."""
@@ -948,9 +1907,31 @@ class MetaKernel(Kernel):
     def send_response(self, *args: Any, **kwargs: Any) -> None:
         ### if we are running via %parallel, we might not have a
         ### session
-        if self.session:
+        if not self.session:
+            return
+        msg_type = args[1] if len(args) > 1 else kwargs.get("msg_or_type")
+        if msg_type != "stream":
+            # Keep buffered text ahead of the output that follows it
+            self._stream_buffer.flush()
+        loop = self._executor_loop
+        if loop is not None and threading.get_ident() != self._executor_loop_thread:
+            # Sockets belong to the event loop; calls are queued in order, and
+            # ahead of the end of the cell
+            send = functools.partial(super().send_response, *args, **kwargs)
+            loop.call_soon_threadsafe(send, context=contextvars.copy_context())
+        else:
             super().send_response(*args, **kwargs)  # type:ignore[no-untyped-call]
 
+    def _send_stream(self, name: str, text: str) -> None:
+        self.send_response(self.iopub_socket, "stream", {"name": name, "text": text})
+
+    def _call_later(self, delay: float, callback: Callable[[], None]) -> None:
+        """Call *callback* after *delay* seconds on the IO loop, from any thread."""
+        io_loop = getattr(self, "io_loop", None)
+        if io_loop is not None:
+            # Only add_callback may be called from other threads
+            io_loop.add_callback(io_loop.call_later, delay, callback)
+
     def call_magic(self, line: str) -> Magic:
         """
         Given an line, such as "%download http://example.com/", parse
@@ -962,14 +1943,14 @@ class MetaKernel(Kernel):
         ## FIXME: Bad name, use call_magic instead.
         # if first line matches a magic,
         # call magic.call_magic() and return magic object
-        info = self.parse_code(text)
+        info = self.parse_magic(text)
         magic = self.line_magics["magic"]
         return magic.get_magic(info)  # type:ignore[no-any-return]
 
     def get_magic_args(self, text: str) -> Magic:
         # if first line matches a magic,
         # call magic.call_magic() and return magic args
-        info = self.parse_code(text)
+        info = self.parse_magic(text)
         magic = self.line_magics["magic"]
         return magic.get_magic(info, get_args=True)  # type:ignore[no-any-return]
 
@@ -986,10 +1967,14 @@ class MetaKernel(Kernel):
 
     def parse_code(
         self, code: str, cursor_start: int = 0, cursor_end: int = -1
-    ) -> dict[str, Any]:
+    ) -> ParseInfo:
         """Parse code using our parser."""
         return self.parser.parse_code(code, cursor_start, cursor_end)
 
+    def parse_magic(self, code: str) -> dict[str, Any]:
+        """Parse code for execution: find its magics, nothing else."""
+        return self.parser.parse_magic(code)
+
     def _get_sticky_magics(self) -> str:
         retval = ""
         for key in self.sticky_magics:
@@ -1008,6 +1993,30 @@ class MetaKernelApp(IPKernelApp):
 
     config_dir = Unicode()
 
+    flags = Dict(
+        {
+            **kernel_flags,
+            "profile-startup": (
+                {"MetaKernelApp": {"profile_startup": True}},
+                "Print how long creating the kernel took as JSON to stderr.",
+            ),
+        }
+    )
+    profile_startup: bool = Bool(  # type: ignore[assignment]
+        False,
+        help="""Write a JSON line to stderr with the time spent creating the
+        kernel, broken down by phase and by magic module.""",
+    ).tag(config=True)
+
+    def init_kernel(self) -> None:
+        started = time.perf_counter()
+        super().init_kernel()  # type:ignore[no-untyped-call]
+        if self.profile_startup:
+            profile = {"init_kernel": time.perf_counter() - started}
+            if isinstance(self.kernel, MetaKernel):
+                profile.update(self.kernel.get_startup_profile())
+            print(json.dumps(profile), file=sys.__stderr__, flush=True)
+
     def _config_dir_default(self) -> str:
         return jupyter_config_dir()
 
@@ -1032,6 +2041,7 @@ class MetaKernelApp(IPKernelApp):
         class KernelInstallerApp(Application):
             kernel_class = self.kernel_class
             display_name: str | None = None
+            fork_server = False
 
             def initialize(self, argv: Any = None) -> None:
                 filtered: list[str] = []
@@ -1043,6 +2053,8 @@ class MetaKernelApp(IPKernelApp):
                     elif args[i] == "--display-name" and i + 1 < len(args):
                         self.display_name = args[i + 1]
                         i += 1
+                    elif args[i] == "--fork-server":
+                        self.fork_server = True
                     else:
                         filtered.append(args[i])
                     i += 1
@@ -1053,6 +2065,11 @@ class MetaKernelApp(IPKernelApp):
                 kernel_spec = instance.kernel_json
                 if self.display_name is not None:
                     kernel_spec["display_name"] = self.display_name
+                if self.fork_server:
+                    kernel_spec = dict(kernel_spec)
+                    kernel_spec["argv"] = launcher_argv(
+                        kernel_spec["argv"], kernel_name(self.kernel_class)
+                    )
                 with TemporaryDirectory() as td:
                     dirname = os.path.join(td, kernel_spec["name"])
                     os.mkdir(dirname)
@@ -1084,29 +2101,57 @@ class MetaKernelApp(IPKernelApp):
                     except CalledProcessError as exc:
                         sys.exit(exc.returncode)
 
-        return {"install": (KernelInstallerApp, "Install this kernel")}
-
-
-def _split_magics_code(code: str, prefixes: dict[str, Any]) -> tuple[str, str]:
-    lines = code.split("\n")
-    ret_magics = []
-    ret_code = []
-    index = 0
-    shell = prefixes["shell"]
-    magic = prefixes["magic"]
-    while index < len(lines) and lines[index].startswith((shell, magic)):
-        ret_magics.append(lines[index])
-        index += 1
-    while index < len(lines):
-        ret_code.append(lines[index])
-        index += 1
-    ret_magics_str = "\n".join(ret_magics)
-    if ret_magics_str:
-        ret_magics_str += "\n"
-    ret_code_str = "\n".join(ret_code)
-    if ret_code_str:
-        ret_code_str += "\n"
-    return (ret_magics_str, ret_code_str)
+        class KernelForkServerApp(Application):
+            description = """Prepare a process for starting kernels of this
+            class and fork it whenever such a kernel is started through
+            `python -m metakernel.forkserver`."""
+            kernel_class = self.kernel_class
+            socket = Unicode(
+                "",
+                help="""Path of the Unix socket to listen on. Defaults to a
+                file in the Jupyter runtime directory named after the kernel
+                class.""",
+            ).tag(config=True)
+            aliases = {"socket": "KernelForkServerApp.socket"}
+
+            def _log_level_default(self) -> int:
+                return logging.INFO
+
+            def start(self) -> None:
+                server = ForkServer(self.kernel_class, self.socket or None, self.log)
+                server.bind()
+                self.log.info(f"Preparing {self.kernel_class.__name__} kernels...")
+                server.prepare()
+                self.log.info(f"Fork server listening on {server.socket_path}")
+
+                def stop(signum: int, frame: Any) -> None:
+                    raise SystemExit(0)
+
+                signal.signal(signal.SIGTERM, stop)
+                try:
+                    server.serve_forever()
+                except KeyboardInterrupt:
+                    pass
+
+        return {
+            "install": (KernelInstallerApp, "Install this kernel"),
+            "fork-server": (
+                KernelForkServerApp,
+                "Start a fork server that starts kernels of this class fast",
+            ),
+        }
+
+
+def _magic_header_end(code: str, prefixes: dict[str, Any]) -> int:
+    """Return the index where the magic lines at the top of *code* end."""
+    starts = (prefixes["shell"], prefixes["magic"])
+    pos = 0
+    while pos < len(code) and code.startswith(starts, pos):
+        newline = code.find("\n", pos)
+        if newline == -1:
+            return len(code)
+        pos = newline + 1
+    return pos
 
 
 def format_message(*objects: Any, **kwargs: Any) -> str:
@@ -1133,8 +2178,9 @@ class IPythonKernel(MetaKernel):
     def __init__(self) -> None:
         from metakernel.magics.magic_magic import MagicMagic
 
-        self.line_magics: dict[str, Magic] = {"magic": MagicMagic(self)}
-        self.cell_magics = {}
+        self.line_magics = MagicDict("line", self._load_magic_module)
+        self.line_magics["magic"] = MagicMagic(self)
+        self.cell_magics = MagicDict("cell", self._load_magic_module)
         self.parser = Parser(
             self.identifier_regex,
             self.func_call_regex,
@@ -1173,15 +2219,21 @@ def register_ipython_magics(*magics: str) -> None:
 
     magic_files = []
     for magic_dir in paths:
-        sys.path.append(magic_dir)
+        if magic_dir not in sys.path:
+            sys.path.append(magic_dir)
         magic_files.extend(glob.glob(os.path.join(magic_dir, "*.py")))
 
+    index = MagicIndex(get_magics_index_file())
     for magic in magic_files:
         basename = os.path.basename(magic)
         if basename == "__init__.py":
             continue
         if len(magic_filenames) == 0 or basename in magic_filenames:
+            # Skip importing modules that have no IPython magics to register
+            if not index.has_ipython_magics(magic):
+                continue
             module = __import__(os.path.splitext(basename)[0])
             importlib.reload(module)
             if hasattr(module, "register_ipython_magics"):
                 module.register_ipython_magics()
+    index.save(paths)
@@ -0,0 +1,351 @@
+"""Benchmark how long it takes to start MetaKernel-based kernels.
+
+Each measurement runs in a fresh Python process, so module imports are
+timed from a cold start just like when Jupyter launches a kernel::
+
+    python -m metakernel.benchmark
+    python -m metakernel.benchmark my_kernel:MyKernel --repeat 10 --budget 1.5
+    python -m metakernel.benchmark metakernel_echo:MetaKernelEcho --completion
+
+The result is printed as JSON. With ``--budget``, the exit status is 1 if
+the median startup time of any kernel is over the budget (in seconds), or
+if ``from metakernel import MetaKernel`` is over :data:`IMPORT_BUDGET` or
+imports one of :data:`HEAVY_MODULES`, so the benchmark can guard against
+startup regressions in CI.
+
+With ``--completion``, the report also has the median time each kernel
+takes to answer a completion request in the cells of
+:func:`completion_corpus`, from :data:`COMPLETION_SIZES` characters up,
+which should not grow with the size of the cell.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Any
+
+DEFAULT_KERNELS = [
+    "metakernel_echo:MetaKernelEcho",
+    "metakernel_python:MetaKernelPython",
+]
+
+#: Seconds that ``from metakernel import MetaKernel`` may take on top of importing
+#: ipykernel, which every kernel needs anyway.
+IMPORT_BUDGET = 0.5
+
+#: Modules that ``from metakernel import MetaKernel`` must not import; they are only
+#: imported once a feature that needs them is used.
+HEAVY_MODULES = [
+    "ipyparallel",
+    "ipywidgets",
+    "jedi",
+    "matplotlib",
+    "numpy",
+    "parso",
+    "pydot",
+]
+
+#: Sizes (in characters) of the cells that completion is timed in.
+COMPLETION_SIZES = [1_000, 100_000, 1_000_000]
+
+_CORPUS_LINE = "result = compute(alpha, beta) + other_value  # comment\n"
+
+_MEASURE_IMPORT = """
+import json, sys, time
+
+import ipykernel.kernelapp
+import ipykernel.kernelbase
+
+started = time.perf_counter()
+from metakernel import MetaKernel
+seconds = time.perf_counter() - started
+heavy = [name for name in sys.argv[1:] if name in sys.modules]
+print(json.dumps({"seconds": seconds, "heavy_modules": heavy}))
+"""
+
+# Starts the scripts below: only a module that isn't there is skipped, an
+# ImportError inside of it is an error.
+_NOT_INSTALLED = """
+import importlib.util
+
+
+class NotInstalled(Exception):
+    pass
+
+
+def check_installed(module_name, module=None):
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except ModuleNotFoundError:
+        spec = None
+    # A directory of that name (a namespace package) isn't the kernel either
+    if spec is None or getattr(module, "__file__", "") is None:
+        raise NotInstalled(f"{module_name} is not installed")
+"""
+
+# Runs in the child process; kept free of metakernel imports so that
+# importing metakernel is part of what gets measured.
+_MEASURE = (
+    _NOT_INSTALLED
+    + """
+import importlib, json, sys, time
+
+module_name, class_name = sys.argv[1].split(":")
+result = {"imports": {}}
+try:
+    check_installed(module_name)
+    # metakernel itself is lazy; the kernel base class is in _metakernel
+    for name in ("metakernel", "metakernel._metakernel", module_name):
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        result["imports"][name] = time.perf_counter() - started
+    check_installed(module_name, module)
+    kernel_class = getattr(module, class_name)
+    started = time.perf_counter()
+    kernel = kernel_class()
+    result["construction"] = time.perf_counter() - started
+    profile = kernel.get_startup_profile()
+    result["phases"] = profile["phases"]
+    result["magic_modules"] = profile["magic_modules"]
+    result["total"] = sum(result["imports"].values()) + result["construction"]
+    result["heavy_modules"] = [name for name in sys.argv[2:] if name in sys.modules]
+except NotInstalled as e:
+    result = {"skipped": str(e)}
+except Exception as e:
+    result = {"error": f"{type(e).__name__}: {e}"}
+print(json.dumps(result))
+"""
+)
+
+_MEASURE_COMPLETION = (
+    _NOT_INSTALLED
+    + """
+import asyncio, importlib, json, statistics, sys, time
+
+from metakernel.benchmark import COMPLETION_SIZES, completion_corpus
+
+module_name, class_name = sys.argv[1].split(":")
+repeat = int(sys.argv[2])
+result = {}
+try:
+    check_installed(module_name)
+    module = importlib.import_module(module_name)
+    check_installed(module_name, module)
+    kernel = getattr(module, class_name)()
+    # Time the work done for each request, not the cache of the last one
+    kernel.cache_completions = False
+    loop = asyncio.new_event_loop()
+    for size in COMPLETION_SIZES:
+        for case, (code, cursor_pos) in completion_corpus(size).items():
+            times = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                loop.run_until_complete(kernel.do_complete(code, cursor_pos))
+                times.append(time.perf_counter() - started)
+            result.setdefault(case, {})[size] = statistics.median(times)
+except NotInstalled as e:
+    result = {"skipped": str(e)}
+except Exception as e:
+    result = {"error": f"{type(e).__name__}: {e}"}
+print(json.dumps(result))
+"""
+)
+
+
+def completion_corpus(size: int) -> dict[str, tuple[str, int]]:
+    """Cells of about *size* characters to complete in, as (code, cursor_pos).
+
+    ``"end"`` completes a name on the last line of the cell, ``"middle"``
+    a name on a line halfway through it, and ``"magic"`` the last line of
+    a ``%%time`` cell. The cells are the same on every call.
+    """
+    lines = max(size // len(_CORPUS_LINE), 1)
+    body = _CORPUS_LINE * lines
+    code = body + "x = res"
+    middle = lines // 2 * len(_CORPUS_LINE) + len("res")
+    magic = "%%time\n" + code
+    return {
+        "end": (code, len(code)),
+        "middle": (code, middle),
+        "magic": (magic, len(magic)),
+    }
+
+
+def measure_completion(kernel: str, repeat: int = 5) -> dict[str, Any]:
+    """Time completion requests to *kernel* in a new process.
+
+    *kernel* is given as ``"module:ClassName"``. Returns a dict with the
+    median seconds per :func:`completion_corpus` case and size, such as
+    ``result["end"][1000000]``, with ``skipped`` if the kernel's module
+    is not installed, or with an ``error`` if the kernel could not be
+    started.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-c", _MEASURE_COMPLETION, kernel, str(repeat)],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    try:
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return {"error": proc.stderr.strip() or f"exit status {proc.returncode}"}
+    if "error" in result or "skipped" in result:
+        return dict(result)
+    # JSON turned the sizes into strings
+    return {
+        case: {int(size): seconds for size, seconds in times.items()}
+        for case, times in result.items()
+    }
+
+
+def measure_startup(kernel: str) -> dict[str, Any]:
+    """Time importing and constructing *kernel* in a new process.
+
+    *kernel* is given as ``"module:ClassName"``. Returns a dict with the
+    seconds spent on ``imports`` (of ``metakernel``, of
+    ``metakernel._metakernel`` where the kernel base class is, and of the
+    kernel's module), ``construction``, ``phases`` of
+    ``MetaKernel.__init__``, ``magic_modules``, the ``total`` and the
+    :data:`HEAVY_MODULES` that were imported (as ``heavy_modules``). It
+    has ``skipped`` instead if the kernel's module is not installed, or
+    an ``error`` if the kernel could not be started.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-c", _MEASURE, kernel, *HEAVY_MODULES],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    try:
+        return dict(json.loads(proc.stdout.strip().splitlines()[-1]))
+    except (IndexError, ValueError):
+        return {"error": proc.stderr.strip() or f"exit status {proc.returncode}"}
+
+
+def measure_import() -> dict[str, Any]:
+    """Time ``from metakernel import MetaKernel`` in a new process.
+
+    ipykernel is imported first and not counted. Returns a dict with the
+    ``seconds`` it took and the ``heavy_modules`` it imported.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-c", _MEASURE_IMPORT, *HEAVY_MODULES],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return dict(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+
+def _median(runs: list[dict[str, Any]], key: str) -> dict[str, float]:
+    names = {name for run in runs for name in run[key]}
+    return {
+        name: statistics.median(run[key].get(name, 0.0) for run in runs)
+        for name in sorted(names)
+    }
+
+
+def benchmark(kernels: list[str], repeat: int = 5) -> list[dict[str, Any]]:
+    """Measure each kernel *repeat* times and summarize with the median."""
+    results = []
+    for kernel in kernels:
+        runs = []
+        for _ in range(repeat):
+            run = measure_startup(kernel)
+            if "error" in run or "skipped" in run:
+                results.append({"kernel": kernel, **run})
+                break
+            runs.append(run)
+        else:
+            results.append(
+                {
+                    "kernel": kernel,
+                    "repeat": repeat,
+                    "total": statistics.median(run["total"] for run in runs),
+                    "construction": statistics.median(
+                        run["construction"] for run in runs
+                    ),
+                    "imports": _median(runs, "imports"),
+                    "phases": _median(runs, "phases"),
+                    "magic_modules": _median(runs, "magic_modules"),
+                    "heavy_modules": runs[0]["heavy_modules"],
+                    "runs": [run["total"] for run in runs],
+                }
+            )
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m metakernel.benchmark", description=__doc__.split("\n")[0]
+    )
+    parser.add_argument(
+        "kernels",
+        nargs="*",
+        default=DEFAULT_KERNELS,
+        help="kernels to measure, as module:ClassName",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="number of runs per kernel"
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=None,
+        help="fail if a kernel's median startup time exceeds this many seconds",
+    )
+    parser.add_argument(
+        "--allow-skipped",
+        action="store_true",
+        help="with --budget, pass kernels whose module is not installed",
+    )
+    parser.add_argument(
+        "--completion",
+        action="store_true",
+        help="also time completion requests in cells of growing size",
+    )
+    args = parser.parse_args(argv)
+
+    imports = [measure_import() for _ in range(args.repeat)]
+    import_report = {
+        "seconds": statistics.median(run["seconds"] for run in imports),
+        "budget": IMPORT_BUDGET,
+        "heavy_modules": sorted(
+            {name for run in imports for name in run["heavy_modules"]}
+        ),
+    }
+    results = benchmark(args.kernels, args.repeat)
+    if args.completion:
+        for result in results:
+            if "total" in result:
+                result["completion"] = measure_completion(result["kernel"], args.repeat)
+    over_budget = []
+    if args.budget is not None:
+        if import_report["seconds"] > IMPORT_BUDGET or import_report["heavy_modules"]:
+            over_budget.append("metakernel")
+        for result in results:
+            if "total" in result:
+                over = result["total"] > args.budget
+            else:
+                # A kernel that could not be measured doesn't pass
+                over = "error" in result or not args.allow_skipped
+            if over:
+                over_budget.append(result["kernel"])
+    report = {
+        "python": sys.version.split()[0],
+        "budget": args.budget,
+        "over_budget": over_budget,
+        "import": import_report,
+        "kernels": results,
+    }
+    print(json.dumps(report, indent=2))
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,9 +5,10 @@ from IPython.paths import get_ipython_dir
 
 
 def get_history_file(kernel: Any) -> str:
-    """Gets the history file for the kernel.
+    """Gets the history database for the kernel.
 
-    Histories are stored in ~/.ipython/metakernel/history
+    Histories are stored in ~/.ipython/metakernel/history, one SQLite
+    database per kernel implementation.
     """
     base = get_ipython_dir()
     dname = os.path.join(base, "metakernel", "history")
@@ -18,10 +19,7 @@ def get_history_file(kernel: Any) -> str:
     else:
         fname = kernel.__class__.__name__
         fname = fname.replace("Magic", "").lower()
-    path = os.path.join(dname, fname + ".json")
-    with open(path, "a"):
-        pass
-    return path
+    return os.path.join(dname, fname + ".sqlite")
 
 
 def get_local_magics_dir() -> str:
@@ -34,3 +32,16 @@ def get_local_magics_dir() -> str:
     if not os.path.exists(dname):
         os.makedirs(dname)
     return dname
+
+
+def get_magics_index_file() -> str:
+    """Gets the path of the cached index of magic files.
+
+    The index is stored in ~/.ipython/metakernel/magics-index.json,
+    next to the local magics directory.
+    """
+    base = get_ipython_dir()
+    dname = os.path.join(base, "metakernel")
+    if not os.path.exists(dname):
+        os.makedirs(dname)
+    return os.path.join(dname, "magics-index.json")
@@ -1,3 +1,4 @@
+import struct
 from typing import Any
 
 from IPython.display import clear_output as ipclear_output
@@ -23,3 +24,52 @@ def clear_output(*args: Any, **kwargs: Any) -> None:
         kernel.send_response(kernel.iopub_socket, "clear_output", {"wait": wait})
     else:
         ipclear_output(*args, **kwargs)  # type:ignore[no-untyped-call]
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+#: MIME type of NumPy arrays sent with binary_display_data
+NDARRAY_MIMETYPE = "application/vnd.metakernel.ndarray+json"
+
+
+def binary_display_data(
+    obj: Any,
+) -> tuple[dict[str, Any], dict[str, Any], list[memoryview]]:
+    """Return ``(data, metadata, buffers)`` to display *obj* with a binary buffer.
+
+    *obj* is PNG data (bytes, or an object with ``_repr_png_``, such as
+    ``IPython.display.Image``) or a NumPy array. Its payload is sent as a
+    raw buffer instead of base64 in the JSON of the message; the MIME data
+    it belongs in is named by ``metadata["buffer_paths"]``, as ipywidgets
+    does for comm messages. A PNG belongs in ``data["image/png"]``, and an
+    array in ``data[NDARRAY_MIMETYPE]["buffer"]``, next to its ``dtype``
+    and ``shape``. Frontends that don't read buffers show the "text/plain"
+    summary::
+
+        kernel.DisplayData(*binary_display_data(array))
+    """
+    if hasattr(obj, "__array_interface__") and hasattr(obj, "dtype"):
+        if not obj.flags["C_CONTIGUOUS"]:
+            obj = obj.copy()
+        data = {
+            "text/plain": f"<array of {obj.dtype} with shape {tuple(obj.shape)}>",
+            NDARRAY_MIMETYPE: {"dtype": str(obj.dtype), "shape": list(obj.shape)},
+        }
+        paths = [[NDARRAY_MIMETYPE, "buffer"]]
+        return data, {"buffer_paths": paths}, [memoryview(obj).cast("B")]
+
+    if not isinstance(obj, (bytes, bytearray, memoryview)) and hasattr(
+        obj, "_repr_png_"
+    ):
+        obj = obj._repr_png_()
+        if isinstance(obj, tuple):
+            obj = obj[0]
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        png = memoryview(obj).cast("B")
+        if png[:8] == PNG_SIGNATURE:
+            text = "<PNG image>"
+            if len(png) >= 24:
+                width, height = struct.unpack(">II", png[16:24])
+                text = f"<PNG image, {width}x{height}>"
+            return {"text/plain": text}, {"buffer_paths": [["image/png"]]}, [png]
+    raise TypeError(f"Cannot send {type(obj).__name__} as a binary buffer")
@@ -0,0 +1,372 @@
+"""Start MetaKernel kernels by forking an already warmed-up process.
+
+A fork server imports a kernel class and does the work that every kernel
+of that class repeats when it starts (see :meth:`MetaKernel.prewarm`),
+then waits for requests on a Unix socket::
+
+    python -m my_kernel fork-server
+
+Kernels are then started with this module instead of the kernel module::
+
+    python -m metakernel.forkserver my_kernel:MyKernel -f {connection_file}
+
+which only imports the standard library and ``jupyter_core.paths`` (to find
+the server's socket, unless ``--socket`` is given), sends its command line
+to the server, and stays around as a stand-in for the kernel the server
+forks: it forwards signals to the kernel and exits with it, so Jupyter can
+interrupt, restart and shut down the kernel as usual. Starting a kernel
+costs little more than a fork, and all kernels share the pages of the
+imported modules until they write to them.
+
+Fork servers need ``os.fork`` and Unix sockets, so they are not available
+on Windows; there, and whenever no server is listening, the kernel is
+started normally.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import traceback
+from typing import Any
+
+FORWARDED_SIGNALS = ["SIGINT", "SIGTERM", "SIGHUP", "SIGQUIT", "SIGUSR1", "SIGUSR2"]
+
+
+def is_supported() -> bool:
+    """Whether fork servers can be used on this platform."""
+    return hasattr(os, "fork") and hasattr(socket, "send_fds")
+
+
+def default_socket_path(kernel: str) -> str:
+    """Return the socket of the fork server for *kernel* ("module:Class").
+
+    Sockets are stored in the Jupyter runtime directory, as found by
+    jupyter_core, so that servers and launchers agree on it.
+    """
+    from jupyter_core.paths import jupyter_runtime_dir
+
+    dname = jupyter_runtime_dir()
+    if not os.path.exists(dname):
+        os.makedirs(dname, mode=0o700)
+    return os.path.join(dname, f"metakernel-{kernel.replace(':', '.')}.sock")
+
+
+def kernel_name(kernel_class: Any) -> str:
+    """Return the "module:Class" name of *kernel_class*."""
+    return f"{kernel_class.__module__}:{kernel_class.__qualname__}"
+
+
+def launcher_argv(argv: list[str], kernel: str) -> list[str]:
+    """Rewrite the argv of a kernel spec to start *kernel* from a fork server."""
+    if len(argv) >= 3 and argv[1] == "-m":
+        rest = argv[3:]
+    else:
+        rest = ["-f", "{connection_file}"]
+    return [argv[0], "-m", "metakernel.forkserver", kernel, *rest]
+
+
+def _signals() -> list[signal.Signals]:
+    return [
+        getattr(signal, name) for name in FORWARDED_SIGNALS if hasattr(signal, name)
+    ]
+
+
+def _send_message(sock: socket.socket, message: dict[str, Any]) -> None:
+    sock.sendall(json.dumps(message).encode() + b"\n")
+
+
+def _read_message(
+    sock: socket.socket, buffer: bytes = b""
+) -> tuple[dict[str, Any] | None, bytes]:
+    """Read one line of JSON from *sock*; returns (None, rest) at EOF."""
+    while b"\n" not in buffer:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return None, buffer
+        buffer += chunk
+    line, _, rest = buffer.partition(b"\n")
+    return json.loads(line), rest
+
+
+class ForkedKernel:
+    """A kernel started by a fork server, seen from the process that asked."""
+
+    def __init__(self, pid: int, sock: socket.socket, buffer: bytes = b"") -> None:
+        self.pid = pid
+        self._sock = sock
+        self._buffer = buffer
+
+    def send_signal(self, signum: int) -> None:
+        """Send the signal *signum* to the kernel."""
+        try:
+            os.kill(self.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def wait(self) -> int:
+        """Forward signals to the kernel until it exits; return its exit code.
+
+        If this process is orphaned (e.g. the Jupyter server died), the
+        kernel is terminated, as a kernel would shut itself down.
+        """
+        parent = os.getppid()
+        previous = {}
+        for signum in _signals():
+            previous[signum] = signal.signal(
+                signum, lambda signum, frame: self.send_signal(signum)
+            )
+        self._sock.settimeout(1.0)
+        try:
+            while True:
+                try:
+                    message, self._buffer = _read_message(self._sock, self._buffer)
+                except TimeoutError:
+                    if os.getppid() != parent:
+                        self.send_signal(signal.SIGTERM)
+                        return 1
+                    continue
+                if message is None:
+                    # The kernel died without reporting its exit code
+                    return 1
+                if "exit" in message:
+                    return int(message["exit"])
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+            self._sock.close()
+
+
+def request_kernel(argv: list[str], socket_path: str) -> ForkedKernel | None:
+    """Ask the fork server at *socket_path* to start a kernel with *argv*.
+
+    The kernel runs in the current directory and environment, with this
+    process's stdin, stdout and stderr. Returns None if no fork server is
+    listening on *socket_path*.
+    """
+    if not is_supported():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        request = {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}
+        data = json.dumps(request).encode() + b"\n"
+        sent = socket.send_fds(sock, [data], [0, 1, 2])
+        sock.sendall(data[sent:])
+        message, buffer = _read_message(sock)
+    except (OSError, ValueError):
+        sock.close()
+        return None
+    if message is None or "pid" not in message:
+        sock.close()
+        return None
+    return ForkedKernel(int(message["pid"]), sock, buffer)
+
+
+def _exit_with_launcher(sock: socket.socket) -> None:
+    """Exit once the process that asked for this kernel goes away."""
+    try:
+        while sock.recv(1024):
+            pass
+    except OSError:
+        pass
+    os._exit(1)
+
+
+class ForkServer:
+    """Fork kernels of *kernel_class* on request from a Unix socket."""
+
+    def __init__(
+        self,
+        kernel_class: Any,
+        socket_path: str | None = None,
+        log: logging.Logger | None = None,
+    ) -> None:
+        self.kernel_class = kernel_class
+        self.socket_path = socket_path or default_socket_path(kernel_name(kernel_class))
+        self.log = log or logging.getLogger(__name__)
+        self.children: set[int] = set()
+        self._listener: socket.socket | None = None
+
+    def bind(self) -> None:
+        """Listen on the socket, replacing a stale one left behind."""
+        if not is_supported():
+            raise RuntimeError("Fork servers are not supported on this platform")
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                os.unlink(self.socket_path)
+            else:
+                raise RuntimeError(
+                    f"A fork server is already listening on {self.socket_path}"
+                )
+            finally:
+                probe.close()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            listener.bind(self.socket_path)
+        finally:
+            os.umask(umask)
+        listener.listen()
+        self._listener = listener
+
+    def prepare(self) -> None:
+        """Warm up this process so that forked kernels start fast."""
+        self.kernel_class.prewarm()
+
+    def serve_forever(self) -> None:
+        """Handle requests until interrupted."""
+        if self._listener is None:
+            self.bind()
+        assert self._listener is not None  # noqa: S101
+        self._listener.settimeout(1.0)
+        try:
+            while True:
+                try:
+                    conn, _ = self._listener.accept()
+                except TimeoutError:
+                    self.reap()
+                    continue
+                self.reap()
+                self.handle(conn)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stop listening. Kernels that were started keep running."""
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+    def reap(self) -> None:
+        """Collect the exit status of kernels that have finished."""
+        for pid in list(self.children):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                self.children.discard(pid)
+
+    def handle(self, conn: socket.socket) -> None:
+        """Read a request from *conn* and fork a kernel for it."""
+        fds: list[int] = []
+        try:
+            conn.settimeout(10)
+            data, fds, _, _ = socket.recv_fds(conn, 65536, 3)
+            if not data:
+                # A client checking whether the server is running
+                conn.close()
+                return
+            request, _ = _read_message(conn, data)
+            if request is None or len(fds) != 3:
+                raise ValueError("incomplete request")
+        except (OSError, ValueError) as e:
+            self.log.error(f"Invalid fork server request: {e}")
+            for fd in fds:
+                os.close(fd)
+            conn.close()
+            return
+
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = self._run_kernel(conn, request, fds)
+            finally:
+                os._exit(code)
+
+        for fd in fds:
+            os.close(fd)
+        self.children.add(pid)
+        self.log.info(f"Started kernel {pid}: {' '.join(request['argv'])}")
+        try:
+            _send_message(conn, {"pid": pid})
+        except OSError:
+            pass
+        conn.close()
+
+    def _run_kernel(
+        self, conn: socket.socket, request: dict[str, Any], fds: list[int]
+    ) -> int:
+        """Start the kernel in the forked child and return its exit code."""
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        os.setsid()
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        for signum in _signals():
+            signal.signal(signum, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        conn.settimeout(None)
+        threading.Thread(target=_exit_with_launcher, args=(conn,), daemon=True).start()
+
+        from ._metakernel import MetaKernelApp
+
+        MetaKernelApp.clear_instance()
+        sys.argv = [sys.argv[0], *request["argv"]]
+        if request["env"].get("JPY_PARENT_PID"):
+            # The kernel's parent is this server, not the launcher; the
+            # launcher is watched through *conn* instead of by polling.
+            sys.argv.append("--IPKernelApp.parent_handle=1")
+        code = 0
+        try:
+            self.kernel_class.run_as_main()
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            _send_message(conn, {"exit": code})
+        except OSError:
+            pass
+        return code
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Start a kernel from its fork server, or normally if none is running.
+
+    Usage: python -m metakernel.forkserver [--socket PATH] module:Class ARGS
+    """
+    args = sys.argv[1:] if argv is None else list(argv)
+    socket_path = None
+    if args and args[0].startswith("--socket"):
+        if "=" in args[0]:
+            socket_path = args.pop(0).split("=", 1)[1]
+        else:
+            args.pop(0)
+            socket_path = args.pop(0) if args else None
+    if not args or ":" not in args[0]:
+        sys.exit(main.__doc__.split("\n\n")[-1].strip())  # type:ignore[union-attr]
+    kernel, kernel_args = args[0], args[1:]
+
+    forked = request_kernel(kernel_args, socket_path or default_socket_path(kernel))
+    if forked is not None:
+        sys.exit(forked.wait())
+    module, class_name = kernel.split(":")
+    code = f"from {module} import {class_name}; {class_name}.run_as_main()"
+    os.execv(sys.executable, [sys.executable, "-c", code, *kernel_args])  # noqa: S606
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Store the code of executed cells in an SQLite database."""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import sqlite3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session INTEGER PRIMARY KEY AUTOINCREMENT,
+    start TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS history (
+    session INTEGER,
+    line INTEGER,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS history_session_line ON history (session, line);
+"""
+
+
+class HistoryStore:
+    """The history of all kernels that share the database at *path*.
+
+    Each kernel adds the cells it runs to a session of its own, one row at
+    a time, and reads back the last cells, a range of lines of a session,
+    or the cells that match a glob pattern, without loading the rest.
+    Kernels can use the same file at the same time: the database is in
+    WAL mode, and waits up to *timeout* seconds for a lock that another
+    kernel holds. That wait is short, as kernels store cells on their
+    event loop; a cell that can't be stored then raises
+    :class:`sqlite3.OperationalError`.
+
+    The database is opened on first use. If it is new and a JSON history
+    from older versions is next to it (*path* with the extension
+    ``.json``), that is imported as the first session.
+    """
+
+    def __init__(self, path: str, timeout: float = 0.1) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._db: sqlite3.Connection | None = None
+        self._session: int | None = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            import sqlite3
+
+            db = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(_SCHEMA)
+            self._db = db
+            self._import_json()
+        return self._db
+
+    @property
+    def session(self) -> int:
+        """The session of this kernel, started on first use."""
+        if self._session is None:
+            cursor = self.db.execute("INSERT INTO sessions DEFAULT VALUES")
+            self._session = cursor.lastrowid
+        assert self._session is not None  # noqa: S101
+        return self._session
+
+    def new_session(self) -> None:
+        """Add the next cells to a new session, as after a restart."""
+        self._session = None
+
+    def store(self, line: int, source: str) -> None:
+        """Add the cell *source* as line *line* of this kernel's session."""
+        self.db.execute(
+            "INSERT INTO history (session, line, source) VALUES (?, ?, ?)",
+            (self.session, line, source),
+        )
+
+    def tail(self, n: int, unique: bool = False) -> list[tuple[int, int, str]]:
+        """Return the last *n* cells of all sessions, oldest first."""
+        return self._query("", (), n, unique)
+
+    def range(
+        self, session: int = 0, start: int = 0, stop: int | None = None
+    ) -> list[tuple[int, int, str]]:
+        """Return the lines *start* to *stop* (exclusive) of *session*.
+
+        Session 0 is this kernel's session, and negative numbers count
+        back from it.
+        """
+        if session <= 0:
+            session += self._current()
+        where = "WHERE session = ? AND line >= ?"
+        params: tuple[Any, ...] = (session, start)
+        if stop is not None:
+            where += " AND line < ?"
+            params += (stop,)
+        rows = self.db.execute(
+            f"SELECT session, line, source FROM history {where} ORDER BY rowid",  # noqa: S608
+            params,
+        )
+        return list(rows)
+
+    def search(
+        self, pattern: str = "*", n: int | None = None, unique: bool = False
+    ) -> list[tuple[int, int, str]]:
+        """Return the last *n* cells that match the glob *pattern*."""
+        return self._query("WHERE source GLOB ?", (pattern,), n, unique)
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _current(self) -> int:
+        """The number of this kernel's session, even before it starts."""
+        if self._session is not None:
+            return self._session
+        row = self.db.execute("SELECT max(session) FROM sessions").fetchone()
+        return (row[0] or 0) + 1
+
+    def _query(
+        self, where: str, params: tuple[Any, ...], n: int | None, unique: bool
+    ) -> list[tuple[int, int, str]]:
+        if unique:
+            # The last row of each source
+            where = f"WHERE rowid IN (SELECT max(rowid) FROM history {where} GROUP BY source)"  # noqa: S608
+        # Walk back from the newest row, so that only the result is read
+        sql = f"SELECT session, line, source FROM history {where} ORDER BY rowid DESC"  # noqa: S608
+        if n is not None:
+            sql += " LIMIT ?"
+            params += (n,)
+        rows = list(self.db.execute(sql, params))
+        rows.reverse()
+        return rows
+
+    def _import_json(self) -> None:
+        legacy = os.path.splitext(self.path)[0] + ".json"
+        if not os.path.exists(legacy):
+            return
+        assert self._db is not None  # noqa: S101
+        try:
+            with open(legacy) as fid:
+                sources = json.loads(fid.read() or "[]")
+        except (OSError, ValueError):
+            return
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            if self._db.execute("SELECT 1 FROM history LIMIT 1").fetchone():
+                return
+            session = self._db.execute("INSERT INTO sessions DEFAULT VALUES").lastrowid
+            self._db.executemany(
+                "INSERT INTO history (session, line, source) VALUES (?, ?, ?)",
+                [
+                    (session, line, source)
+                    for line, source in enumerate(sources, 1)
+                    if isinstance(source, str)
+                ],
+            )
+        try:
+            os.replace(legacy, legacy + ".imported")
+        except OSError:
+            pass
@@ -7,7 +7,7 @@ import shlex
 import sys
 import traceback
 from ast import literal_eval as safe_eval
-from collections.abc import Callable
+from collections.abc import Callable, MutableMapping
 from typing import TYPE_CHECKING, Any, NoReturn, TypeVar
 
 if TYPE_CHECKING:
@@ -45,6 +45,11 @@ class Magic:
     writing a new magic inside magics/matplotlib_magic.py
     """
 
+    #: Whether a kernel restart replaces this magic with a new instance.
+    #: Set this in magics that hold state belonging to the session, such
+    #: as variables or a subprocess; other magics survive restarts.
+    reset_on_restart = False
+
     def __init__(self, kernel: MetaKernel) -> None:
         self.kernel = kernel
         self.evaluate = True
@@ -127,10 +132,10 @@ class Magic:
         else:
             return f"No such magic '{name}' for {mtype}s."
 
-    def get_help_on(self, info: dict[str, Any], level: int = 0) -> str | None:
+    def get_help_on(self, info: MutableMapping[str, Any], level: int = 0) -> str | None:
         return "Sorry, no help is available on '{}'.".format(info["code"])
 
-    def get_completions(self, info: dict[str, Any]) -> list[str]:
+    def get_completions(self, info: MutableMapping[str, Any]) -> list[str]:
         """
         Get completions based on info dict from magic.
         """
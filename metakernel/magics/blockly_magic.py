@@ -4,8 +4,6 @@
 
 from __future__ import annotations
 
-from IPython.display import IFrame, Javascript
-
 from metakernel import Magic, MetaKernel, option
 
 
@@ -51,6 +49,8 @@ class BlocklyMagic(Magic):
             %blockly --page_from_origin http://host[:port]/blockly_template.html --template_data template_data
             %blockly --height 600
         """
+        from IPython.display import IFrame, Javascript
+
         # Display iframe:
         script = """
         if(document.receiveBlocklyPythonCode === undefined) {
@@ -0,0 +1,58 @@
+# Copyright (c) Metakernel Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from metakernel import Magic, MetaKernel, option
+
+
+class CacheMagic(Magic):
+    @option(
+        "-c",
+        "--clear",
+        action="store_true",
+        default=False,
+        help="remove all of the cached results",
+    )
+    def line_cache(self, clear: bool = False) -> None:
+        """
+        %cache - show the results kept as _N variables
+
+        This line magic lists the results of cells that are kept as
+        _N variables, least recently used first, with their estimated
+        size if output_cache_bytes is set. The oldest results are removed once there are more than
+        the kernel's output_cache_size of them, or they take more than
+        output_cache_bytes.
+
+        Examples:
+            %cache
+            %cache --clear
+        """
+        kernel = self.kernel
+        cache = kernel.output_cache
+        # Without del_variables, the kernel keeps the _N variables it was given
+        kept = type(kernel).del_variables is MetaKernel.del_variables
+        note = (
+            "\nThis kernel doesn't implement del_variables, so the _N variables"
+            " of removed results may still be set."
+        )
+        if clear:
+            kernel.evict_outputs(cache.clear())
+            kernel.Print("Removed all cached results." + note * kept)
+            return
+        if not kernel.output_cache_size:
+            kernel.Print("Results are not cached (output_cache_size is 0).")
+            return
+        summary = f"{len(cache)} of at most {kernel.output_cache_size} results"
+        if kernel.output_cache_bytes:
+            summary += f", {cache.nbytes} bytes of at most {kernel.output_cache_bytes}"
+        lines = [summary]
+        for key in cache:
+            name = "_" + str(key)
+            line = f"    {name:<8} {cache.type_name(key):<20}"
+            if kernel.output_cache_bytes:
+                line += f" {cache.sizeof(key):>12} bytes"
+            lines.append(line)
+        kernel.Print("\n".join(lines) + note * kept)
+
+
+def register_magics(kernel: MetaKernel) -> None:
+    kernel.register_magics(CacheMagic)
@@ -4,8 +4,6 @@ Magics to have disqus conversation in the notebook.
 
 from __future__ import annotations
 
-from IPython.display import HTML
-
 from metakernel import Magic, MetaKernel
 
 
@@ -15,6 +13,8 @@ class ConversationMagic(Magic):
         %conversation ID - insert conversation by ID
         %%conversation ID - insert conversation by ID
         """
+        from IPython.display import HTML
+
         html = f"""
 <div id="disqus_thread"></div>
 <script>
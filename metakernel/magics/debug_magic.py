@@ -2,8 +2,6 @@
 # Distributed under the terms of the Modified BSD License.
 
 
-from IPython.display import HTML, Javascript
-
 from metakernel import Magic, MetaKernel
 
 
@@ -21,6 +19,8 @@ class DebugMagic(Magic):
             (define x 1)
         """
 
+        from IPython.display import HTML, Javascript
+
         html_code = """
 <style type="text/css">
       .breakpoints {width: 1.5em;}
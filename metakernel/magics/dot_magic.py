@@ -2,8 +2,6 @@
 # Distributed under the terms of the Modified BSD License.
 
 
-from IPython.display import HTML
-
 from metakernel import Magic, MetaKernel
 
 
@@ -19,6 +17,8 @@ class DotMagic(Magic):
             %dot graph A { a->b };
 
         """
+        from IPython.display import HTML
+
         try:
             import pydot
         except ImportError:
@@ -44,6 +44,8 @@ class DotMagic(Magic):
 
             graph A { a->b };
         """
+        from IPython.display import HTML
+
         try:
             import pydot
         except ImportError:
@@ -90,8 +90,9 @@ class HelpMagic(Magic):
             else:
                 magic = self.kernel.cell_magics.get(minfo["name"], None)
 
-                if minfo["code"]:
-                    info = self.kernel.parse_code(minfo["code"])
+                code_info = minfo.parse_code()
+                if code_info is not None:
+                    info = code_info
                 elif minfo["args"]:
                     info = self.kernel.parse_code(minfo["args"])
                 elif magic:
@@ -103,10 +104,7 @@ class HelpMagic(Magic):
                     )
             if magic:
                 assert isinstance(magic, Magic)  # noqa: S101
-                the_help = magic.get_help_on(info, level)
-                self.kernel.log.error("got")
-                self.kernel.log.error(the_help)
-                return the_help
+                return magic.get_help_on(info, level)
 
             elif not info["magic"]["name"]:
                 return self.kernel.get_usage()
@@ -115,7 +113,10 @@ class HelpMagic(Magic):
                 return errmsg
 
         else:
-            return self.kernel.get_kernel_help_on(info, level, none_on_fail)
+            busy = None if none_on_fail else "The kernel is busy, try again later."
+            return self.kernel.query_backend(  # type:ignore[no-any-return]
+                self.kernel.get_kernel_help_on, info, level, none_on_fail, default=busy
+            )
 
     def _prep_text(self, text: str) -> str:
         text = text.strip()
@@ -2,8 +2,6 @@
 # Distributed under the terms of the Modified BSD License.
 
 
-from IPython.display import HTML
-
 from metakernel import Magic, MetaKernel
 
 
@@ -19,6 +17,8 @@ class HTMLMagic(Magic):
             %html <u>This is underlined!</u>
 
         """
+        from IPython.display import HTML
+
         html = HTML(code)  # type: ignore[no-untyped-call]
         self.kernel.Display(html)
 
@@ -36,6 +36,8 @@ class HTMLMagic(Magic):
 
             <div>Contents of div tag</div>
         """
+        from IPython.display import HTML
+
         html = HTML(self.code)  # type: ignore[no-untyped-call]
         self.kernel.Display(html)
         self.evaluate = False
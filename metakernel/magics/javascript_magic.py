@@ -1,7 +1,6 @@
 # Copyright (c) Metakernel Development Team.
 # Distributed under the terms of the Modified BSD License.
 
-from IPython.display import Javascript
 
 from metakernel import Magic, MetaKernel
 
@@ -18,6 +17,8 @@ class JavascriptMagic(Magic):
             %javascript console.log("Print in the browser console")
 
         """
+        from IPython.display import Javascript
+
         jscode = Javascript(code)  # type: ignore[no-untyped-call]
         self.kernel.Display(jscode)
 
@@ -34,6 +35,8 @@ class JavascriptMagic(Magic):
             element.html("Hello this is <b>bold</b>!")
 
         """
+        from IPython.display import Javascript
+
         if self.code.strip():
             jscode = Javascript(self.code)  # type: ignore[no-untyped-call]
             self.kernel.Display(jscode)
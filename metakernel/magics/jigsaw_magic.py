@@ -8,8 +8,6 @@ import random
 import string
 import urllib.request
 
-from IPython.display import IFrame, Javascript
-
 from metakernel import Magic, MetaKernel, option
 
 urlopen = urllib.request.urlopen
@@ -42,6 +40,8 @@ class JigsawMagic(Magic):
             %jigsaw Python
             %jigsaw Processing --workspace workspace1 --height 600
         """
+        from IPython.display import IFrame, Javascript
+
         # Copy iframe html to here (must come from same domain):
         # Make up a random workspace name:
         if workspace is None:
@@ -1,7 +1,6 @@
 # Copyright (c) Metakernel Development Team.
 # Distributed under the terms of the Modified BSD License.
 
-from IPython.display import Latex
 
 from metakernel import Magic, MetaKernel
 
@@ -17,6 +16,8 @@ class LatexMagic(Magic):
             %latex $x_1 = \dfrac{a}{b}$
 
         """
+        from IPython.display import Latex
+
         latex = Latex(text)  # type: ignore[no-untyped-call]
         self.kernel.Display(latex)
 
@@ -32,6 +33,8 @@ class LatexMagic(Magic):
 
             $x_2 = a^{n - 1}$
         """
+        from IPython.display import Latex
+
         latex = Latex(self.code)  # type: ignore[no-untyped-call]
         self.kernel.Display(latex)
         self.evaluate = False
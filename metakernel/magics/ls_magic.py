@@ -4,8 +4,6 @@
 import os
 from typing import Any
 
-from IPython.display import FileLinks
-
 from metakernel import Magic, MetaKernel, option
 
 
@@ -27,6 +25,8 @@ class LSMagic(Magic):
             %ls .
             %ls ..
         """
+        from IPython.display import FileLinks
+
         path = os.path.expanduser(path)
         self.retval = FileLinks(path, recursive=recursive)  # type: ignore[no-untyped-call]
 
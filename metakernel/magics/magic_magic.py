@@ -19,10 +19,12 @@ class MagicMagic(Magic):
         line_magics = []
         cell_magics = []
 
-        for name, magic in self.kernel.line_magics.items():
-            line_magics.append(magic.get_help("line", name).split("\n")[0])
-        for name, magic in self.kernel.cell_magics.items():
-            cell_magics.append(magic.get_help("cell", name).split("\n")[0])
+        # Summaries come from the magic registry, so listing the magics
+        # doesn't import every magic module:
+        for name in self.kernel.line_magics:
+            line_magics.append(self.kernel.line_magics.summary(name))
+        for name in self.kernel.cell_magics:
+            cell_magics.append(self.kernel.cell_magics.summary(name))
 
         prefixes = self.kernel.magic_prefixes
         line_magic_text = "\n    ".join(sorted(line_magics))
@@ -72,12 +74,14 @@ class MagicMagic(Magic):
 
         cell_magics = self.kernel.cell_magics
         line_magics = self.kernel.line_magics
-        if minfo["type"] in ["cell", "sticky"] and name in cell_magics:
-            magic = cell_magics[name]
-        elif minfo["type"] == "line" and name in line_magics:
-            magic = line_magics[name]
-
+        if minfo["type"] in ["cell", "sticky"]:
+            magic = cell_magics.get(name)
+        elif minfo["type"] == "line":
+            magic = line_magics.get(name)
         else:
+            magic = None
+
+        if magic is None:
             # FIXME: Raise an error
             return None
         if get_args:
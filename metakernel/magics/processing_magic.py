@@ -3,8 +3,6 @@
 
 from __future__ import annotations
 
-from IPython.display import HTML
-
 from metakernel import Magic, MetaKernel
 
 
@@ -27,6 +25,8 @@ class ProcessingMagic(Magic):
             draw() {
             }
         """
+        from IPython.display import HTML
+
         self.canvas_id += 1
         """%%processing - run contents of cell as a Processing script"""
 
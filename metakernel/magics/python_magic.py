@@ -3,17 +3,25 @@
 from __future__ import annotations
 
 import ast
+import inspect
 import pydoc
+import re
 import sys
+import threading
+import types
+from collections import OrderedDict
+from collections.abc import Callable, MutableMapping
 from typing import Any
 
-import jedi  # type:ignore[import-untyped]
-from jedi import Interpreter
-from jedi.api.helpers import get_on_completion_name  # type:ignore[import-untyped]
-from parso import split_lines  # type:ignore[attr-defined]
-
 from metakernel import ExceptionWrapper, Magic, MetaKernel, option
 
+# jedi isn't thread safe; completions and the warm-up take turns
+_jedi_lock = threading.Lock()
+_warm_up_lock = threading.Lock()
+_warm_up_thread: threading.Thread | None = None
+# A dotted name and a "." before the cursor, not after a call or a literal
+_ATTRIBUTE = re.compile(r"(?<![\w.)\]}'\"])([^\W\d]\w*(?:\.[^\W\d]\w*)*)\.\w*\Z")
+
 
 def exec_then_eval(code: str, env: dict[str, Any]) -> Any:
     import traceback
@@ -46,11 +54,165 @@ def exec_then_eval(code: str, env: dict[str, Any]) -> Any:
         return ExceptionWrapper(ex_name, repr(exc.args), tb_format)
 
 
+def _start_warm_up() -> None:
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(
+                target=_warm_up, name="metakernel-jedi-warm-up", daemon=True
+            )
+            _warm_up_thread.start()
+
+
+def _warm_up() -> None:
+    with _jedi_lock:
+        try:
+            from jedi import Interpreter  # type:ignore[import-untyped]
+
+            Interpreter("import os\nos.pa", [{"os": sys.modules["os"]}]).complete()
+            Interpreter("pr", [{}]).complete()
+        except Exception:  # noqa: S110
+            pass
+
+
+def _matcher(prefix: str) -> Callable[[str], bool]:
+    """Return whether jedi would complete *prefix* to a name."""
+    from jedi import settings
+
+    if settings.case_insensitive_completion:
+        prefix = prefix.lower()
+        return lambda name: name.lower().startswith(prefix)
+    return lambda name: name.startswith(prefix)
+
+
+class PythonCompleter:
+    """Complete Python code in the namespace *env* with jedi.
+
+    One jedi inference state (a private attribute of jedi 0.19 and 0.20)
+    is used for the requests until :meth:`reset` (after each execution),
+    and the attributes of the objects that are completed are kept until
+    then. Only the names of *env* that match the
+    name being completed or that the code uses are passed to jedi, which
+    otherwise looks at all of them on every request.
+    """
+
+    #: Requests that share an inference state, before it is started anew
+    max_uses = 100
+
+    def __init__(self, env: dict[str, Any]) -> None:
+        self.env = env
+        self._state: Any = None
+        self._uses = 0
+        self._attributes: dict[str, tuple[Any, list[str]]] = {}
+
+    def reset(self) -> None:
+        """Forget what was inferred, as the namespace may have changed."""
+        self._state = None
+        self._attributes = {}
+
+    def complete(self, text: str, line: int, column: int) -> list[str]:
+        """Return *text* completed at (*line*, *column*) in all possible ways."""
+        try:
+            import parso
+            from jedi.api.helpers import (  # type:ignore[import-untyped]
+                get_on_completion_name,
+            )
+        except ImportError:
+            return []
+
+        with _jedi_lock:
+            lines = parso.split_lines(text)  # type:ignore[attr-defined]
+            module = parso.load_grammar().parse(text)  # type:ignore[attr-defined]
+            name = get_on_completion_name(module, lines, (line, column))
+            before = text[: len(text) - len(name)]
+            names = self._complete_attribute(module, lines[line - 1][:column], name)
+            if names is None:
+                used = set(module.get_used_names())
+                matches = _matcher(name)
+                namespace = {
+                    key: value
+                    for key, value in self.env.items()
+                    if key in used or matches(key)
+                }
+                interpreter = self._interpreter(text, namespace)
+                names = [
+                    c.name_with_symbols for c in interpreter.complete(line, column)
+                ]
+        return [before + name for name in names]
+
+    def _complete_attribute(
+        self, module: Any, head: str, name: str
+    ) -> list[str] | None:
+        """Complete an attribute of a name in the namespace, from the cache.
+
+        Returns None if the attribute isn't looked up in an object of the
+        namespace, e.g. after a call, or in a name that the code assigns.
+        """
+        match = _ATTRIBUTE.search(head)
+        if not match or "#" in head or "'" in head or '"' in head:
+            return None
+        expr = match.group(1)
+        root, *parts = expr.split(".")
+        if root not in self.env or any(
+            leaf.is_definition() for leaf in module.get_used_names().get(root, [])
+        ):
+            return None
+        obj = self.env[root]
+        for part in parts:
+            try:
+                obj = inspect.getattr_static(obj, part)
+            except AttributeError:
+                return None
+            # Properties and such are evaluated by jedi
+            if hasattr(type(obj), "__get__") and not isinstance(
+                obj, (type, types.ModuleType)
+            ):
+                return None
+        cached = self._attributes.get(expr)
+        if cached is None or cached[0] is not obj:
+            interpreter = self._interpreter(expr + ".", {root: self.env[root]})
+            cached = (obj, [c.name_with_symbols for c in interpreter.complete()])
+            self._attributes[expr] = cached
+        matches = _matcher(name)
+        return [attr for attr in cached[1] if matches(attr)]
+
+    def _interpreter(self, code: str, namespace: dict[str, Any]) -> Any:
+        from jedi import Interpreter
+
+        interpreter = Interpreter(code, [namespace])
+        if not hasattr(interpreter, "_inference_state"):
+            # Other jedi versions complete with a fresh interpreter each time
+            return interpreter
+        if self._state is None or self._uses >= self.max_uses:
+            self._state = interpreter._inference_state
+            self._uses = 0
+        else:
+            interpreter._inference_state = self._state
+        self._uses += 1
+        return interpreter
+
+
 class PythonMagic(Magic):
+    reset_on_restart = True
+    #: Objects and rendered help texts that are kept for help, until code runs
+    help_cache_size = 64
+
     def __init__(self, kernel: MetaKernel) -> None:
         super().__init__(kernel)
         self.env = globals()["__builtins__"].copy()
         self.retval: Any = None
+        self.completer = PythonCompleter(self.env)
+        # (first object, object) that dotted names resolve to, for help
+        self._help_objects: OrderedDict[str, tuple[Any, Any]] = OrderedDict()
+        # (object, rendered help) by (id of the object, level)
+        self._help_texts: OrderedDict[tuple[int, int], tuple[Any, str]] = OrderedDict()
+
+    def warm_up(self) -> None:
+        """Import jedi and complete some code in a background thread, once.
+
+        The first completion then doesn't wait for jedi to load its caches.
+        """
+        _start_warm_up()
 
     def line_python(self, *args: Any) -> None:
         """
@@ -77,6 +239,10 @@ class PythonMagic(Magic):
         import metakernel
         import metakernel.display
 
+        self.warm_up()
+        self.completer.reset()
+        self._help_objects.clear()
+        self._help_texts.clear()
         # Ensure the current kernel is the active one so that display() calls
         # inside %%python route to this kernel's output, not a stale instance.
         metakernel.MetaKernel.meta_kernel = self.kernel
@@ -155,33 +321,15 @@ class PythonMagic(Magic):
         else:
             return self.retval
 
-    def get_completions(self, info: dict[str, Any]) -> list[str]:
+    def get_completions(self, info: MutableMapping[str, Any]) -> list[str]:
         """Get Python completions"""
-        # https://github.com/davidhalter/jedi/blob/master/jedi/utils.py
-        if jedi is None:
-            return []
-
-        text = info["code"]
-        position = (info["line_num"], info["column"])
-        interpreter = Interpreter(text, [self.env])
-
-        lines = split_lines(text)
-        name = get_on_completion_name(interpreter._module_node, lines, position)
-        before = text[: len(text) - len(name)]
-
-        try:
-            completions = interpreter.complete()
-        except AttributeError:
-            completions = interpreter.completions()
-
-        completions = [before + c.name_with_symbols for c in completions]
-
-        self.kernel.log.error(completions)
-
+        completions = self.completer.complete(
+            info["code"], info["line_num"], info["column"]
+        )
         return [c[info["start"] :] for c in completions]
 
     def get_help_on(
-        self, info: dict[str, Any], level: int = 0, none_on_fail: bool = False
+        self, info: MutableMapping[str, Any], level: int = 0, none_on_fail: bool = False
     ) -> str | None:
         """Implement basic help for functions"""
         if not info["code"]:
@@ -191,24 +339,50 @@ class PythonMagic(Magic):
 
         default = None if none_on_fail else (f'No help available for "{last}"')
 
-        parts = last.split(".")
-
-        obj = self.env.get(parts[0], None)
+        obj = self._help_object(last)
 
         if not obj:
             return default
 
-        for p in parts[1:]:
-            obj = getattr(obj, p, None)
+        if level == 0 and hasattr(obj, "__doc__"):
+            return obj.__doc__  # type:ignore[no-any-return]
+        return self._render_help(obj, level)
+
+    def _help_object(self, name: str) -> Any:
+        """The object that the dotted *name* refers to, or None."""
+        parts = name.split(".")
 
+        root = self.env.get(parts[0], None)
+
+        # Names can be set without running code (see set_variable)
+        cached = self._help_objects.get(name)
+        if cached is not None and cached[0] is root:
+            self._help_objects.move_to_end(name)
+            return cached[1]
+
+        obj = root
+
+        for p in parts[1:]:
             if not obj:
-                return default
+                break
+            obj = getattr(obj, p, None)
 
+        self._help_objects[name] = (root, obj)
+        while len(self._help_objects) > self.help_cache_size:
+            self._help_objects.popitem(last=False)
+        return obj
+
+    def _render_help(self, obj: Any, level: int) -> str:
+        key = (id(obj), level)
+        cached = self._help_texts.get(key)
+        if cached is not None and cached[0] is obj:
+            self._help_texts.move_to_end(key)
+            return cached[1]
         strhelp = pydoc.render_doc(obj, "Help on %s")
-        if level == 0:
-            return getattr(obj, "__doc__", strhelp)
-        else:
-            return strhelp
+        self._help_texts[key] = (obj, strhelp)
+        while len(self._help_texts) > self.help_cache_size:
+            self._help_texts.popitem(last=False)
+        return strhelp
 
 
 def register_magics(kernel: MetaKernel) -> None:
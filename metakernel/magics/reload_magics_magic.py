@@ -16,7 +16,8 @@ class ReloadMagicsMagic(Magic):
         system, and in your private magic folder.
 
         You only need to do this if you edit a magic file. It runs
-        automatically if you install a new magic.
+        automatically if you install a new magic. Only magic files that
+        changed are loaded again; all other magics keep their state.
         """
         self.kernel.reload_magics()
         self.code = "%lsmagic\n" + self.code
@@ -1,8 +1,6 @@
 # Copyright (c) Metakernel Development Team.
 # Distributed under the terms of the Modified BSD License.
 
-import json
-
 from metakernel import Magic, MetaKernel
 
 
@@ -20,12 +18,8 @@ class RestartMagic(Magic):
         Note that you will lose all computed values.
         """
         kernel = self.kernel
-        if kernel.hist_file:
-            with open(kernel.hist_file, "w") as fid:
-                json.dump(kernel.hist_cache[-kernel.max_hist_cache :], fid)
         kernel.Print("Restarting kernel...")
-        kernel.restart_kernel()
-        kernel.reload_magics()
+        kernel.restart_session()
         kernel.Print("Done!")
 
 
@@ -4,6 +4,7 @@
 from __future__ import annotations
 
 import os
+from collections.abc import MutableMapping
 from typing import Any
 
 from metakernel import Magic, MetaKernel, pexpect
@@ -11,6 +12,8 @@ from metakernel.replwrap import REPLWrapper, bash, powershell
 
 
 class ShellMagic(Magic):
+    reset_on_restart = True
+
     def __init__(self, kernel: MetaKernel) -> None:
         super().__init__(kernel)
         self.repl: REPLWrapper | None = None
@@ -92,14 +95,14 @@ class ShellMagic(Magic):
         self.line_shell(self.code)
         self.evaluate = False
 
-    def get_completions(self, info: dict[str, Any]) -> list[str]:
+    def get_completions(self, info: MutableMapping[str, Any]) -> list[str]:
         if self.cmd == "cmd":
             return []
         command = 'compgen -cdfa "{}"'.format(info["code"])
         completion_text = self.eval(command)
         return completion_text.split()
 
-    def get_help_on(self, info: dict[str, Any], level: int = 0) -> str:
+    def get_help_on(self, info: MutableMapping[str, Any], level: int = 0) -> str:
         expr = info["code"].rstrip()
         if self.cmd == "cmd":
             resp = self.eval(f"help {expr}")
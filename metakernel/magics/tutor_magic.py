@@ -23,8 +23,6 @@ from __future__ import annotations
 # -----------------------------------------------------------------------------
 from urllib.parse import quote
 
-from IPython.display import HTML
-
 from metakernel import Magic, MetaKernel, option
 
 
@@ -67,6 +65,8 @@ class TutorMagic(Magic):
                }
            }
         """
+        from IPython.display import HTML
+
         if language is None:
             language = self.kernel.language_info["name"]
         if language not in ["python", "python2", "python3", "java", "javascript"]:
@@ -0,0 +1,99 @@
+"""Track the results of the last cells, within a count and a size budget."""
+
+from __future__ import annotations
+
+import sys
+from collections import OrderedDict
+from collections.abc import Iterator
+from typing import Any
+
+
+def sizeof(obj: Any) -> int:
+    """Estimate the bytes that *obj* holds.
+
+    Uses ``nbytes`` (arrays) when it's larger than ``sys.getsizeof``, which
+    calls ``__sizeof__`` (and so counts the data of DataFrames).
+    """
+    try:
+        size = sys.getsizeof(obj)
+    except Exception:
+        size = 0
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int) and nbytes > size:
+        return nbytes
+    return size
+
+
+class OutputCache:
+    """The results of cells by execution count, least recently used first.
+
+    Only the type name and estimated size of each result are kept; the
+    results themselves live in the kernel's ``_N`` variables. At most
+    *size* results and *byte_limit* bytes (0 for no limit) are tracked;
+    the most recent result is tracked even if it is over the byte limit.
+    Sizes are only estimated while there is a byte limit, as that can take
+    as long as walking the result (e.g. a DataFrame of objects); without
+    one, they are 0.
+    """
+
+    def __init__(self, size: int = 1000, byte_limit: int = 0) -> None:
+        self.size = size
+        self.byte_limit = byte_limit
+        self.nbytes = 0
+        self._entries: OrderedDict[int, tuple[str, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._entries)
+
+    def type_name(self, key: int) -> str:
+        return self._entries[key][0]
+
+    def sizeof(self, key: int) -> int:
+        return self._entries[key][1]
+
+    def add(self, key: int, value: Any) -> list[int]:
+        """Track *value* as the result of cell *key*; return the evicted keys."""
+        self.remove(key)
+        size = sizeof(value) if self.byte_limit else 0
+        self._entries[key] = (type(value).__name__, size)
+        self.nbytes += size
+        return self.trim()
+
+    def touch(self, key: int) -> None:
+        """Mark the result of cell *key* as used."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+
+    def remove(self, key: int) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def trim(self) -> list[int]:
+        """Drop results that are over the limits; return their keys."""
+        evicted = []
+        while self._entries and (
+            len(self._entries) > self.size
+            or (
+                self.byte_limit
+                and self.nbytes > self.byte_limit
+                and len(self._entries) > 1
+            )
+        ):
+            key, (_, size) = self._entries.popitem(last=False)
+            self.nbytes -= size
+            evicted.append(key)
+        return evicted
+
+    def clear(self) -> list[int]:
+        """Drop all results; return their keys."""
+        keys = list(self._entries)
+        self._entries.clear()
+        self.nbytes = 0
+        return keys
@@ -2,17 +2,357 @@ from __future__ import annotations
 
 import os
 import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterator, MutableMapping
 from typing import Any
 
 IDENTIFIER_REGEX = r"[^\d\W][\w\.]*"
 FUNC_CALL_REGEX = r"([^\d\W][\w\.]*)\([^\)\()]*\Z"
 MAGIC_PREFIXES = {"magic": "%", "shell": "!", "help": "?"}
 HELP_SUFFIX = "?"
+# Line breaks that str.splitlines() knows besides "\n"
+OTHER_LINE_BREAKS = re.compile("[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+LINE_BREAKS = frozenset("\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029")
+
+
+def _has_other_line_breaks(text: str, start: int = 0, end: int | None = None) -> bool:
+    """Whether text[start:end] has line breaks other than "\n"."""
+    if end is None:
+        end = len(text)
+    if text.isascii():
+        # str.find is much faster than a character class on long text
+        return any(
+            text.find(char, start, end) != -1 for char in "\r\x0b\x0c\x1c\x1d\x1e"
+        )
+    return OTHER_LINE_BREAKS.search(text, start, end) is not None
+
+
+class _LazyInfo(MutableMapping[str, Any]):
+    """A mapping whose `_items` are computed when first looked up.
+
+    Items can be assigned like in a dict, and extra items added; assigned
+    values hide the computed ones without changing them.
+    """
+
+    __slots__ = ("_parsed", "_values")
+
+    _items: dict[str, Callable[[Any], Any]] = {}
+
+    def __init__(self) -> None:
+        self._parsed: dict[str, Any] = {}
+        self._values: dict[str, Any] = {}
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return self._values[key]
+        except KeyError:
+            return self._get(key)
+
+    def _get(self, key: str) -> Any:
+        try:
+            return self._parsed[key]
+        except KeyError:
+            pass
+        compute = self._items.get(key)
+        if compute is None:
+            raise KeyError(key)
+        value = self._parsed[key] = compute(self)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._values[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in self._items:
+            raise KeyError(f"{key!r} can't be deleted")
+        del self._values[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._items or key in self._values
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._items
+        for key in list(self._values):
+            if key not in self._items:
+                yield key
+
+    def __len__(self) -> int:
+        return len(self._items) + sum(key not in self._items for key in self._values)
+
+    def copy(self) -> dict[str, Any]:
+        """Return all items as a dict."""
+        return dict(self)
+
+
+class ParseInfo(_LazyInfo):
+    """The result of `Parser.parse_code`.
+
+    Items are computed from the buffer when they are first looked up, so
+    that parsing doesn't copy or split the whole buffer, and asking for
+    the object at the cursor takes time proportional to the current line
+    only. Items can be assigned like in a dict, and extra items added.
+
+    Only buffer[offset:stop] is parsed, as if it were the whole buffer;
+    *start* and *end* are indexes in *buffer*.
+    """
+
+    __slots__ = (
+        "_buffer",
+        "_cursor_end",
+        "_cursor_start",
+        "_offset",
+        "_parser",
+        "_stop",
+    )
+
+    def __init__(
+        self,
+        parser: Parser,
+        buffer: str,
+        start: int,
+        end: int,
+        offset: int = 0,
+        stop: int | None = None,
+    ) -> None:
+        super().__init__()
+        self._parser = parser
+        self._buffer = buffer
+        self._cursor_start = start
+        self._cursor_end = end
+        self._offset = offset
+        self._stop = len(buffer) if stop is None else stop
+
+    def __repr__(self) -> str:
+        return (
+            f"<ParseInfo of {self._stop - self._offset} characters, cursor "
+            f"{self._cursor_start - self._offset}:{self._cursor_end - self._offset}>"
+        )
+
+    def _line_bounds(self) -> tuple[int, int]:
+        # The last of buffer[offset:end].splitlines(), found without splitting
+        text, pos, offset = self._buffer, self._cursor_end, self._offset
+        if pos > offset and text[pos - 1] in LINE_BREAKS:
+            pos -= 1
+            if pos > offset and text[pos] == "\n" and text[pos - 1] == "\r":
+                pos -= 1
+        line_end = pos
+        while pos > offset and text[pos - 1] not in LINE_BREAKS:
+            pos -= 1
+        return pos, line_end
+
+    def _magic(self) -> MutableMapping[str, Any]:
+        buffer, start, end = self._buffer, self._offset, self._cursor_end
+        if not self._parser._may_have_magic(buffer, end, start):
+            return {}
+        return self._parser._parse_magic(buffer, end, start)
+
+    def _lines(self) -> list[str]:
+        return self._buffer[self._offset : self._cursor_end].splitlines()
+
+    def _line_num(self) -> int:
+        # len(buffer[offset:end].splitlines()), counted without splitting
+        text, start, end = self._buffer, self._offset, self._cursor_end
+        if end <= start:
+            return 0
+        breaks = text.count("\n", start, end)
+        if _has_other_line_breaks(text, start, end):
+            breaks += sum(1 for _ in OTHER_LINE_BREAKS.finditer(text, start, end))
+            breaks -= text.count("\r\n", start, end)
+        return breaks + (text[end - 1] not in LINE_BREAKS)
+
+    def _line(self) -> str:
+        line_start, line_end = self._line_bounds()
+        return self._buffer[line_start:line_end]
+
+    def _column(self) -> int:
+        return len(self._get("line"))
+
+    def _obj(self) -> str:
+        match = self._parser.id_regex.search(self._get("line"))
+        assert match is not None  # noqa: S101
+        return match.group()
+
+    def _full_obj(self) -> str:
+        obj: str = self._get("obj")
+        if not obj:
+            return obj
+        # Add what is valid to the right of the cursor on the same line
+        text = self._buffer
+        line_end = self._line_bounds()[1]
+        if line_end < self._cursor_end:
+            return obj
+        pos = line_end
+        while pos < self._stop and text[pos] not in LINE_BREAKS:
+            pos += 1
+        match = self._parser.id_regex.match(text, line_end, pos)
+        if match:
+            return obj + match.group()
+        return obj
+
+    def _func_call(self) -> str | None:
+        if self._get("obj"):
+            return None
+        func_call = self._parser.func_call_regex.search(self._get("line"))
+        return str(func_call.groups()[0]) if func_call else None
+
+    def _help_obj(self) -> str:
+        func_call = self._func_call()
+        return str(self._get("full_obj")) if func_call is None else func_call
+
+    def _help_col(self) -> int:
+        line: str = self._get("line")
+        if self._func_call() is None:
+            return int(self._get("column"))
+        return line.index(self._get("obj")) + len(self._get("obj"))
+
+    def _help_pos(self) -> int:
+        end = self._cursor_end - self._offset
+        if self._func_call() is None:
+            return end
+        return end - len(self._get("line")) + int(self._get("column"))
+
+    def _start(self) -> int:
+        obj = self._get("obj")
+        return self._cursor_end - self._offset - len(obj) if obj else 0
+
+    def _end(self) -> int:
+        return self._cursor_end - self._offset
+
+    def _pre(self) -> str:
+        return self._buffer[self._offset : self._cursor_start]
+
+    def _code(self) -> str:
+        return self._buffer[self._cursor_start : self._cursor_end]
+
+    def _post(self) -> str:
+        return self._buffer[self._cursor_end : self._stop]
+
+    def _path_matches(self) -> list[str]:
+        return self._parser._get_path_matches(self)
+
+
+ParseInfo._items = {
+    "code": ParseInfo._code,
+    "magic": ParseInfo._magic,
+    "lines": ParseInfo._lines,
+    "line_num": ParseInfo._line_num,
+    "line": ParseInfo._line,
+    "column": ParseInfo._column,
+    "help_obj": ParseInfo._help_obj,
+    "help_col": ParseInfo._help_col,
+    "help_pos": ParseInfo._help_pos,
+    "obj": ParseInfo._obj,
+    "full_obj": ParseInfo._full_obj,
+    "start": ParseInfo._start,
+    "end": ParseInfo._end,
+    "pre": ParseInfo._pre,
+    "post": ParseInfo._post,
+    "path_matches": ParseInfo._path_matches,
+}
+
+
+class MagicInfo(_LazyInfo):
+    """Magic info from `Parser._parse_magic`.
+
+    "rest" is buffer[start:stop], and "code" the lines of it after the
+    first; both are only sliced from the buffer when looked up, so that
+    completing in a large cell block doesn't copy it.
+    """
+
+    __slots__ = ("_buffer", "_deleted", "_parser", "_rest_start", "_rest_stop")
+
+    def __init__(
+        self, parser: Parser, buffer: str, start: int, stop: int, **items: Any
+    ) -> None:
+        super().__init__()
+        self._parser = parser
+        self._buffer = buffer
+        self._rest_start = start
+        self._rest_stop = stop
+        self._values.update(items)
+        # Unlike with ParseInfo, any item can be deleted, as from a dict
+        self._deleted: set[str] = set()
+
+    def __repr__(self) -> str:
+        return f"<MagicInfo {self._values!r}>"
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._deleted:
+            raise KeyError(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._deleted.discard(key)
+        self._values[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._values.pop(key, None)
+        if key in self._items:
+            self._deleted.add(key)
+
+    def __contains__(self, key: object) -> bool:
+        return key not in self._deleted and super().__contains__(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for key in super().__iter__():
+            if key not in self._deleted:
+                yield key
+
+    def __len__(self) -> int:
+        return super().__len__() - len(self._deleted)
+
+    def _code_start(self) -> int | None:
+        """Where the cell block starts, if it needs no line break changes."""
+        buffer, start, stop = self._buffer, self._rest_start, self._rest_stop
+        if _has_other_line_breaks(buffer, start, stop):
+            return None
+        newline = buffer.find("\n", start, stop)
+        return stop if newline == -1 else newline + 1
+
+    def _rest(self) -> str:
+        return self._buffer[self._rest_start : self._rest_stop]
+
+    def _code(self) -> str:
+        code_start = self._code_start()
+        if code_start is None:
+            return "\n".join(self._get("rest").splitlines()[1:])
+        return self._buffer[code_start : self._rest_stop]
+
+    def parse_code(self) -> ParseInfo | None:
+        """Parse the cell block like ``Parser.parse_code(self["code"])``.
+
+        The block is parsed where it is in the buffer, unless its line
+        breaks need changes. Returns None if there is no block.
+        """
+        code_start = self._code_start()
+        if code_start is None:
+            code: str = self._get("code")
+            return self._parser.parse_code(code) if code else None
+        if code_start == self._rest_stop:
+            return None
+        return ParseInfo(
+            self._parser,
+            self._buffer,
+            code_start,
+            self._rest_stop,
+            code_start,
+            self._rest_stop,
+        )
+
+
+MagicInfo._items = {"rest": MagicInfo._rest, "code": MagicInfo._code}
 
 
 class Parser:
     """Parse an input buffer using language-specific regexes."""
 
+    #: Most path matches to return (the first in sorted order); 0 for all
+    max_path_matches = 1000
+
     def __init__(
         self,
         identifier_regex: str = IDENTIFIER_REGEX,
@@ -43,6 +383,13 @@ class Parser:
         )
 
         self.magic_regex = f"{default_regex}|{identifier_regex}"
+        self._magic_name_regex = re.compile(self.magic_regex)
+        # A run of each magic prefix, at the start of a buffer
+        self._prefix_regexes = {
+            name: re.compile(f"(?:{re.escape(prefix)})+")
+            for name, prefix in magic_prefixes.items()
+            if prefix
+        }
 
         full_path_regex = r'([\w/\.~][^\'"]*)\Z'
         self.unquoted_path = re.compile(
@@ -56,7 +403,7 @@ class Parser:
         self.magic_prefixes = magic_prefixes
         self.help_suffix = help_suffix
 
-    def parse_code(self, code: str, start: int = 0, end: int = -1) -> dict[str, Any]:
+    def parse_code(self, code: str, start: int = 0, end: int = -1) -> ParseInfo:
         """Parse an input buffer, extracting relevant information.
 
         Parameters
@@ -70,8 +417,9 @@ class Parser:
 
         Returns
         -------
-        info : dict
-            Metadata about the parsed buffer with the following items:
+        info : ParseInfo
+            Metadata about the parsed buffer, computed when first accessed,
+            with the following items:
             magic : dict, Magic info, see `_parse_magic`.
             lines : int, Number of lines in code
             line_num : int, Current line Number
@@ -94,66 +442,84 @@ class Parser:
         start = min(start, end)
         start = max(0, start)
 
-        info: dict[str, Any] = {"code": code, "magic": {}}
-
-        info["magic"] = self._parse_magic(code[:end])
-
-        info["lines"] = lines = code[:end].splitlines()
-
-        info["line_num"] = line_num = len(lines)
-
-        if info["line_num"]:
-            info["line"] = line = lines[-1]
-            info["column"] = col = len(lines[-1])
-        else:
-            info["line"] = line = ""
-            info["column"] = col = 0
-
-        _match = re.search(self.id_regex, line)
-        assert _match is not None  # noqa: S101
-        obj = _match.group()
+        return ParseInfo(self, code, start, end)
 
-        full_obj = obj
+    def parse_magic(self, code: str) -> dict[str, Any]:
+        """Parse an input buffer for execution.
 
-        if obj:
-            full_line = code.splitlines()[line_num - 1]
-            rest = full_line[col:]
-            match = re.match(self.id_regex, rest)
-            if match:
-                full_obj = obj + match.group()
+        Unlike `parse_code`, this only finds the magic calls, without
+        looking at the cursor position or the file system.
 
-        func_call = re.search(self.func_call_regex, line)
-        if func_call and not obj:
-            info["help_obj"] = func_call.groups()[0]
-            info["help_col"] = line.index(obj) + len(obj)
-            info["help_pos"] = end - len(line) + col
-        else:
-            info["help_obj"] = full_obj
-            info["help_col"] = col
-            info["help_pos"] = end
+        Returns
+        -------
+        info : dict
+            code : str, Input buffer.
+            magic : dict, Magic info, see `_parse_magic`.
+        """
+        return {"code": code, "magic": self._parse_magic(code)}
 
-        info["obj"] = obj
-        info["full_obj"] = full_obj
+    def parse_magic_chain(self, code: str) -> list[MutableMapping[str, Any]]:
+        """Parse the magics stacked at the top of a cell in a single pass.
 
-        if obj:
-            info["start"] = end - len(obj)
-        else:
-            info["start"] = 0
-        info["end"] = end
-        info["pre"] = code[:start]
-        info["code"] = code[start:end]
-        info["post"] = code[end:]
+        Only the magic lines are read, so this takes time proportional to
+        the header of the cell rather than to its size.
 
-        info["path_matches"] = self._get_path_matches(info)
-        return info
+        Parameters
+        ----------
+        code : str
+            Input buffer.
 
-    def _parse_magic(self, code: str) -> dict[str, Any]:
+        Returns
+        -------
+        chain : list of dict
+            Magic info for each line at the top of the buffer that starts
+            with a magic or shell prefix, as `_parse_magic` would give when
+            called on the rest of the buffer from that line, except that
+            the cell block of the magic is given by:
+            offset : int, Index in the buffer where the block starts
+            end : int, Index in the buffer where the block ends
+            The chain stops early at lines that ask for help or contain
+            line breaks other than "\n"; it is empty if the buffer ends
+            with a help request or uses "\r" line breaks, which
+            `_parse_magic` would turn into "\n".
+        """
+        prefixes = (self.magic_prefixes["shell"], self.magic_prefixes["magic"])
+        if not code.startswith(prefixes) or "\r" in code:
+            return []
+        end = len(code)
+        while end and code[end - 1].isspace():
+            end -= 1
+        if self.help_suffix and code.endswith(self.help_suffix, 0, end):
+            return []
+        chain = []
+        pos = 0
+        while pos < end and code.startswith(prefixes, pos):
+            newline = code.find("\n", pos, end)
+            line_end = end if newline == -1 else newline
+            line = code[pos:line_end]
+            if OTHER_LINE_BREAKS.search(line):
+                break
+            info = self._parse_magic(line)
+            if info.get("name") == "help":
+                break
+            del info["rest"], info["code"]
+            pos = end if newline == -1 else newline + 1
+            info["offset"] = pos
+            info["end"] = end
+            chain.append(info)
+        return chain
+
+    def _parse_magic(
+        self, code: str, end: int | None = None, start: int = 0
+    ) -> MutableMapping[str, Any]:
         """Find and parse magic calls in the buffer.
 
         Parameters
         ----------
         code : str
             Input text.
+        end, start : int, optional
+            Parse code[start:end] instead, without copying it.
 
         Notes
         -----
@@ -175,8 +541,9 @@ class Parser:
 
         Returns
         -------
-        info : dict
-            Information about the magic with the following items:
+        info : MagicInfo
+            Information about the magic (an empty dict if there is none)
+            with the following items:
             name : str, Name of magic
             type : str, Type of magic {'line', 'cell', 'sticky'}
             index : str, Index of end of magic in text
@@ -190,13 +557,24 @@ class Parser:
 
         """
         info: dict[str, Any] = {}
-        code = code.lstrip()
+        if end is None:
+            end = len(code)
+        if not self._may_have_magic(code, end, start):
+            return info
+        # Work on offsets into the buffer rather than stripped copies of it;
+        # "index" is relative to the first non-blank character.
+        pos = start
+        while pos < end and code[pos].isspace():
+            pos += 1
+        stop = end
+        while stop > pos and code[stop - 1].isspace():
+            stop -= 1
 
         pre_magics = {}
-        for name, prefix in self.magic_prefixes.items():
-            match = re.match(rf"(\{prefix}+)", code, re.UNICODE)
+        for name, regex in self._prefix_regexes.items():
+            match = regex.match(code, pos, end)
             if match:
-                pre_magics[name] = match.groups()[0]
+                pre_magics[name] = match.group()
 
         types = ["none", "line", "cell", "sticky"]
 
@@ -206,31 +584,34 @@ class Parser:
             info["prefix"] = pre
             info["full_name"] = pre + "help"
             info["type"] = types[len(pre)]
-            info["index"] = code.index(pre)
+            info["index"] = 0
 
-        elif self.help_suffix and code.rstrip().endswith(self.help_suffix):
+        elif self.help_suffix and code.endswith(self.help_suffix, pos, stop):
             info["name"] = "help"
-            regex = rf"(\{self.help_suffix}+)\Z"
-            match = re.search(regex, code.strip(), re.UNICODE)
-            assert match is not None  # noqa: S101
-            suf = match.group()
+            size = len(self.help_suffix)
+            suf_start = stop - size
+            while suf_start - size >= pos and code.startswith(
+                self.help_suffix, suf_start - size, suf_start
+            ):
+                suf_start -= size
+            suf = code[suf_start:stop]
             info["prefix"] = ""
             info["type"] = types[len(suf)]
             info["full_name"] = "help" + suf
-            info["index"] = len(code) - len(suf)
+            info["index"] = end - pos - len(suf)
 
         elif "magic" in pre_magics:
             pre = pre_magics["magic"]
             info["prefix"] = pre
             info["type"] = types[len(pre)]
-            match = re.match(self.magic_regex, code[len(pre) :])
+            match = self._magic_name_regex.match(code, pos + len(pre), end)
             if match:
                 obj = match.group()
             else:
                 obj = ""
             info["name"] = obj
             info["full_name"] = pre + obj
-            info["index"] = code.index(pre + obj) + len(pre + obj)
+            info["index"] = len(pre + obj)
 
         elif "shell" in pre_magics:
             info["name"] = "shell"
@@ -238,24 +619,36 @@ class Parser:
             info["prefix"] = pre
             info["type"] = types[len(pre)]
             info["full_name"] = pre
-            info["index"] = code.index(pre) + len(pre)
+            info["index"] = len(pre)
 
         else:
             return info
 
-        info["rest"] = code[info["index"] :].rstrip()
-
-        if info["rest"]:
-            lines = info["rest"].splitlines()
-            info["args"] = lines[0].strip()
-            info["code"] = "\n".join(lines[1:])
-
-        else:
-            info["args"] = ""
-            info["code"] = ""
-        return info
-
-    def _get_path_matches(self, info: dict[str, Any]) -> list[str]:
+        # "args" is the first line of "rest", up to any kind of line break
+        rest_start = min(pos + info["index"], stop)
+        newline = code.find("\n", rest_start, stop)
+        args_end = stop if newline == -1 else newline
+        match = OTHER_LINE_BREAKS.search(code, rest_start, args_end)
+        if match:
+            args_end = match.start()
+        info["args"] = code[rest_start:args_end].strip()
+        return MagicInfo(self, code, rest_start, stop, **info)
+
+    def _may_have_magic(self, code: str, end: int, start: int = 0) -> bool:
+        """Rule out magics in code[start:end] without copying it."""
+        pos = start
+        while pos < end and code[pos].isspace():
+            pos += 1
+        prefixes = tuple(prefix for prefix in self.magic_prefixes.values() if prefix)
+        if code.startswith(prefixes, pos, end):
+            return True
+        if not self.help_suffix:
+            return False
+        while end > pos and code[end - 1].isspace():
+            end -= 1
+        return code.endswith(self.help_suffix, pos, end)
+
+    def _get_path_matches(self, info: MutableMapping[str, Any]) -> list[str]:
         """Get a list of matching file system paths.
 
         There are 3 types of matches:
@@ -265,6 +658,8 @@ class Parser:
         """
         line = info["line"]
         obj = info["obj"]
+        # The regexes often find the same path
+        completed: dict[str, list[str]] = {}
 
         def get_regex_matches(regex: Any) -> list[str]:
             matches = []
@@ -272,7 +667,9 @@ class Parser:
 
             if path_list:
                 path = "".join(path_list[0])
-                matches = _complete_path(path)
+                if path not in completed:
+                    completed[path] = _complete_path(path)
+                matches = completed[path]
 
                 if len(path) > len(obj) and path != ".":
                     matches = [m[len(path) - len(obj) :] for m in matches]
@@ -286,10 +683,13 @@ class Parser:
         matches = [self.escape_path(m) for m in matches]
         matches += get_regex_matches(self.quoted_path)
 
-        if os.path.isdir(info["obj"]):
-            matches.append(info["obj"] + os.sep)
+        if obj and _isdir(obj):
+            matches.append(obj + os.sep)
 
-        return list(set(matches))
+        matches = sorted(set(matches))
+        if self.max_path_matches:
+            del matches[self.max_path_matches :]
+        return matches
 
     def escape_path(self, path: str) -> str:
         """Escape an unquoted path.
@@ -303,36 +703,102 @@ class Parser:
             return path.replace(" ", r"\ ")
 
 
+# Listings of the last directories by absolute path, as ((st_dev, st_ino,
+# st_mtime_ns), listing, set of subdirectories), within a count and a total
+# number of names
+_listings: OrderedDict[str, tuple[tuple[int, int, int], list[str], frozenset[str]]] = (
+    OrderedDict()
+)
+_listings_lock = threading.Lock()
+_MAX_LISTINGS = 32
+_MAX_LISTED_NAMES = 100_000
+# Directories changed more recently than this (in seconds) are listed again,
+# as they may change again within the resolution of their mtime
+_RACY_MTIME = 2.0
+
+
 def _listdir(root: str) -> list[str]:
-    "List directory 'root' appending the path separator to subdirs."
+    """List directory 'root' appending the path separator to subdirs.
+
+    Listings are kept until the directory at that path is another one
+    (after a ``%cd``, for a relative path) or its mtime changes.
+    """
+    root = os.path.abspath(os.path.expanduser(root))
+    try:
+        st = os.stat(root)
+    except OSError:
+        return []  # no need to report invalid paths
+    key = (st.st_dev, st.st_ino, st.st_mtime_ns)
+    cached = _cached_listing(root, key)
+    if cached is not None:
+        return cached[1]
     res = []
-    root = os.path.expanduser(root)
     try:
-        for name in os.listdir(root):
-            path = os.path.join(root, name)
-            if os.path.isdir(path):
-                name += os.sep
-            res.append(name)
-    except Exception:  # noqa: S110
-        pass  # no need to report invalid paths
+        with os.scandir(root) as entries:
+            for entry in entries:
+                name = entry.name
+                try:
+                    if entry.is_dir():
+                        name += os.sep
+                except OSError:
+                    pass
+                res.append(name)
+    except OSError:
+        return res
+    if (
+        time.time() - st.st_mtime_ns / 1e9 > _RACY_MTIME
+        and len(res) <= _MAX_LISTED_NAMES
+    ):
+        subdirs = frozenset(name[:-1] for name in res if name.endswith(os.sep))
+        with _listings_lock:
+            _listings[root] = (key, res, subdirs)
+            _listings.move_to_end(root)
+            names = sum(len(listing) for _, listing, _ in _listings.values())
+            while len(_listings) > _MAX_LISTINGS or names > _MAX_LISTED_NAMES:
+                names -= len(_listings.popitem(last=False)[1][1])
     return res
 
 
+def _cached_listing(
+    root: str, key: tuple[int, int, int]
+) -> tuple[tuple[int, int, int], list[str], frozenset[str]] | None:
+    """The cached listing of absolute path *root*, if it is still *key*."""
+    with _listings_lock:
+        cached = _listings.get(root)
+        if cached is None or cached[0] != key:
+            return None
+        _listings.move_to_end(root)
+        return cached
+
+
+def _isdir(path: str) -> bool:
+    """Whether *path* is a directory.
+
+    This uses the cached listing of its parent when there is one, and
+    ``os.path.isdir`` otherwise.
+    """
+    dirname, name = os.path.split(path.rstrip(os.sep) or path)
+    if name:
+        root = os.path.abspath(os.path.expanduser(dirname or "."))
+        try:
+            st = os.stat(root)
+        except OSError:
+            return False
+        cached = _cached_listing(root, (st.st_dev, st.st_ino, st.st_mtime_ns))
+        if cached is not None:
+            return name in cached[2]
+    return os.path.isdir(path)
+
+
 def _complete_path(path: Any = None) -> list[str]:
     """Perform completion of filesystem path.
     http://stackoverflow.com/questions/5637124/tab-completion-in-pythons-raw-input
     """
     if not path or path == ".":
-        return _listdir(".")
+        return list(_listdir("."))
     dirname, rest = os.path.split(path)
-    tmp = dirname if dirname else "."
-    res = []
-    for p in _listdir(tmp):
-        try:
-            if p.startswith(rest):
-                res.append(os.path.join(dirname, p))
-        except UnicodeDecodeError:
-            pass  # directory name does not allow join in Python 2.7
+    listing = _listdir(dirname or ".")
+    res = [os.path.join(dirname, p) for p in listing if p.startswith(rest)]
     # more than one match, or single match which does not exist (typo)
     if len(res) > 1 or not os.path.exists(path):
         return res
@@ -7,7 +7,7 @@ from typing import Any
 
 from pexpect import EOF
 
-from . import MetaKernel
+from . import MetaKernel, plain_text
 from .replwrap import REPLWrapper, bash
 
 __version__ = "0.0"
@@ -31,6 +31,7 @@ class TextOutput:
 
 class ProcessMetaKernel(MetaKernel):
     implementation = "process_kernel"
+    plain_text_types = {**MetaKernel.plain_text_types, TextOutput: plain_text}
     implementation_version = __version__
     language = "process"
     language_info: dict[str, Any] = {
@@ -99,8 +100,7 @@ class ProcessMetaKernel(MetaKernel):
                     self.wrapper.terminate()
                 except Exception:  # noqa: S110
                     pass
-            self.restart_kernel()
-            self.reload_magics()
+            self.restart_session()
             error = RuntimeError("End of File")
             tb = "End of File"
         except Exception as e:
@@ -0,0 +1,426 @@
+"""Lazy registry of the magics available to a MetaKernel.
+
+Magic files are read with :mod:`ast` instead of being imported, so the
+name and one-line summary of every magic are known at kernel startup while
+the module itself (and whatever it imports) is only loaded the first time
+one of its magics is actually needed.
+"""
+
+from __future__ import annotations
+
+import ast
+import glob
+import hashlib
+import importlib.machinery
+import itertools
+import json
+import os
+import threading
+from collections.abc import Callable, ItemsView, ValuesView
+from typing import Any
+
+from .magic import _trim
+
+MAGIC_TYPES = ("line", "cell")
+
+# Numbers every change of every MagicDict, see MagicDict.generation
+_generations = itertools.count(1)
+
+
+class MagicManifest:
+    """The magics a magic module registers, found without importing it.
+
+    ``magics`` maps each magic type ("line" or "cell") to a dict of magic
+    name to the first line of its docstring (or None if it has none).
+    ``digest`` is the hash of the source the manifest was read from.
+    """
+
+    def __init__(
+        self,
+        module: str,
+        path: str,
+        magics: dict[str, dict[str, str | None]],
+        digest: str | None = None,
+    ) -> None:
+        self.module = module
+        self.path = path
+        self.magics = magics
+        self.digest = digest
+
+    def __repr__(self) -> str:
+        return f"<MagicManifest {self.module} ({self.path})>"
+
+
+def find_magic_module(module: str) -> str | None:
+    """Return the source file that importing *module* would load, if any."""
+    spec = importlib.machinery.PathFinder.find_spec(module)
+    if spec is None or not spec.origin or not spec.origin.endswith(".py"):
+        return None
+    return spec.origin
+
+
+def read_manifest(module: str, path: str) -> MagicManifest | None:
+    """Read the manifest of the magic module *module* from *path*.
+
+    Returns None when the registered magics cannot be determined statically
+    (e.g. `register_magics` does more than call `kernel.register_magics`
+    with module-level classes); such modules have to be imported eagerly.
+    """
+    try:
+        with open(path, "rb") as f:
+            source = f.read()
+    except OSError:
+        return None
+    manifest = _manifest_from_tree(module, path, _parse(source, path))
+    if manifest is not None:
+        manifest.digest = hashlib.sha256(source).hexdigest()
+    return manifest
+
+
+def _parse(source: bytes, path: str) -> ast.Module | None:
+    try:
+        return ast.parse(source, path)
+    except (SyntaxError, ValueError):
+        return None
+
+
+def _manifest_from_tree(
+    module: str, path: str, tree: ast.Module | None
+) -> MagicManifest | None:
+    if tree is None:
+        return None
+
+    classes = {}
+    register = None
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            classes[node.name] = node
+        elif isinstance(node, ast.FunctionDef) and node.name == "register_magics":
+            register = node
+    if register is None:
+        return None
+
+    magics: dict[str, dict[str, str | None]] = {mtype: {} for mtype in MAGIC_TYPES}
+    registered = False
+    for stmt in register.body:
+        if _is_docstring(stmt):
+            continue
+        klass = _registered_class(stmt)
+        if klass is None or klass not in classes:
+            return None
+        if not _collect_magics(classes[klass], classes, magics):
+            return None
+        registered = True
+    if not registered:
+        return None
+    return MagicManifest(module, path, magics)
+
+
+def _defines_function(tree: ast.Module | None, name: str) -> bool:
+    if tree is None:
+        # Let the import report the problem
+        return True
+    return any(
+        isinstance(node, ast.FunctionDef) and node.name == name for node in tree.body
+    )
+
+
+def _is_docstring(stmt: ast.stmt) -> bool:
+    return (
+        isinstance(stmt, ast.Expr)
+        and isinstance(stmt.value, ast.Constant)
+        and isinstance(stmt.value.value, str)
+    )
+
+
+def _registered_class(stmt: ast.stmt) -> str | None:
+    """Return X for a `kernel.register_magics(X)` statement, else None."""
+    if not isinstance(stmt, ast.Expr) or not isinstance(stmt.value, ast.Call):
+        return None
+    call = stmt.value
+    if (
+        isinstance(call.func, ast.Attribute)
+        and call.func.attr == "register_magics"
+        and len(call.args) == 1
+        and not call.keywords
+        and isinstance(call.args[0], ast.Name)
+    ):
+        return call.args[0].id
+    return None
+
+
+def _collect_magics(
+    node: ast.ClassDef,
+    classes: dict[str, ast.ClassDef],
+    magics: dict[str, dict[str, str | None]],
+) -> bool:
+    """Add the magics defined by *node* and its local bases to *magics*.
+
+    Returns False if the class could define magics we can't see.
+    """
+    for base in node.bases:
+        if not isinstance(base, ast.Name):
+            return False
+        if base.id in classes:
+            if not _collect_magics(classes[base.id], classes, magics):
+                return False
+        elif base.id != "Magic":
+            return False
+
+    for item in node.body:
+        if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if item.name in ("get_magics", "__getattr__", "__dir__"):
+                return False
+            names = [(item.name, ast.get_docstring(item, clean=False))]
+        elif isinstance(item, ast.Assign):
+            names = [(t.id, None) for t in item.targets if isinstance(t, ast.Name)]
+        else:
+            continue
+        for name, doc in names:
+            for mtype in MAGIC_TYPES:
+                if name.startswith(mtype + "_"):
+                    summary = str(_trim(doc)).split("\n")[0] if doc else None
+                    magics[mtype][name[len(mtype) + 1 :]] = summary
+    return True
+
+
+class MagicDict(dict[str, Any]):
+    """A mapping of magic name to Magic instance that imports magics lazily.
+
+    Values may be a :class:`MagicManifest` placeholder until the magic is
+    looked up, at which point *loader* is called to import the module and
+    register its magics for real. Membership tests and iteration over the
+    names never import anything.
+
+    ``generation`` changes whenever a magic is set or removed, and differs
+    between instances, so that results that depend on the magics can tell
+    that they are stale.
+    """
+
+    def __init__(self, mtype: str, loader: Callable[[MagicManifest], None]) -> None:
+        super().__init__()
+        self.mtype = mtype
+        self._loader = loader
+        self.generation = next(_generations)
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        super().__setitem__(name, value)
+        self.generation = next(_generations)
+
+    def __delitem__(self, name: str) -> None:
+        super().__delitem__(name)
+        self.generation = next(_generations)
+
+    def __getitem__(self, name: str) -> Any:
+        value = super().__getitem__(name)
+        if isinstance(value, MagicManifest):
+            self._loader(value)
+            value = super().__getitem__(name)
+        return value
+
+    def get(self, name: str, default: Any = None) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def items(self) -> ItemsView[str, Any]:  # type:ignore[override]
+        self.load_all()
+        return super().items()
+
+    def values(self) -> ValuesView[Any]:  # type:ignore[override]
+        self.load_all()
+        return super().values()
+
+    def is_loaded(self, name: str) -> bool:
+        """Whether the magic *name* has been imported."""
+        return not isinstance(super().__getitem__(name), MagicManifest)
+
+    def load_all(self) -> None:
+        """Import every magic that is still a placeholder."""
+        for name in list(self):
+            self.get(name)
+
+    def summary(self, name: str) -> str:
+        """Return the first line of the help for magic *name*.
+
+        This is read from the manifest when the magic has not been imported.
+        """
+        value = super().__getitem__(name)
+        if isinstance(value, MagicManifest):
+            summary = value.magics[self.mtype].get(name)
+            if summary is not None:
+                return summary
+        return str(self[name].get_help(self.mtype, name).split("\n")[0])
+
+
+class MagicIndex:
+    """An on-disk cache of the manifests of magic files.
+
+    Entries are keyed by file path and validated by the file's mtime and
+    size, falling back to a hash of its content, so that only files that
+    changed since the index was written are read and parsed again.
+    """
+
+    version = 1
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.entries: dict[str, dict[str, Any]] = {}
+        self.dirty = False
+        self._seen: set[str] = set()
+        try:
+            with open(filename) as f:
+                data = json.load(f)
+            if data.get("version") == self.version:
+                self.entries = data["files"]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass  # start a fresh index
+
+    def _entry(self, path: str) -> dict[str, Any] | None:
+        self._seen.add(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        entry = self.entries.get(path)
+        if (
+            entry is not None
+            and entry.get("mtime") == stat.st_mtime_ns
+            and entry.get("size") == stat.st_size
+        ):
+            return entry
+
+        try:
+            with open(path, "rb") as f:
+                source = f.read()
+        except OSError:
+            return None
+        digest = hashlib.sha256(source).hexdigest()
+        if entry is None or entry.get("hash") != digest:
+            module = os.path.splitext(os.path.basename(path))[0]
+            tree = _parse(source, path)
+            manifest = _manifest_from_tree(module, path, tree)
+            entry = {
+                "hash": digest,
+                "magics": manifest.magics if manifest is not None else None,
+                "ipython_magics": _defines_function(tree, "register_ipython_magics"),
+            }
+        entry["mtime"] = stat.st_mtime_ns
+        entry["size"] = stat.st_size
+        self.entries[path] = entry
+        self.dirty = True
+        return entry
+
+    def get_manifest(self, module: str, path: str) -> MagicManifest | None:
+        """Return the manifest of *module* at *path*, like :func:`read_manifest`."""
+        entry = self._entry(path)
+        if entry is None or entry["magics"] is None:
+            return None
+        return MagicManifest(module, path, entry["magics"], entry["hash"])
+
+    def get_digest(self, path: str) -> str | None:
+        """Return the hash of the content of the file at *path*."""
+        entry = self._entry(path)
+        return None if entry is None else str(entry["hash"])
+
+    def has_ipython_magics(self, path: str) -> bool:
+        """Whether the file at *path* defines `register_ipython_magics`."""
+        entry = self._entry(path)
+        return entry is None or bool(entry["ipython_magics"])
+
+    def save(self, directories: list[str] | None = None) -> None:
+        """Write the index back to disk if anything changed.
+
+        Entries for files in *directories* that were not looked up since
+        the index was loaded are dropped, as those files no longer exist.
+        Entries from other directories are kept for other kernels, unless
+        the file is gone.
+        """
+        dirs = {os.path.abspath(d) for d in directories or []}
+        for path in list(self.entries):
+            if path not in self._seen and os.path.dirname(path) in dirs:
+                del self.entries[path]
+                self.dirty = True
+        if not self.dirty:
+            return
+        for path in list(self.entries):
+            if path not in self._seen and not os.path.exists(path):
+                del self.entries[path]
+        data = {"version": self.version, "files": self.entries}
+        tmp = f"{self.filename}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            # Atomic, so kernels sharing the index never read a partial file
+            os.replace(tmp, self.filename)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        self.dirty = False
+
+
+class MagicWatcher:
+    """Poll magic directories and call *callback* when a magic file changes.
+
+    The callback runs on the watcher's thread; kernels should use it to
+    schedule the actual reload on their IO loop.
+    """
+
+    def __init__(
+        self,
+        directories: list[str],
+        callback: Callable[[], None],
+        interval: float = 2.0,
+    ) -> None:
+        self.directories = list(directories)
+        self.callback = callback
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._snapshot = self.snapshot()
+
+    def snapshot(self) -> dict[str, tuple[int, int]]:
+        """Return the (mtime, size) of every magic file in the directories."""
+        result = {}
+        for directory in self.directories:
+            for path in glob.glob(os.path.join(directory, "*.py")):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                result[path] = (stat.st_mtime_ns, stat.st_size)
+        return result
+
+    def check(self) -> bool:
+        """Call the callback if anything changed since the last check."""
+        snapshot = self.snapshot()
+        if snapshot == self._snapshot:
+            return False
+        self._snapshot = snapshot
+        self.callback()
+        return True
+
+    def start(self) -> None:
+        """Start polling in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="metakernel-magic-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop polling."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.check()
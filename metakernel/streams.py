@@ -0,0 +1,240 @@
+"""Send stream output in fewer, larger iopub messages."""
+
+from __future__ import annotations
+
+import contextvars
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import IO
+
+CallLater = Callable[[float, Callable[[], None]], None]
+
+
+class StreamBuffer:
+    """Collect text written to stdout and stderr and send it in batches.
+
+    While the buffer is open (during a cell), text is passed to
+    *send(name, text)* once *max_size* characters are buffered, *interval*
+    seconds after the first buffered write, and before text for the other
+    stream or any other output (see :meth:`flush`). Closing the buffer
+    sends what is left; text written while it is closed is sent right away.
+
+    The interval is checked on each write, and once more by a timer that
+    *call_later(delay, callback)* sets: it must call *callback* after
+    *delay* seconds on the thread that owns the sockets (the kernel's IO
+    loop), and may be called from any thread. Timed flushes run in the
+    context that opened the buffer. Without *call_later*, buffered text
+    waits for the next write after the interval.
+
+    The kernel only holds text back in :meth:`batching` blocks, while its
+    IO loop is free for the timer; other writes are sent at once.
+
+    A cell can send at most *byte_limit* characters in *message_limit*
+    messages (0 for no limit). Text over the limit is dropped, written to
+    a file in *spill_dir* if given, and replaced by a summary and the last
+    *tail_size* characters when the buffer is closed.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, str], None],
+        interval: float = 0.05,
+        max_size: int = 65536,
+        tail_size: int = 1024,
+        call_later: CallLater | None = None,
+    ) -> None:
+        self.send = send
+        self.call_later = call_later
+        self.interval = interval
+        self.max_size = max_size
+        self.tail_size = tail_size
+        self.byte_limit = 0
+        self.message_limit = 0
+        self.spill_dir: str | None = None
+        #: The file that the dropped output of the last cell was written to
+        self.spill_file: str | None = None
+        self._lock = threading.RLock()
+        self._open = False
+        self._name: str | None = None
+        self._chunks: list[str] = []
+        self._size = 0
+        self._deadline: float | None = None
+        self._timer = False
+        self._context = contextvars.copy_context()
+        self._sent = 0
+        self._messages = 0
+        self._limited = False
+        self._dropped = 0
+        self._dropped_lines = 0
+        self._tail: list[tuple[str, str]] = []
+        self._spill: IO[str] | None = None
+
+    def open(
+        self,
+        interval: float | None = None,
+        byte_limit: int | None = None,
+        message_limit: int | None = None,
+        spill_dir: str | None = None,
+    ) -> None:
+        """Start a cell; an *interval* of 0 sends every write at once."""
+        with self._lock:
+            if interval is not None:
+                self.interval = interval
+            if byte_limit is not None:
+                self.byte_limit = byte_limit
+            if message_limit is not None:
+                self.message_limit = message_limit
+            self.spill_dir = spill_dir or None
+            self.spill_file = None
+            self._open = True
+            self._context = contextvars.copy_context()
+            self._sent = self._messages = 0
+            self._limited = False
+            self._dropped = self._dropped_lines = 0
+            self._tail = []
+
+    @contextmanager
+    def batching(self, interval: float) -> Iterator[None]:
+        """Hold text back for up to *interval* seconds while the block runs."""
+        with self._lock:
+            self.interval = interval
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.flush()
+                self.interval = 0
+
+    def close(self) -> None:
+        """Send the buffered text, and a summary of what was dropped."""
+        with self._lock:
+            self.flush()
+            if self._dropped:
+                self._send_summary()
+            self._open = False
+            self._limited = False
+
+    def write(self, name: str, text: str) -> None:
+        """Buffer *text* for the stream *name* ("stdout" or "stderr")."""
+        with self._lock:
+            if self._limited:
+                self._drop(name, text)
+                return
+            if name != self._name:
+                self.flush()
+                self._name = name
+            if self._open and self.byte_limit:
+                room = max(self.byte_limit - self._sent - self._size, 0)
+                if len(text) > room:
+                    self._limited = True
+                    text, rest = text[:room], text[room:]
+                    self._drop(name, rest)
+            if not text:
+                return
+            if not (self._open and self.interval > 0):
+                self._send(name, text)
+                return
+            self._chunks.append(text)
+            self._size += len(text)
+            if self._size >= self.max_size or (
+                self._deadline is not None and time.monotonic() >= self._deadline
+            ):
+                self.flush()
+            elif self._deadline is None:
+                self._deadline = time.monotonic() + self.interval
+                self._start_timer(self.interval)
+
+    def flush(self) -> None:
+        """Send the buffered text now."""
+        with self._lock:
+            self._deadline = None
+            if not self._chunks:
+                return
+            text = "".join(self._chunks)
+            self._chunks = []
+            self._size = 0
+            assert self._name is not None  # noqa: S101
+            self._send(self._name, text)
+
+    def _send(self, name: str, text: str) -> None:
+        self.send(name, text)
+        if self._open:
+            self._sent += len(text)
+            self._messages += 1
+            if self.message_limit and self._messages >= self.message_limit:
+                self._limited = True
+
+    def _drop(self, name: str, text: str) -> None:
+        """Account for *text* that is over the limit, keeping its tail."""
+        if not self._dropped and self.spill_dir:
+            try:
+                fd, self.spill_file = tempfile.mkstemp(
+                    prefix="metakernel-output-", suffix=".txt", dir=self.spill_dir
+                )
+                self._spill = os.fdopen(fd, "w")
+            except OSError:
+                self._spill = None
+        self._dropped += len(text)
+        self._dropped_lines += text.count("\n")
+        if self._spill is not None:
+            self._spill.write(text)
+        if self._tail and self._tail[-1][0] == name:
+            text = self._tail.pop()[1] + text
+        self._tail.append((name, text[-self.tail_size :]))
+        size = sum(len(chunk) for _, chunk in self._tail)
+        while size > self.tail_size:
+            first_name, first = self._tail.pop(0)
+            size -= len(first)
+            if size < self.tail_size:
+                first = first[size - self.tail_size :]
+                self._tail.insert(0, (first_name, first))
+                size += len(first)
+
+    def _send_summary(self) -> None:
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        tail = self._tail
+        kept = sum(len(text) for _, text in tail)
+        if kept < self._dropped and tail and "\n" in tail[0][1]:
+            # Start the tail at the beginning of a line
+            first_name, first = tail[0]
+            tail[0] = (first_name, first[first.index("\n") + 1 :])
+        shown = sum(len(text) for _, text in tail)
+        lines = self._dropped_lines - sum(text.count("\n") for _, text in tail)
+        summary = (
+            f"\n[Output limit reached: {self._dropped - shown} characters"
+            f" in {lines} lines were not shown."
+        )
+        if self.spill_file:
+            summary += f" The dropped output was written to {self.spill_file}."
+        if shown:
+            summary += " The output ends with:"
+        self.send("stderr", summary + "]\n")
+        for name, text in tail:
+            if text:
+                self.send(name, text)
+        self._tail = []
+        self._dropped = self._dropped_lines = 0
+
+    def _start_timer(self, delay: float) -> None:
+        if self._timer or self.call_later is None:
+            return
+        self._timer = True
+        context = self._context
+        self.call_later(delay, lambda: context.run(self._on_timer))
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = False
+            if self._deadline is None:
+                return
+            delay = self._deadline - time.monotonic()
+            if delay > 0:
+                self._start_timer(delay)
+            else:
+                self.flush()
@@ -1,5 +1,6 @@
 """A Python kernel for Jupyter."""
 
+from collections.abc import MutableMapping
 from typing import Any
 
 from IPython.core.inputtransformer2 import TransformerManager
@@ -39,6 +40,11 @@ class MetaKernelPython(MetaKernel):
         super().__init__(*args, **kwargs)
         self.transformer_manager = TransformerManager()  # type:ignore[no-untyped-call]
 
+    def start(self) -> None:
+        super().start()  # type:ignore[no-untyped-call]
+        # Load jedi while the first cell is typed
+        self.line_magics["python"].warm_up()
+
     def get_usage(self) -> str:
         return "This is MetaKernel Python. It implements a Python " + "interpreter."
 
@@ -49,6 +55,21 @@ class MetaKernelPython(MetaKernel):
         python_magic = self.line_magics["python"]
         python_magic.env[name] = value
 
+    def set_variables(self, variables: dict[str, Any]) -> None:
+        """
+        Set several variables in the kernel language.
+        """
+        python_magic = self.line_magics["python"]
+        python_magic.env.update(variables)
+
+    def del_variables(self, names: list[str]) -> None:
+        """
+        Remove variables from the kernel language.
+        """
+        python_magic = self.line_magics["python"]
+        for name in names:
+            python_magic.env.pop(name, None)
+
     def get_variable(self, name: str) -> Any:
         """
         Get a variable from the kernel language.
@@ -60,12 +81,15 @@ class MetaKernelPython(MetaKernel):
         python_magic = self.line_magics["python"]
         return python_magic.eval(code.strip())
 
-    def get_completions(self, info: dict[str, Any]) -> list[str]:
+    def get_completions(self, info: MutableMapping[str, Any]) -> list[str]:
         python_magic = self.line_magics["python"]
         return python_magic.get_completions(info)  # type:ignore[no-any-return]
 
     def get_kernel_help_on(
-        self, info: dict[str, Any], level: int = 0, none_on_fail: bool = False
+        self,
+        info: MutableMapping[str, Any],
+        level: int = 0,
+        none_on_fail: bool = False,
     ) -> str | None:
         python_magic = self.line_magics["python"]
         return python_magic.get_help_on(info, level, none_on_fail)  # type:ignore[no-any-return]
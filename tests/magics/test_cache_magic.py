@@ -0,0 +1,28 @@
+import asyncio
+
+from metakernel import MetaKernel
+from tests.utils import EvalKernel, clear_log_text, get_kernel, get_log_text
+
+
+def test_cache_magic() -> None:
+    kernel = get_kernel(EvalKernel)
+    for count in (1, 2):
+        kernel.execution_count = count
+        asyncio.run(kernel.do_execute(f"'result {count}'"))
+    clear_log_text(kernel)
+    asyncio.run(kernel.do_execute("%cache"))
+    text = get_log_text(kernel)
+    assert "2 of at most 1000 results" in text, text
+    assert "_1" in text and "_2" in text, text
+
+    asyncio.run(kernel.do_execute("%cache --clear"))
+    assert len(kernel.output_cache) == 0
+    assert "_1" not in kernel.line_magics["python"].env
+    assert "del_variables" not in get_log_text(kernel)
+
+
+def test_cache_magic_without_del_variables() -> None:
+    kernel = get_kernel(MetaKernel)
+    clear_log_text(kernel)
+    asyncio.run(kernel.do_execute("%cache"))
+    assert "doesn't implement del_variables" in get_log_text(kernel)
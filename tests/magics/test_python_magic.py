@@ -1,6 +1,9 @@
 import asyncio
+import sys
 import textwrap
+import unittest.mock
 
+from metakernel import MetaKernel
 from tests.utils import capture_send_messages, clear_log_text, get_kernel, get_log_text
 
 
@@ -206,3 +209,105 @@ def test_display_routes_to_parent_kernel() -> None:
     display_b = [c for msg_type, c in sent_b2 if msg_type == "display_data"]
     assert display_b, "expected display_data routed to kernel_b"
     assert display_b[0]["data"]["text/html"] == "<b>from b</b>"
+
+
+def _complete(kernel: MetaKernel, code: str) -> list[str]:
+    kernel.cache_completions = False
+    return asyncio.run(kernel.do_complete(code, len(code)))["matches"]  # type:ignore[no-any-return]
+
+
+def test_python_magic_completions_are_not_logged() -> None:
+    kernel = get_kernel()
+    clear_log_text(kernel)
+    assert "import" in _complete(kernel, "%python imp")
+    assert "import" not in get_log_text(kernel)
+
+
+def test_python_completer_large_namespace() -> None:
+    kernel = get_kernel()
+    magic = kernel.get_magic("%python")
+    magic.env.update({f"var{i}": i for i in range(1000)})  # type:ignore[attr-defined]
+    assert _complete(kernel, "%python var99") == ["var99", "var990", "var991"] + [
+        f"var99{i}" for i in range(2, 10)
+    ]
+    # Names that the code uses are still inferred
+    assert _complete(kernel, "%python var5.real.bit_l") == ["var5.real.bit_length"]
+
+
+def test_python_completer_keeps_attributes_until_execute() -> None:
+    kernel = get_kernel()
+    asyncio.run(kernel.do_execute("%python import os"))
+    completer = kernel.get_magic("%python").completer  # type:ignore[attr-defined]
+    assert "os.path" in _complete(kernel, "%python os.pa")
+    assert list(completer._attributes) == ["os"]
+    assert completer._state is not None
+    with unittest.mock.patch("jedi.Interpreter") as interpreter:
+        assert "os.pardir" in _complete(kernel, "%python os.par")
+    interpreter.assert_not_called()
+    # A name that the code assigns is inferred from the code
+    assert _complete(kernel, "%%python\nos = 3\nos.re") == ["os.real"]
+    asyncio.run(kernel.do_execute("%python os = 3"))
+    assert completer._attributes == {}
+    assert completer._state is None
+    assert _complete(kernel, "%python os.re") == ["os.real"]
+
+
+def test_python_completer_without_inference_state() -> None:
+    from jedi import Interpreter  # type:ignore[import-untyped]
+
+    class FreshInterpreter:
+        def __init__(self, code: str, namespaces: list[dict[str, object]]) -> None:
+            self.complete = Interpreter(code, namespaces).complete
+
+    kernel = get_kernel()
+    completer = kernel.get_magic("%python").completer  # type:ignore[attr-defined]
+    completer.reset()
+    with unittest.mock.patch("jedi.Interpreter", FreshInterpreter):
+        assert "import" in _complete(kernel, "%python imp")
+    assert completer._state is None
+
+
+def test_python_magic_warm_up() -> None:
+    kernel = get_kernel()
+    magic = kernel.get_magic("%python")
+    # The module that the magic was loaded from
+    python_magic = sys.modules[type(magic).__module__]
+    magic.warm_up()  # type:ignore[attr-defined]
+    thread = python_magic._warm_up_thread
+    assert thread is not None
+    thread.join(30)
+    magic.warm_up()  # type:ignore[attr-defined]
+    assert python_magic._warm_up_thread is thread
+
+
+def test_python_magic_help_cache() -> None:
+    kernel = get_kernel()
+    asyncio.run(kernel.do_execute("%python import collections"))
+    magic = kernel.get_magic("%python")
+    with unittest.mock.patch("pydoc.render_doc", return_value="rendered") as render:
+        # The docstring is returned without rendering the full help
+        help_text = kernel.get_help_on("%python collections.OrderedDict")
+        assert help_text == magic.env["collections"].OrderedDict.__doc__  # type:ignore[attr-defined]
+        render.assert_not_called()
+        for code in ["%python collections.OrderedDict", "%python x = collections"]:
+            assert kernel.get_help_on(code, 1) == "rendered"
+            assert kernel.get_help_on(code, 1) == "rendered"
+        assert render.call_count == 2
+        # A name that is set again, without running code, resolves again
+        magic.env["collections"] = sys  # type:ignore[attr-defined]
+        kernel.get_help_on("%python collections", 1)
+        assert render.call_args.args[0] is sys
+        # Running code forgets what was rendered
+        asyncio.run(kernel.do_execute("%python pass"))
+        kernel.get_help_on("%python collections", 1)
+        assert render.call_count == 4
+
+
+def test_python_magic_help_objects_are_bounded() -> None:
+    kernel = get_kernel()
+    asyncio.run(kernel.do_execute("%python import os"))
+    magic = kernel.get_magic("%python")
+    magic.help_cache_size = 2  # type:ignore[attr-defined]
+    for name in ["os.path", "os.sep", "os", "os.path"]:
+        kernel.get_help_on(f"%python {name}")
+    assert list(magic._help_objects) == ["os", "os.path"]  # type:ignore[attr-defined]
@@ -0,0 +1,134 @@
+import json
+import os
+
+import pytest
+
+from metakernel import benchmark
+
+# Tests that compare wall-clock times, which vary on loaded machines
+timed = pytest.mark.skipif(
+    not os.environ.get("METAKERNEL_BENCHMARK"),
+    reason="timing test; set METAKERNEL_BENCHMARK=1 to run it",
+)
+
+
+def test_measure_startup() -> None:
+    result = benchmark.measure_startup("metakernel_python:MetaKernelPython")
+    assert "error" not in result
+    assert set(result["imports"]) == {
+        "metakernel",
+        "metakernel._metakernel",
+        "metakernel_python",
+    }
+    assert result["total"] >= result["construction"] > 0
+    for phase in ("kernel_init", "comm_registration", "parser", "reload_magics"):
+        assert phase in result["phases"]
+    assert "python_magic" in result["magic_modules"]
+    assert result["heavy_modules"] == []
+
+
+def test_import_heavy_modules() -> None:
+    """`from metakernel import MetaKernel` must not import heavy optional dependencies."""
+    result = benchmark.measure_import()
+    assert result["heavy_modules"] == []
+    assert result["seconds"] > 0
+
+
+@timed
+def test_import_time_budget() -> None:
+    result = benchmark.measure_import()
+    assert result["seconds"] < benchmark.IMPORT_BUDGET
+
+
+def test_measure_startup_error() -> None:
+    result = benchmark.measure_startup("metakernel_python:NoSuchKernel")
+    assert "AttributeError" in result["error"]
+
+
+def test_kernel_not_installed(tmp_path, monkeypatch) -> None:
+    # A directory named like the kernel is imported as a namespace package
+    (tmp_path / "not_installed_kernel").mkdir()
+    monkeypatch.chdir(tmp_path)
+    kernel = "not_installed_kernel:Kernel"
+    for result in (
+        benchmark.measure_startup(kernel),
+        benchmark.measure_startup("no_such_module:Kernel"),
+        benchmark.measure_completion(kernel, repeat=1),
+    ):
+        assert "error" not in result
+        assert "is not installed" in result["skipped"]
+    [result] = benchmark.benchmark([kernel], repeat=2)
+    assert result == {"kernel": kernel, "skipped": result["skipped"]}
+
+
+def test_kernel_with_broken_import(tmp_path, monkeypatch) -> None:
+    (tmp_path / "broken_kernel.py").write_text("import no_such_dependency\n")
+    monkeypatch.chdir(tmp_path)
+    for result in (
+        benchmark.measure_startup("broken_kernel:Kernel"),
+        benchmark.measure_completion("broken_kernel:Kernel", repeat=1),
+    ):
+        assert "skipped" not in result
+        assert "no_such_dependency" in result["error"]
+
+
+def test_main_budget(capsys) -> None:
+    kernel = "metakernel_python:MetaKernelPython"
+    assert benchmark.main([kernel, "--repeat", "1"]) == 0
+    report = json.loads(capsys.readouterr().out)
+    [result] = report["kernels"]
+    assert result["kernel"] == kernel
+    assert len(result["runs"]) == 1
+    assert report["over_budget"] == []
+
+    assert benchmark.main([kernel, "--repeat", "1", "--budget", "0"]) == 1
+    report = json.loads(capsys.readouterr().out)
+    # The import budget is absolute, so it may be exceeded on slow machines
+    imports = report["import"]
+    over_import = (
+        imports["seconds"] > benchmark.IMPORT_BUDGET or imports["heavy_modules"]
+    )
+    assert report["over_budget"] == ["metakernel"] * bool(over_import) + [kernel]
+
+
+def test_main_budget_unmeasured_kernels(tmp_path, monkeypatch, capsys) -> None:
+    (tmp_path / "not_installed_kernel").mkdir()
+    monkeypatch.chdir(tmp_path)
+    broken = "metakernel_python:NoSuchKernel"
+    missing = "not_installed_kernel:Kernel"
+    budget = ["--repeat", "1", "--budget", "100"]
+    assert benchmark.main([broken, missing, *budget]) == 1
+    over_budget = json.loads(capsys.readouterr().out)["over_budget"]
+    assert over_budget[-2:] == [broken, missing]
+    benchmark.main([broken, missing, *budget, "--allow-skipped"])
+    over_budget = json.loads(capsys.readouterr().out)["over_budget"]
+    assert over_budget[-1] == broken
+    assert missing not in over_budget
+
+
+def test_completion_corpus() -> None:
+    for size in benchmark.COMPLETION_SIZES:
+        corpus = benchmark.completion_corpus(size)
+        assert corpus == benchmark.completion_corpus(size)
+        for code, cursor_pos in corpus.values():
+            assert size - 100 < len(code) < size + 100
+            assert code[cursor_pos - 3 : cursor_pos] == "res"
+
+
+@timed
+def test_completion_time_is_flat() -> None:
+    """Completing in a 1M character cell takes about as long as in a 1k one."""
+    result = benchmark.measure_completion("metakernel:MetaKernel", repeat=3)
+    assert "error" not in result
+    assert set(result) == {"end", "middle", "magic"}
+    smallest, largest = min(benchmark.COMPLETION_SIZES), max(benchmark.COMPLETION_SIZES)
+    for case, times in result.items():
+        assert set(times) == set(benchmark.COMPLETION_SIZES)
+        assert times[largest] < 5 * times[smallest] + 0.005, case
+
+
+def test_main_completion(capsys) -> None:
+    kernel = "metakernel:MetaKernel"
+    assert benchmark.main([kernel, "--repeat", "1", "--completion"]) == 0
+    [result] = json.loads(capsys.readouterr().out)["kernels"]
+    assert set(result["completion"]) == {"end", "middle", "magic"}
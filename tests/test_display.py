@@ -1,3 +1,4 @@
+import struct
 import unittest.mock
 from unittest.mock import MagicMock, patch
 
@@ -102,3 +103,48 @@ def test_clear_output_without_kernel_passes_kwargs() -> None:
     with patch("metakernel.display.ipclear_output") as mock_clear:
         display_module.clear_output(wait=True)
         mock_clear.assert_called_once_with(wait=True)
+
+
+def _png(width: int, height: int) -> bytes:
+    header = struct.pack(">II", width, height) + b"\x08\x06\x00\x00\x00"
+    return (
+        display_module.PNG_SIGNATURE
+        + struct.pack(">I", len(header))
+        + b"IHDR"
+        + header
+        + b"\x00" * 4
+    )
+
+
+def test_binary_display_data_png() -> None:
+    png = _png(3, 2)
+    data, metadata, buffers = display_module.binary_display_data(png)
+    assert data == {"text/plain": "<PNG image, 3x2>"}
+    assert metadata == {"buffer_paths": [["image/png"]]}
+    assert [bytes(buffer) for buffer in buffers] == [png]
+
+
+def test_binary_display_data_repr_png() -> None:
+    image = MagicMock(spec=["_repr_png_"])
+    image._repr_png_.return_value = _png(1, 1)
+    data, _, buffers = display_module.binary_display_data(image)
+    assert data == {"text/plain": "<PNG image, 1x1>"}
+    assert bytes(buffers[0]) == _png(1, 1)
+
+
+def test_binary_display_data_ndarray() -> None:
+    np = pytest.importorskip("numpy")
+    array = np.arange(6, dtype="int32").reshape(2, 3).T
+    data, metadata, buffers = display_module.binary_display_data(array)
+    mimetype = display_module.NDARRAY_MIMETYPE
+    assert data[mimetype] == {"dtype": "int32", "shape": [3, 2]}
+    assert metadata == {"buffer_paths": [[mimetype, "buffer"]]}
+    restored = np.frombuffer(buffers[0], dtype="int32").reshape(3, 2)
+    assert (restored == array).all()
+
+
+def test_binary_display_data_rejects_other_objects() -> None:
+    with pytest.raises(TypeError):
+        display_module.binary_display_data(b"not a png")
+    with pytest.raises(TypeError):
+        display_module.binary_display_data("text")
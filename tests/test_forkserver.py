@@ -0,0 +1,164 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest.mock
+
+import comm
+import pytest
+
+from metakernel import MetaKernel
+from metakernel.forkserver import (
+    ForkServer,
+    default_socket_path,
+    kernel_name,
+    launcher_argv,
+    main,
+    request_kernel,
+)
+from tests.test_registry import LAZY_MAGIC, _write_magic
+from tests.utils import EvalKernel, get_kernel
+
+pytestmark = pytest.mark.skipif(
+    sys.platform == "win32", reason="Fork servers need os.fork"
+)
+
+
+class ExitKernel:
+    """Stands in for a kernel class: writes its cwd and argv, then exits."""
+
+    prewarmed = False
+
+    @classmethod
+    def prewarm(cls) -> None:
+        cls.prewarmed = True
+
+    @classmethod
+    def run_as_main(cls) -> None:
+        with open(sys.argv[1], "w") as f:
+            f.write(f"{os.getcwd()}\n{' '.join(sys.argv[2:])}")
+        sys.exit(3)
+
+
+def test_kernel_name() -> None:
+    assert kernel_name(EvalKernel) == "tests.utils:EvalKernel"
+
+
+def test_launcher_argv() -> None:
+    argv = ["python", "-m", "my_kernel", "-f", "{connection_file}"]
+    assert launcher_argv(argv, "my_kernel:MyKernel") == [
+        "python",
+        "-m",
+        "metakernel.forkserver",
+        "my_kernel:MyKernel",
+        "-f",
+        "{connection_file}",
+    ]
+    assert launcher_argv(["my-kernel", "{connection_file}"], "my_kernel:K")[-2:] == [
+        "-f",
+        "{connection_file}",
+    ]
+
+
+def test_default_socket_path() -> None:
+    with tempfile.TemporaryDirectory() as td:
+        runtime_dir = os.path.join(td, "runtime")
+        with unittest.mock.patch.dict(os.environ, {"JUPYTER_RUNTIME_DIR": runtime_dir}):
+            path = default_socket_path("my_kernel:MyKernel")
+        assert path == os.path.join(runtime_dir, "metakernel-my_kernel.MyKernel.sock")
+        assert os.path.isdir(runtime_dir)
+
+
+def test_request_kernel_without_server() -> None:
+    with tempfile.TemporaryDirectory() as td:
+        assert request_kernel(["-f", "x.json"], os.path.join(td, "s.sock")) is None
+
+
+def test_main_falls_back_to_starting_kernel() -> None:
+    with (
+        tempfile.TemporaryDirectory() as td,
+        unittest.mock.patch("os.execv") as execv,
+    ):
+        socket_path = os.path.join(td, "s.sock")
+        main(["--socket", socket_path, "my_kernel:MyKernel", "-f", "x.json"])
+    executable, argv = execv.call_args[0]
+    assert executable == sys.executable
+    assert argv[2] == "from my_kernel import MyKernel; MyKernel.run_as_main()"
+    assert argv[3:] == ["-f", "x.json"]
+
+
+def test_main_requires_kernel() -> None:
+    with pytest.raises(SystemExit) as exc:
+        main(["-f", "x.json"])
+    assert "module:Class" in str(exc.value.code)
+
+
+def test_fork_server_starts_kernel() -> None:
+    with tempfile.TemporaryDirectory() as td:
+        server = ForkServer(ExitKernel, os.path.join(td, "s.sock"))
+        server.bind()
+        server.prepare()
+        assert ExitKernel.prewarmed
+
+        def accept_one() -> None:
+            assert server._listener is not None
+            conn, _ = server._listener.accept()
+            server.handle(conn)
+
+        thread = threading.Thread(target=accept_one)
+        thread.start()
+        output = os.path.join(td, "output")
+        forked = request_kernel([output, "-f", "x.json"], server.socket_path)
+        thread.join()
+        assert forked is not None
+        assert forked.wait() == 3
+        os.waitpid(forked.pid, 0)
+        server.reap()
+        server.close()
+
+        with open(output) as f:
+            assert f.read() == f"{os.getcwd()}\n-f x.json"
+        assert not server.children
+        assert not os.path.exists(server.socket_path)
+
+
+def test_fork_server_refuses_running_server() -> None:
+    with tempfile.TemporaryDirectory() as td:
+        server = ForkServer(ExitKernel, os.path.join(td, "s.sock"))
+        server.bind()
+        try:
+            with pytest.raises(RuntimeError):
+                ForkServer(ExitKernel, server.socket_path).bind()
+        finally:
+            server.close()
+        # A stale socket is replaced
+        with open(server.socket_path, "w"):
+            pass
+        server.bind()
+        server.close()
+
+
+def test_prewarm_leaves_no_kernel_behind() -> None:
+    create_comm = comm.create_comm
+    meta_kernel = MetaKernel.meta_kernel
+    EvalKernel.prewarm()
+    assert comm.create_comm is create_comm
+    assert MetaKernel.meta_kernel is meta_kernel
+
+
+def test_unchanged_magic_module_is_not_executed_again() -> None:
+    with tempfile.TemporaryDirectory() as local_magics_dir:
+        _write_magic(local_magics_dir, "lazy_prewarm_magic", LAZY_MAGIC)
+        with unittest.mock.patch(
+            "metakernel._metakernel.get_local_magics_dir",
+            return_value=local_magics_dir,
+        ):
+            kernel = get_kernel()
+            kernel.line_magics["lazy_test"]
+            module = sys.modules["lazy_prewarm_magic"]
+            os.environ.pop("LAZY_TEST_MAGIC_IMPORTED", None)
+
+            kernel = get_kernel()
+            assert kernel.line_magics["lazy_test"].kernel is kernel
+        assert sys.modules["lazy_prewarm_magic"] is module
+        assert "LAZY_TEST_MAGIC_IMPORTED" not in os.environ
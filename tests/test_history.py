@@ -0,0 +1,90 @@
+import json
+import os
+import sqlite3
+from typing import Any
+
+import pytest
+
+from metakernel.history import HistoryStore
+
+
+def test_store_and_tail(tmp_path: Any) -> None:
+    store = HistoryStore(str(tmp_path / "history.sqlite"))
+    for line, source in enumerate(["a = 1", "b = 2", "a = 1", "c"], 1):
+        store.store(line, source)
+    session = store.session
+    assert store.tail(2) == [(session, 3, "a = 1"), (session, 4, "c")]
+    assert store.tail(10, unique=True) == [
+        (session, 2, "b = 2"),
+        (session, 3, "a = 1"),
+        (session, 4, "c"),
+    ]
+
+
+def test_range_and_sessions(tmp_path: Any) -> None:
+    path = str(tmp_path / "history.sqlite")
+    first = HistoryStore(path)
+    for line in range(1, 5):
+        first.store(line, f"x{line}")
+    second = HistoryStore(path)
+    assert second.range(-1, 2, 4) == [
+        (first.session, 2, "x2"),
+        (first.session, 3, "x3"),
+    ]
+    assert second.range() == []
+    second.store(1, "y")
+    assert second.range() == [(second.session, 1, "y")]
+    # Kernels see each other's cells
+    assert [row[2] for row in first.tail(2)] == ["x4", "y"]
+    first.close()
+    second.close()
+
+
+def test_search(tmp_path: Any) -> None:
+    store = HistoryStore(str(tmp_path / "history.sqlite"))
+    for line, source in enumerate(["%cd ~", "print(1)", "%cd /tmp", "%cd ~"], 1):
+        store.store(line, source)
+    assert [row[2] for row in store.search("%cd*")] == ["%cd ~", "%cd /tmp", "%cd ~"]
+    assert [row[2] for row in store.search("%cd*", n=1)] == ["%cd ~"]
+    assert [row[2] for row in store.search("%cd*", unique=True)] == [
+        "%cd /tmp",
+        "%cd ~",
+    ]
+
+
+def test_import_json(tmp_path: Any) -> None:
+    with open(tmp_path / "history.json", "w") as fid:
+        json.dump(["old 1", "old 2"], fid)
+    store = HistoryStore(str(tmp_path / "history.sqlite"))
+    assert [row[1:] for row in store.tail(10)] == [(1, "old 1"), (2, "old 2")]
+    assert not os.path.exists(tmp_path / "history.json")
+    store.close()
+    assert len(HistoryStore(str(tmp_path / "history.sqlite")).tail(10)) == 2
+
+
+def test_new_session(tmp_path: Any) -> None:
+    store = HistoryStore(str(tmp_path / "history.sqlite"))
+    store.store(1, "a")
+    first = store.session
+    store.new_session()
+    store.store(1, "b")
+    assert store.session == first + 1
+    assert store.range() == [(first + 1, 1, "b")]
+    assert store.range(-1) == [(first, 1, "a")]
+    store.close()
+
+
+def test_locked_database(tmp_path: Any) -> None:
+    path = str(tmp_path / "history.sqlite")
+    other = HistoryStore(path)
+    other.store(1, "a")
+    store = HistoryStore(path)
+    store.store(1, "b")
+    other.db.execute("BEGIN IMMEDIATE")
+    with pytest.raises(sqlite3.OperationalError):
+        store.store(2, "c")
+    other.db.execute("ROLLBACK")
+    store.store(2, "c")
+    assert [row[2] for row in store.range()] == ["b", "c"]
+    other.close()
+    store.close()
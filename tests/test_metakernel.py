@@ -1,18 +1,24 @@
 import asyncio
 import os
 import re
+import signal
 import sys
 import tempfile
+import threading
+import time
 import unittest.mock
+from collections.abc import Callable, MutableMapping
 from typing import Any
 
 import pytest
 import zmq
+from ipykernel.kernelbase import Kernel
 from traitlets.config import LoggingConfigurable
 
 from metakernel import ExceptionWrapper, Magic, MetaKernel
 from tests.utils import (
     EvalKernel,
+    capture_send_messages,
     clear_log_text,
     get_kernel,
     get_log,
@@ -194,7 +200,7 @@ def test_magic_complete_trailing_dash() -> None:
         def line_option_magic(self, arg: str = "") -> None:
             """A magic with option completions."""
 
-        def get_completions(self, info: dict[str, Any]) -> list[str]:
+        def get_completions(self, info: MutableMapping[str, Any]) -> list[str]:
             options = ["opt1", "opt2"]
             return [o for o in options if o.startswith(info["obj"])]
 
@@ -209,22 +215,87 @@ def test_magic_complete_trailing_dash() -> None:
     assert comp["matches"] == ["opt1", "opt2"], comp
 
 
-def test_history() -> None:
+class _TrackedStr(str):
+    """Counts the characters copied out of it by slicing or splitting."""
+
+    copied = 0
+
+    def __getitem__(self, key: Any) -> str:
+        value = super().__getitem__(key)
+        self.copied += len(value)
+        return value
+
+    def _copy_all(self, name: str, *args: Any) -> Any:
+        self.copied += len(self)
+        return getattr(super(), name)(*args)
+
+    def splitlines(self, keepends: bool = False) -> list[str]:
+        return self._copy_all("splitlines", keepends)  # type: ignore[no-any-return]
+
+    def strip(self, chars: str | None = None) -> str:
+        return self._copy_all("strip", chars)  # type: ignore[no-any-return]
+
+    def lstrip(self, chars: str | None = None) -> str:
+        return self._copy_all("lstrip", chars)  # type: ignore[no-any-return]
+
+    def rstrip(self, chars: str | None = None) -> str:
+        return self._copy_all("rstrip", chars)  # type: ignore[no-any-return]
+
+
+def test_magic_cell_complete_copies_the_line_only() -> None:
+    """Completing in a cell magic's block parses it in place."""
+
+    class NameMagic(Magic):
+        def cell_names(self) -> None:
+            """%%names - a cell magic with completions."""
+
+        def get_completions(self, info: MutableMapping[str, Any]) -> list[str]:
+            return [n for n in ("result", "rest") if n.startswith(info["obj"])]
+
+    kernel = get_kernel()
+    kernel.register_magics(NameMagic)
+    kernel.cache_completions = False
+    body = "result = compute(alpha, beta)\n" * 10_000
+    for prefix in ("%%names\n", "%%names\n%%names --x\n"):
+        code = _TrackedStr(prefix + body + "x = res")
+        comp = asyncio.run(kernel.do_complete(code, len(code)))
+        assert comp["matches"] == ["rest", "result"], comp
+        assert comp["cursor_start"] == len(code) - 3, comp
+        assert code.copied < 200, code.copied
+
+
+def test_history(tmp_path: Any) -> None:
     kernel = get_kernel()
+    kernel.hist_file = str(tmp_path / "history.sqlite")
+    kernel.execution_count = 1
     asyncio.run(kernel.do_execute("!ls", False))
+    kernel.execution_count = 2
     asyncio.run(kernel.do_execute("%cd ~", False))
     asyncio.run(kernel.do_shutdown(False))
 
-    with open(kernel.hist_file, "rb") as fid:
-        text = fid.read().decode("utf-8", "replace")
+    kernel = get_kernel()
+    kernel.hist_file = str(tmp_path / "history.sqlite")
+    reply = asyncio.run(kernel.do_history("tail", False, True, n=10))
+    assert [entry[1:] for entry in reply["history"]] == [(1, "!ls"), (2, "%cd ~")]
+    reply = asyncio.run(kernel.do_history("search", True, True, pattern="%cd*"))
+    assert [entry[2] for entry in reply["history"]] == [("%cd ~", None)]
+    reply = asyncio.run(kernel.do_history("range", False, True, session=-1, start=2))
+    assert [entry[2] for entry in reply["history"]] == ["%cd ~"]
 
-    assert "!ls" in text
-    assert "%cd" in text
 
+def test_history_after_restart(tmp_path: Any) -> None:
     kernel = get_kernel()
-    asyncio.run(kernel.do_history(None, None, None))
-    assert "!ls" in "".join(kernel.hist_cache)
-    assert "%cd" in "".join(kernel.hist_cache)
+    kernel.hist_file = str(tmp_path / "history.sqlite")
+    kernel.execution_count = 1
+    asyncio.run(kernel.do_execute("a = 1", False))
+    kernel.restart_session()
+    kernel.execution_count = 1
+    asyncio.run(kernel.do_execute("b = 2", False))
+    reply = asyncio.run(kernel.do_history("range", False, True, session=0))
+    assert [entry[2] for entry in reply["history"]] == ["b = 2"]
+    reply = asyncio.run(kernel.do_history("range", False, True, session=-1))
+    assert [entry[2] for entry in reply["history"]] == ["a = 1"]
+    asyncio.run(kernel.do_shutdown(False))
 
 
 def test_sticky_magics() -> None:
@@ -240,6 +311,26 @@ def test_sticky_magics() -> None:
     assert "html removed from session magics" in text
 
 
+def test_sticky_magics_with_stacked_magics() -> None:
+    kernel = get_kernel(EvalKernel)
+    asyncio.run(kernel.do_execute("%%%python\nx = 1", None))
+    asyncio.run(kernel.do_execute("%%time\nx + 41", None))
+    text = get_log_text(kernel)
+    assert "42" in text
+    assert "Time:" in text
+
+
+def test_magic_changing_its_code_is_parsed_again() -> None:
+    kernel = get_kernel(EvalKernel)
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+        f.write("y = 6 * 7\n")
+    try:
+        asyncio.run(kernel.do_execute(f"%include {f.name}\n%%python\ny", None))
+    finally:
+        os.remove(f.name)
+    assert "42" in get_log_text(kernel)
+
+
 def test_shell_partial_quote() -> None:
     kernel = get_kernel()
     asyncio.run(kernel.do_execute('%cd "/home/', False))
@@ -663,6 +754,109 @@ class TestPostExecuteSilent:
         assert kernel.kernel_resp["status"] == "error"
 
 
+class TestHistoryVariables:
+    def test_set_in_one_batch(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        kernel.execution_count = 3
+        with unittest.mock.patch.object(kernel, "set_variables") as mock_set:
+            asyncio.run(kernel.post_execute(42, "code", silent=True))
+        mock_set.assert_called_once()
+        variables = mock_set.call_args.args[0]
+        assert variables["_"] == variables["_3"] == 42
+        assert variables["_i"] == variables["_i3"] == "code"
+        assert set(variables) == {"_iii", "_ii", "_i", "_i3", "___", "__", "_", "_3"}
+
+    def test_set_variables_defaults_to_set_variable(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        kernel.set_variables({"a": 1, "b": 2})
+        assert kernel.get_variable("a") == 1
+        assert kernel.get_variable("b") == 2
+
+    def test_lazy(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        kernel.lazy_history_variables = True
+        with unittest.mock.patch.object(
+            kernel, "set_variables", wraps=kernel.set_variables
+        ) as mock_set:
+            asyncio.run(kernel.do_execute("1 + 1"))
+            mock_set.assert_not_called()
+            asyncio.run(kernel.do_execute("_ * 2"))
+            mock_set.assert_called_once_with({"_": 2})
+            mock_set.reset_mock()
+            asyncio.run(kernel.do_execute("%get _ii"))
+            mock_set.assert_called_once_with({"_ii": "1 + 1"})
+        assert kernel.history_variables["__"] == 4
+
+    def test_lazy_inputs_are_bounded(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        kernel.lazy_history_variables = True
+        kernel.max_hist_cache = 2
+        for count in range(1, 6):
+            kernel.execution_count = count
+            asyncio.run(kernel.do_execute(str(count)))
+        inputs = [name for name in kernel.history_variables if name[2:].isdigit()]
+        assert sorted(inputs) == ["_i4", "_i5"]
+
+    def test_output_cache(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        kernel.output_cache_size = 2
+        env = kernel.line_magics["python"].env
+        for count in (1, 2):
+            kernel.execution_count = count
+            asyncio.run(kernel.do_execute(str(count)))
+        kernel.execution_count = 3
+        asyncio.run(kernel.do_execute("_1 + 2"))
+        assert list(kernel.output_cache) == [1, 3]
+        assert "_2" not in env
+        assert env["_1"] == 1
+        assert env["_3"] == 3
+
+    def test_output_cache_lazy(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        kernel.output_cache_size = 1
+        kernel.lazy_history_variables = True
+        env = kernel.line_magics["python"].env
+        kernel.execution_count = 1
+        asyncio.run(kernel.do_execute("1"))
+        kernel.execution_count = 2
+        asyncio.run(kernel.do_execute("_1 + 1"))
+        # _1 was set for cell 2, and removed when cell 2 replaced it
+        assert "_1" not in env
+        assert "_1" not in kernel.history_variables
+        kernel.execution_count = 3
+        with unittest.mock.patch.object(
+            kernel, "del_variables", wraps=kernel.del_variables
+        ) as mock_del:
+            asyncio.run(kernel.do_execute("3"))
+        # _2 was never set in the kernel language
+        mock_del.assert_not_called()
+        assert "_2" not in kernel.history_variables
+        assert kernel.history_variables["_3"] == 3
+
+    def test_output_cache_disabled(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        kernel.output_cache_size = 0
+        with unittest.mock.patch.object(kernel, "set_variables") as mock_set:
+            asyncio.run(kernel.post_execute(42, "code", silent=True))
+        assert "_0" not in mock_set.call_args.args[0]
+        assert len(kernel.output_cache) == 0
+
+    def test_history_names(self) -> None:
+        from metakernel._metakernel import _HISTORY_NAME
+
+        code = "_ + __ + ___ + _i + _ii + _iii + _i12 + _7 + a_1 + x._2 + _a + ____"
+        assert _HISTORY_NAME.findall(code) == [
+            "_",
+            "__",
+            "___",
+            "_i",
+            "_ii",
+            "_iii",
+            "_i12",
+            "_7",
+        ]
+
+
 class TestDoExecute:
     def test_page_guiref_early_return(self) -> None:
         """Code containing _usage.page_guiref returns immediately without executing."""
@@ -691,6 +885,13 @@ class TestDoExecute:
         asyncio.run(kernel.do_execute("1 + 1", silent=False, store_history=True))
         assert "1 + 1" in kernel.hist_cache
 
+    def test_hist_cache_is_bounded(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        kernel.max_hist_cache = 3
+        for i in range(5):
+            asyncio.run(kernel.do_execute(str(i), silent=True))
+        assert kernel.hist_cache == ["2", "3", "4"]
+
     def test_cell_help_magic_uses_level_1(self) -> None:
         """Cell-level help (cd??) passes level=1 to get_help_on."""
         kernel = get_kernel(EvalKernel)
@@ -740,6 +941,16 @@ class TestDoExecute:
         assert resp["evalue"] == "kernel blew up"
 
 
+def test_do_execute_skips_path_completion() -> None:
+    kernel = get_kernel(EvalKernel)
+    with unittest.mock.patch.object(
+        kernel.parser, "_get_path_matches"
+    ) as get_path_matches:
+        asyncio.run(kernel.do_execute("%%python\nx = '/usr/bi'", False))
+        asyncio.run(kernel.do_execute("y = '/usr/bi'", False))
+    get_path_matches.assert_not_called()
+
+
 class TestDoShutdown:
     def test_no_hist_file_skips_file_write(self) -> None:
         """When hist_file is falsy, do_shutdown does not attempt to write a file."""
@@ -749,19 +960,56 @@ class TestDoShutdown:
         resp = asyncio.run(kernel.do_shutdown(False))
         assert resp == {"status": "ok", "restart": False}
 
-    def test_restart_true_calls_restart_kernel_and_reload_magics(self) -> None:
-        """With restart=True, restart_kernel() and reload_magics() are both called."""
+    def test_restart_true_calls_restart_kernel_and_reset_magics(self) -> None:
+        """With restart=True, restart_kernel() and reset_magics() are called."""
         kernel = get_kernel(EvalKernel)
         kernel.hist_file = ""
         with (
             unittest.mock.patch.object(kernel, "restart_kernel") as mock_restart,
+            unittest.mock.patch.object(kernel, "reset_magics") as mock_reset,
             unittest.mock.patch.object(kernel, "reload_magics") as mock_reload,
         ):
             resp = asyncio.run(kernel.do_shutdown(True))
         mock_restart.assert_called_once()
-        mock_reload.assert_called_once()
+        mock_reset.assert_called_once()
+        mock_reload.assert_not_called()
         assert resp == {"status": "ok", "restart": True}
 
+    def test_restart_without_fast_restart_reloads_magics(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        kernel.hist_file = ""
+        kernel.fast_restart = False
+        with (
+            unittest.mock.patch.object(kernel, "restart_kernel") as mock_restart,
+            unittest.mock.patch.object(kernel, "reload_magics") as mock_reload,
+        ):
+            asyncio.run(kernel.do_shutdown(True))
+        mock_restart.assert_called_once()
+        mock_reload.assert_called_once_with(reset=True)
+
+    def test_restart_keeps_magics_unless_they_reset(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        kernel.hist_file = ""
+        shell = kernel.line_magics["shell"]
+        python = kernel.line_magics["python"]
+        kernel.line_magics["python"].env["x"] = 1
+        lsmagic_loaded = kernel.line_magics.is_loaded("lsmagic")
+
+        asyncio.run(kernel.do_shutdown(True))
+        assert kernel.line_magics["shell"] is not shell
+        assert kernel.cell_magics["shell"] is kernel.line_magics["shell"]
+        assert kernel.line_magics["python"] is not python
+        assert "x" not in kernel.line_magics["python"].env
+        assert kernel.line_magics.is_loaded("lsmagic") == lsmagic_loaded
+
+        download = kernel.line_magics["download"]
+        asyncio.run(kernel.do_shutdown(True))
+        assert kernel.line_magics["download"] is download
+        # reload_magics() keeps the new instances of unchanged modules
+        python = kernel.line_magics["python"]
+        kernel.reload_magics()
+        assert kernel.line_magics["python"] is python
+
     def test_restart_false_skips_restart_kernel(self) -> None:
         """With restart=False, restart_kernel() is not called."""
         kernel = get_kernel(EvalKernel)
@@ -950,6 +1198,24 @@ class TestIpywidgetsOutputContextManager:
             )
         assert output.msg_id == "", "msg_id should be cleared after exiting context"
 
+    def test_widget_comm_targets_registered(self) -> None:
+        """Widget comm targets are registered without importing ipywidgets."""
+        kernel = get_kernel()
+        targets = kernel.comm_manager.targets
+        for name in ("ipython.widget", "jupyter.widget", "jupyter.widget.control"):
+            assert name in targets
+
+    def test_display_widget(self) -> None:
+        """Display() sends a widget view for ipywidgets widgets."""
+        ipywidgets = pytest.importorskip("ipywidgets")
+        kernel = get_kernel()
+        widget = ipywidgets.IntSlider()
+        with unittest.mock.patch.object(kernel, "send_response") as mock_send:
+            kernel.Display(widget)
+        content = mock_send.call_args[0][2]
+        view = content["data"]["application/vnd.jupyter.widget-view+json"]
+        assert view["model_id"] == widget.model_id
+
 
 class TestDisplayData:
     """Tests for raw MIME bundle display (issue #211)."""
@@ -984,7 +1250,19 @@ class TestDisplayData:
         kernel = get_kernel()
         with unittest.mock.patch.object(kernel, "DisplayData") as mock_dd:
             kernel.Display(self.MIME_BUNDLE)
-        mock_dd.assert_called_once_with(self.MIME_BUNDLE)
+        mock_dd.assert_called_once_with(self.MIME_BUNDLE, buffers=None)
+
+    def test_display_data_passes_buffers(self) -> None:
+        """DisplayData() sends buffers as binary frames of the message."""
+        kernel = get_kernel()
+        buffers = [memoryview(b"data")]
+        with unittest.mock.patch.object(kernel, "send_response") as mock_send:
+            kernel.DisplayData(self.MIME_BUNDLE, buffers=buffers)
+            kernel.Display(self.MIME_BUNDLE, buffers=buffers)
+        assert mock_send.call_count == 2
+        for call in mock_send.call_args_list:
+            assert call.args[1] == "display_data"
+            assert call.kwargs == {"buffers": buffers}
 
     def test_display_does_not_treat_plain_dict_as_mime_bundle(self) -> None:
         """Display() with a plain dict (no '/' in keys) uses the formatter, not DisplayData."""
@@ -1013,6 +1291,563 @@ class TestDisplayData:
         mock_send.assert_not_called()
 
 
+class TestPlainTextFastPath:
+    """Simple results are shown as text/plain without IPython's formatter."""
+
+    @pytest.mark.parametrize("value", ["a\nb", 42, 1 / 3, True])
+    def test_matches_formatter(self, value: Any) -> None:
+        from IPython.core.formatters import DisplayFormatter
+
+        kernel = get_kernel()
+        with unittest.mock.patch.object(DisplayFormatter, "format") as mock_format:
+            data = kernel._format(value)
+        mock_format.assert_not_called()
+        assert data == DisplayFormatter().format(value)  # type:ignore[no-untyped-call]
+
+    def test_post_execute_and_display(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        with unittest.mock.patch.object(kernel, "send_response") as mock_send:
+            asyncio.run(kernel.post_execute("text", "code", silent=False))
+            kernel.Display(1.5)
+        assert [call.args[2]["data"] for call in mock_send.call_args_list] == [
+            {"text/plain": "'text'"},
+            {"text/plain": "1.5"},
+        ]
+        assert kernel._formatter is None
+
+    def test_subclass_uses_formatter(self) -> None:
+        class HTML(str):
+            def _repr_html_(self) -> str:
+                return "<b>html</b>"
+
+        kernel = get_kernel()
+        data, _ = kernel._format(HTML("x"))
+        assert data["text/html"] == "<b>html</b>"
+
+    def test_registered_printer_is_used(self) -> None:
+        kernel = get_kernel()
+        html = kernel._display_formatter.formatters["text/html"]
+        html.for_type(int, lambda value: f"<i>{value}</i>")
+        data, _ = kernel._format(3)
+        assert data == {"text/plain": "3", "text/html": "<i>3</i>"}
+        assert kernel._format(3.0) == ({"text/plain": "3.0"}, {})
+
+
+class ThreadKernel(EvalKernel):
+    """Records the thread do_execute_direct runs in."""
+
+    execute_thread: int
+    loop_ran: threading.Event
+
+    def do_execute_direct(self, code: str, silent: bool = False) -> Any:
+        self.execute_thread = threading.get_ident()
+        if code == "wait":
+            # Only returns if the event loop keeps running
+            self.Print("waiting")
+            return self.loop_ran.wait(5)
+        if code == "sleep":
+            try:
+                while True:
+                    time.sleep(0.01)
+            except KeyboardInterrupt:
+                return "interrupted"
+        return super().do_execute_direct(code, silent)
+
+
+class TestExecuteInThread:
+    def _sent(self) -> Any:
+        """Record the message types sent, and the thread they were sent from."""
+        sent: list[tuple[str, int]] = []
+
+        def send(self: Any, socket: Any, msg_type: str, *args: Any, **kw: Any) -> None:
+            sent.append((msg_type, threading.get_ident()))
+
+        patch = unittest.mock.patch.object(Kernel, "send_response", send)
+        return patch, sent
+
+    def test_off_by_default(self) -> None:
+        kernel = get_kernel(ThreadKernel)
+        asyncio.run(kernel.do_execute("1 + 1"))
+        assert kernel.execute_thread == threading.get_ident()
+
+    def test_output_is_sent_from_the_event_loop(self) -> None:
+        kernel = get_kernel(ThreadKernel)
+        kernel.execute_in_thread = True
+        kernel.loop_ran = threading.Event()
+
+        async def run() -> Any:
+            asyncio.get_running_loop().call_later(0.05, kernel.loop_ran.set)
+            return await kernel.do_execute("wait")
+
+        patch, sent = self._sent()
+        with patch:
+            resp = asyncio.run(run())
+        assert resp["status"] == "ok"
+        assert kernel.get_variable("_") is True
+        assert kernel.execute_thread != threading.get_ident()
+        assert sent == [
+            ("stream", threading.get_ident()),
+            ("execute_result", threading.get_ident()),
+        ]
+        asyncio.run(kernel.do_shutdown(False))
+        assert kernel._executor is None
+
+    def test_magics_and_errors(self) -> None:
+        kernel = get_kernel(ThreadKernel)
+        kernel.execute_in_thread = True
+        resp = asyncio.run(kernel.do_execute("%%time\n1 + 1"))
+        assert resp["status"] == "ok"
+        assert kernel.get_variable("_") == 2
+        resp = asyncio.run(kernel.do_execute("1 / 0"))
+        assert resp["status"] == "error"
+        assert resp["ename"] == "ZeroDivisionError"
+
+    @pytest.mark.skipif(sys.platform == "win32", reason="Uses os.kill with SIGINT")
+    def test_interrupt_reaches_worker(self) -> None:
+        kernel = get_kernel(ThreadKernel)
+        kernel.execute_in_thread = True
+        handler = signal.getsignal(signal.SIGINT)
+
+        async def run() -> Any:
+            loop = asyncio.get_running_loop()
+            loop.call_later(0.1, os.kill, os.getpid(), signal.SIGINT)
+            return await kernel.do_execute("sleep")
+
+        asyncio.run(run())
+        assert kernel.get_variable("_") == "interrupted"
+        assert signal.getsignal(signal.SIGINT) is handler
+
+    def test_async_do_execute_direct_stays_on_loop(self) -> None:
+        class AsyncKernel(EvalKernel):
+            async def do_execute_direct(self, code: str, silent: bool = False) -> Any:
+                return threading.get_ident()
+
+        kernel = get_kernel(AsyncKernel)
+        kernel.execute_in_thread = True
+        asyncio.run(kernel.do_execute("x"))
+        assert kernel.get_variable("_") == threading.get_ident()
+
+
+class BackendKernel(ThreadKernel):
+    def get_completions(self, info: MutableMapping[str, Any]) -> list[str]:
+        return ["backend_completion"]
+
+
+class TestConcurrentRequests:
+    def test_query_backend(self) -> None:
+        kernel = get_kernel(BackendKernel)
+        assert kernel.query_backend(len, "abc", default=-1) == 3
+        with kernel.backend_lock:
+            assert kernel.query_backend(len, "abc", default=-1) == -1
+            kernel.thread_safe_backend = True
+            assert kernel.query_backend(len, "abc", default=-1) == 3
+
+    def test_complete_while_cell_runs(self) -> None:
+        kernel = get_kernel(BackendKernel)
+        kernel.execute_in_thread = True
+        kernel.loop_ran = threading.Event()
+
+        async def run() -> tuple[Any, Any]:
+            cell = asyncio.ensure_future(kernel.do_execute("wait"))
+            while not kernel.backend_lock.locked():
+                await asyncio.sleep(0.01)
+            busy = await kernel.do_complete("back", 4)
+            help_text = kernel.get_help_on("back")
+            kernel.loop_ran.set()
+            await cell
+            return busy, help_text
+
+        busy, help_text = asyncio.run(run())
+        assert "backend_completion" not in busy["matches"]
+        assert help_text == "The kernel is busy, try again later."
+        idle = asyncio.run(kernel.do_complete("back", 4))
+        assert "backend_completion" in idle["matches"]
+
+    def _message(self, kernel: MetaKernel, msg_type: str) -> list[zmq.Frame]:
+        assert kernel.session is not None
+        msg = kernel.session.msg(msg_type, {})
+        return [zmq.Frame(frame) for frame in kernel.session.serialize(msg)]
+
+    def test_shell_main_answers_concurrent_requests(self) -> None:
+        kernel = get_kernel(BackendKernel)
+
+        async def run() -> None:
+            await kernel._main_asyncio_lock.acquire()
+            await kernel.shell_main(None, self._message(kernel, "complete_request"))
+            kernel._main_asyncio_lock.release()
+            await kernel.shell_main(None, self._message(kernel, "execute_request"))
+
+        with unittest.mock.patch.object(kernel, "dispatch_shell") as dispatch:
+            asyncio.run(run())
+        assert [call.kwargs for call in dispatch.call_args_list] == [
+            {"subshell_id": None, "concurrent": True},
+            {"subshell_id": None},
+        ]
+
+    @pytest.mark.parametrize("missing", ["_shell_parent_ident", "dispatch"])
+    def test_shell_main_without_ipykernel_internals(
+        self, missing: str, monkeypatch: Any
+    ) -> None:
+        kernel = get_kernel(BackendKernel)
+        if missing == "dispatch":
+            # dispatch_shell(concurrent=True) came with ipykernel 7.4
+            monkeypatch.setattr("metakernel._metakernel._CONCURRENT_DISPATCH", False)
+        else:
+            monkeypatch.delattr(kernel, missing)
+
+        async def run() -> int:
+            await kernel._main_asyncio_lock.acquire()
+            request = asyncio.create_task(
+                kernel.shell_main(None, self._message(kernel, "complete_request"))
+            )
+            await asyncio.sleep(0.01)
+            calls = dispatch.call_count
+            kernel._main_asyncio_lock.release()
+            await request
+            return calls
+
+        with unittest.mock.patch.object(kernel, "dispatch_shell") as dispatch:
+            # The request waits for the cell
+            assert asyncio.run(run()) == 0
+        assert [call.kwargs for call in dispatch.call_args_list] == [
+            {"subshell_id": None},
+        ]
+
+    def test_waiting_for_backend_keeps_loop_running(self) -> None:
+        kernel = get_kernel(BackendKernel)
+        kernel.backend_lock.acquire()
+
+        async def run() -> list[str]:
+            events: list[str] = []
+            cell = asyncio.create_task(kernel._execute_direct("1"))
+            await asyncio.sleep(0.05)
+            events.append("loop ran")
+            kernel.backend_lock.release()
+            await cell
+            events.append("cell ran")
+            return events
+
+        assert asyncio.run(run()) == ["loop ran", "cell ran"]
+        assert not kernel.backend_lock.locked()
+
+    def test_cancelled_wait_for_backend_releases_it(self) -> None:
+        kernel = get_kernel(BackendKernel)
+        kernel.backend_lock.acquire()
+
+        async def run() -> None:
+            waiting = asyncio.create_task(kernel._acquire(kernel.backend_lock))
+            await asyncio.sleep(0.01)
+            waiting.cancel()
+            kernel.backend_lock.release()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+
+        asyncio.run(run())
+        # asyncio.run waits for the thread that took the lock
+        assert not kernel.backend_lock.locked()
+
+
+class CountingKernel(EvalKernel):
+    calls = 0
+
+    def get_completions(self, info: MutableMapping[str, Any]) -> list[str]:
+        self.calls += 1
+        names = ["apple", "apricot", "avocado", "banana"]
+        return [name for name in names if name.startswith(info["obj"])]
+
+
+class TestCompletionCache:
+    def test_narrows_while_typing(self) -> None:
+        kernel = get_kernel(CountingKernel)
+        code = "x = a"
+        assert asyncio.run(kernel.do_complete(code, len(code)))["matches"] == [
+            "apple",
+            "apricot",
+            "avocado",
+        ]
+        for code, matches in [
+            ("x = ap", ["apple", "apricot"]),
+            ("x = apr", ["apricot"]),
+        ]:
+            reply = asyncio.run(kernel.do_complete(code, len(code)))
+            assert reply["matches"] == matches
+            assert reply["cursor_start"] == 4
+            assert reply["cursor_end"] == len(code)
+        assert kernel.calls == 1
+
+    def test_other_context_is_computed(self) -> None:
+        kernel = get_kernel(CountingKernel)
+        asyncio.run(kernel.do_complete("x = a", 5))
+        asyncio.run(kernel.do_complete("y = ap", 6))
+        asyncio.run(kernel.do_complete("y = ap.", 7))
+        asyncio.run(kernel.do_complete("y = ap\nz", 6))
+        assert kernel.calls == 4
+
+    def test_invalidated_by_execute(self) -> None:
+        kernel = get_kernel(CountingKernel)
+        asyncio.run(kernel.do_complete("a", 1))
+        asyncio.run(kernel.do_execute("1"))
+        asyncio.run(kernel.do_complete("ap", 2))
+        assert kernel.calls == 2
+
+    def test_invalidated_by_other_state(self, tmp_path: Any, monkeypatch: Any) -> None:
+        kernel = get_kernel(CountingKernel)
+        changes: list[Callable[[], object]] = [
+            lambda: setattr(kernel, "execution_count", kernel.execution_count + 1),
+            lambda: monkeypatch.chdir(tmp_path),
+            lambda: kernel.line_magics.__setitem__(
+                "fruit", kernel.line_magics["magic"]
+            ),
+            lambda: kernel.cell_magics.__delitem__("fruit"),
+        ]
+        kernel.cell_magics["fruit"] = kernel.line_magics["magic"]
+        for change in changes:
+            asyncio.run(kernel.do_complete("a", 1))
+            change()
+            asyncio.run(kernel.do_complete("ap", 2))
+        assert kernel.calls == 2 * len(changes)
+
+    def test_disabled(self) -> None:
+        kernel = get_kernel(CountingKernel)
+        kernel.cache_completions = False
+        asyncio.run(kernel.do_complete("a", 1))
+        asyncio.run(kernel.do_complete("ap", 2))
+        assert kernel.calls == 2
+
+
+class HelpKernel(EvalKernel):
+    calls = 0
+
+    def get_kernel_help_on(
+        self, info: MutableMapping[str, Any], level: int = 0, none_on_fail: bool = False
+    ) -> str | None:
+        self.calls += 1
+        if info["obj"] == "missing":
+            return None
+        return f"Help on {info['obj']} ({level})"
+
+
+class TestInspectCache:
+    def _inspect(self, kernel: MetaKernel, code: str, level: int = 0) -> Any:
+        return asyncio.run(kernel.do_inspect(code, len(code), level))
+
+    def test_repeated_request_is_cached(self) -> None:
+        kernel = get_kernel(HelpKernel)
+        first = self._inspect(kernel, "x = dir")
+        assert first["data"] == {"text/plain": "Help on dir (0)"}
+        assert self._inspect(kernel, "x = dir") == first
+        assert kernel.calls == 1
+        assert self._inspect(kernel, "x = dir", 1)["data"] == {
+            "text/plain": "Help on dir (1)"
+        }
+        assert kernel.calls == 2
+
+    def test_not_found_is_not_cached(self) -> None:
+        kernel = get_kernel(HelpKernel)
+        assert not self._inspect(kernel, "missing")["found"]
+        assert not self._inspect(kernel, "missing")["found"]
+        assert kernel.calls == 2
+
+    def test_cleared_by_execute(self) -> None:
+        kernel = get_kernel(HelpKernel)
+        self._inspect(kernel, "dir")
+        asyncio.run(kernel.do_execute("1"))
+        self._inspect(kernel, "dir")
+        assert kernel.calls == 2
+
+    def test_size(self) -> None:
+        kernel = get_kernel(HelpKernel)
+        kernel.inspect_cache_size = 2
+        for code in ["a", "b", "a", "c", "a", "b"]:
+            self._inspect(kernel, code)
+        # "b" was dropped when "c" came in, "a" was used since
+        assert kernel.calls == 4
+        kernel.inspect_cache_size = 0
+        self._inspect(kernel, "d")
+        self._inspect(kernel, "d")
+        assert kernel.calls == 6
+
+
+class SlowKernel(CountingKernel):
+    release: threading.Event
+
+    def get_completions(self, info: MutableMapping[str, Any]) -> list[str]:
+        self.release.wait(5)
+        return super().get_completions(info)
+
+
+class TestCompletionRequests:
+    def _request(self, kernel: MetaKernel, code: str) -> dict[str, Any]:
+        assert kernel.session is not None
+        return kernel.session.msg(
+            "complete_request", {"code": code, "cursor_pos": len(code)}
+        )
+
+    def _reply(self, kernel: MetaKernel, parent: dict[str, Any]) -> Any:
+        assert kernel.session is not None
+        with unittest.mock.patch.object(kernel.session, "send") as send:
+            asyncio.run(kernel.complete_request(None, [], parent))
+        return send.call_args.args[2]
+
+    def test_shell_main_notes_newest_request(self) -> None:
+        kernel = get_kernel(CountingKernel)
+        assert kernel.session is not None
+        msg = self._request(kernel, "a")
+        frames = [zmq.Frame(frame) for frame in kernel.session.serialize(msg)]
+        with unittest.mock.patch.object(kernel, "dispatch_shell"):
+            asyncio.run(kernel.shell_main(None, frames))
+        header = msg["header"]
+        assert kernel._completion_requests == {header["session"]: header["msg_id"]}
+
+    def test_superseded_request_is_skipped(self) -> None:
+        kernel = get_kernel(CountingKernel)
+        kernel.cache_completions = False
+        old, new = self._request(kernel, "a"), self._request(kernel, "ap")
+        session = new["header"]["session"]
+        kernel._completion_requests[session] = new["header"]["msg_id"]
+        reply = self._reply(kernel, old)
+        assert reply == {
+            "matches": [],
+            "cursor_start": 1,
+            "cursor_end": 1,
+            "status": "ok",
+            "metadata": {},
+        }
+        assert kernel.calls == 0
+        assert self._reply(kernel, new)["matches"] == ["apple", "apricot"]
+        assert kernel.calls == 1
+        assert kernel._completion_requests == {}
+
+    def test_superseding_disabled(self) -> None:
+        kernel = get_kernel(CountingKernel)
+        kernel.supersede_completions = False
+        old = self._request(kernel, "a")
+        kernel._completion_requests[old["header"]["session"]] = "newer"
+        assert self._reply(kernel, old)["matches"] == ["apple", "apricot", "avocado"]
+
+    def test_timeout(self) -> None:
+        kernel = get_kernel(SlowKernel)
+        kernel.release = threading.Event()
+        kernel.completion_timeout = 0.05
+        reply = asyncio.run(kernel.do_complete("a", 1))
+        assert reply["matches"] == []
+        assert kernel._completion_cache is None
+        kernel.release.set()
+        reply = asyncio.run(kernel.do_complete("a", 1))
+        assert reply["matches"] == ["apple", "apricot", "avocado"]
+        assert kernel._completion_cache is not None
+
+    def test_magic_cell_waits_for_magic_completion(self) -> None:
+        release = threading.Event()
+        events: list[str] = []
+
+        class SlowMagic(Magic):
+            def line_slow(self, arg: str = "") -> None:
+                events.append("cell")
+
+            def get_completions(self, info: MutableMapping[str, Any]) -> list[str]:
+                release.wait(5)
+                events.append("completed")
+                return []
+
+        kernel = get_kernel(EvalKernel)
+        kernel.register_magics(SlowMagic)
+        kernel.completion_timeout = 0.01
+
+        async def run() -> None:
+            reply = await kernel.do_complete("%slow a", 7)
+            assert reply["matches"] == []
+            cell = asyncio.create_task(kernel.do_execute("%slow"))
+            await asyncio.sleep(0.05)
+            events.append("released")
+            release.set()
+            await cell
+
+        asyncio.run(run())
+        assert events == ["released", "completed", "cell"]
+
+
+class TestStreamBuffer:
+    def test_cell_output_is_joined(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        kernel.execute_in_thread = True
+        code = "[kernel.Print(i) for i in range(100)] and None"
+        with capture_send_messages(kernel) as sent:
+            asyncio.run(kernel.do_execute(code))
+        stream = [content for msg_type, content in sent if msg_type == "stream"]
+        assert stream == [
+            {"name": "stdout", "text": "".join(f"{i}\n" for i in range(100))}
+        ]
+
+    @pytest.mark.parametrize("in_thread", [False, True])
+    def test_order_with_other_output(self, in_thread: bool) -> None:
+        kernel = get_kernel(EvalKernel)
+        kernel.execute_in_thread = in_thread
+        code = (
+            "(kernel.Print('a'), kernel.Print('b'), kernel.Error('c'),"
+            " kernel.DisplayData({'text/plain': 'd'}), kernel.Write('e')) and 1"
+        )
+        sent: list[tuple[str, Any, Any]] = []
+
+        def send(
+            self: Any, socket: Any, msg_type: str, content: Any, **kw: Any
+        ) -> None:
+            sent.append((msg_type, content.get("name"), content.get("text")))
+
+        with unittest.mock.patch.object(Kernel, "send_response", send):
+            asyncio.run(kernel.do_execute(code))
+        joined = [("stream", "stdout", "a\nb\n")]
+        if not in_thread:
+            # The event loop is busy, so text isn't held back
+            joined = [("stream", "stdout", "a\n"), ("stream", "stdout", "b\n")]
+        assert sent == [
+            *joined,
+            ("stream", "stderr", "\x1b[0;31mc\n\x1b[0m"),
+            ("display_data", None, None),
+            ("stream", "stdout", "e"),
+            ("execute_result", None, None),
+        ]
+
+    def test_disabled(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        kernel.execute_in_thread = True
+        kernel.stream_flush_interval = 0
+        with capture_send_messages(kernel) as sent:
+            asyncio.run(
+                kernel.do_execute("(kernel.Print(1), kernel.Print(2)) and None")
+            )
+        assert [content["text"] for _, content in sent] == ["1\n", "2\n"]
+
+    def test_busy_loop_sends_at_once(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        events: list[str] = []
+
+        def send(
+            self: Any, socket: Any, msg_type: str, content: Any, **kw: Any
+        ) -> None:
+            if msg_type == "stream":
+                events.append(content["text"])
+
+        # The cell keeps the event loop busy, e.g. with `sleep 3`
+        kernel.set_variable("work", lambda: events.append("work"))
+        code = "(kernel.Print('start'), work(), kernel.Print('done')) and None"
+        with unittest.mock.patch.object(Kernel, "send_response", send):
+            asyncio.run(kernel.do_execute(code))
+        assert events == ["start\n", "work", "done\n"]
+
+    def test_timer_runs_on_io_loop(self) -> None:
+        kernel = get_kernel(EvalKernel)
+        kernel.io_loop = unittest.mock.Mock()
+
+        def callback() -> None:
+            pass
+
+        kernel._call_later(0.05, callback)
+        kernel.io_loop.add_callback.assert_called_once_with(
+            kernel.io_loop.call_later, 0.05, callback
+        )
+
+
 class TestScheduleDisplayOutput:
     """Tests for schedule_display_output (issue #198)."""
 
@@ -1,4 +1,7 @@
+import io
+import json
 import os
+import sys
 from typing import Any
 from unittest.mock import MagicMock, patch
 
@@ -7,6 +10,7 @@ from ipykernel.kernelapp import IPKernelApp
 from jupyter_core.paths import jupyter_config_dir, jupyter_config_path
 
 from metakernel import MetaKernel, MetaKernelApp
+from tests.utils import get_kernel
 
 
 class TestMetaKernelAppConfig:
@@ -144,6 +148,68 @@ class TestMetaKernelAppSubcommands:
         assert written_spec is not None
         assert written_spec["display_name"] == "Custom Name"
 
+    def test_install_app_initialize_extracts_fork_server(self) -> None:
+        app = MetaKernelApp()
+        KernelInstallerApp, _ = app.subcommands["install"]
+        installer = KernelInstallerApp()
+        installer.initialize(["--fork-server", "--user"])
+        assert installer.fork_server
+        assert installer.argv == ["--user"]
+
+    def test_install_start_applies_fork_server(self) -> None:
+        kernel_json = {
+            "argv": ["python", "-m", "test_kernel", "-f", "{connection_file}"],
+            "display_name": "Test Kernel",
+            "language": "test",
+            "name": "test-kernel",
+        }
+        mock_kernel_class = MagicMock()
+        mock_kernel_class.return_value.kernel_json = kernel_json
+        mock_kernel_class.return_value.kernel_javascript = ""
+        mock_kernel_class.__module__ = "metakernel"
+        mock_kernel_class.__qualname__ = "TestKernel"
+
+        app = MetaKernelApp()
+        KernelInstallerApp, _ = app.subcommands["install"]
+        KernelInstallerApp.kernel_class = mock_kernel_class
+
+        installer = KernelInstallerApp()
+        installer.initialize(["--user", "--fork-server"])
+
+        written_spec: dict[str, object] | None = None
+        original_dump = __import__("json").dump
+
+        def capture_dump(obj: object, f: object, **kwargs: object) -> None:
+            nonlocal written_spec
+            written_spec = obj  # type: ignore[assignment]
+            original_dump(obj, f, **kwargs)
+
+        with (
+            patch("subprocess.check_call"),
+            patch("json.dump", side_effect=capture_dump),
+        ):
+            installer.start()
+
+        assert written_spec is not None
+        assert written_spec["argv"] == [
+            "python",
+            "-m",
+            "metakernel.forkserver",
+            "metakernel:TestKernel",
+            "-f",
+            "{connection_file}",
+        ]
+        # The kernel's own spec is left alone
+        assert kernel_json["argv"][:3] == ["python", "-m", "test_kernel"]
+
+    def test_subcommands_has_fork_server(self) -> None:
+        app = MetaKernelApp()
+        ForkServerApp, _ = app.subcommands["fork-server"]
+        assert ForkServerApp.kernel_class is app.kernel_class
+        server_app = ForkServerApp()
+        server_app.initialize(["--socket=/tmp/kernel.sock"])
+        assert server_app.socket == "/tmp/kernel.sock"
+
     def test_install_start_calls_kernelspec_install(self) -> None:
         kernel_json = {
             "argv": ["python", "-m", "test_kernel"],
@@ -401,3 +467,43 @@ class TestMetaKernelRunAsMain:
             MetaKernel.run_as_main(extra_option="value")
         call_kwargs = mock_launch.call_args[1]
         assert call_kwargs.get("extra_option") == "value"
+
+
+class TestMetaKernelAppProfileStartup:
+    def test_profile_startup_flag(self) -> None:
+        app = MetaKernelApp()
+        assert not app.profile_startup
+        app.parse_command_line(["--profile-startup"])
+        assert app.profile_startup
+
+    def test_init_kernel_writes_profile(self) -> None:
+        kernel = get_kernel()
+        app = MetaKernelApp()
+        app.profile_startup = True
+
+        def init_kernel(self: IPKernelApp) -> None:
+            self.kernel = kernel
+
+        stderr = io.StringIO()
+        with (
+            patch.object(IPKernelApp, "init_kernel", init_kernel),
+            patch.object(sys, "__stderr__", stderr),
+        ):
+            app.init_kernel()
+
+        profile = json.loads(stderr.getvalue())
+        assert profile["kernel"] == "metakernel._metakernel.MetaKernel"
+        assert profile["init_kernel"] >= 0
+        for phase in ("comm_registration", "history_file", "parser", "reload_magics"):
+            assert phase in profile["phases"]
+        assert "python_magic" in profile["magic_modules"]
+
+    def test_init_kernel_silent_by_default(self) -> None:
+        app = MetaKernelApp()
+        stderr = io.StringIO()
+        with (
+            patch.object(IPKernelApp, "init_kernel"),
+            patch.object(sys, "__stderr__", stderr),
+        ):
+            app.init_kernel()
+        assert stderr.getvalue() == ""
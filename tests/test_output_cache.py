@@ -0,0 +1,73 @@
+import gc
+import sys
+import weakref
+
+from metakernel.output_cache import OutputCache, sizeof
+
+
+class Array:
+    nbytes = 10_000
+
+
+def test_sizeof() -> None:
+    assert sizeof("abc") == sys.getsizeof("abc")
+    assert sizeof(Array()) == 10_000
+
+
+def test_size_limit() -> None:
+    cache = OutputCache(size=2)
+    assert cache.add(1, "a") == []
+    assert cache.add(2, "b") == []
+    assert cache.add(3, "c") == [1]
+    assert list(cache) == [2, 3]
+    cache.touch(2)
+    assert cache.add(4, "d") == [3]
+    assert list(cache) == [2, 4]
+    assert cache.type_name(2) == "str"
+
+
+def test_values_are_not_kept() -> None:
+    cache = OutputCache(byte_limit=100_000)
+    value = Array()
+    ref = weakref.ref(value)
+    cache.add(1, value)
+    del value
+    gc.collect()
+    assert ref() is None
+    assert cache.type_name(1) == "Array"
+    assert cache.sizeof(1) == 10_000
+
+
+def test_byte_limit() -> None:
+    cache = OutputCache(byte_limit=25_000)
+    cache.add(1, Array())
+    cache.add(2, Array())
+    assert cache.nbytes == 20_000
+    assert cache.add(3, Array()) == [1]
+    assert cache.nbytes == 20_000
+    # The latest result is kept even if it is too large on its own
+    cache.byte_limit = 5_000
+    assert cache.add(4, Array()) == [2, 3]
+    assert list(cache) == [4]
+
+
+def test_replace_and_clear() -> None:
+    cache = OutputCache(byte_limit=100_000)
+    cache.add(1, Array())
+    cache.add(1, "a")
+    assert len(cache) == 1
+    assert cache.nbytes == sys.getsizeof("a")
+    assert cache.clear() == [1]
+    assert cache.nbytes == 0
+    assert 1 not in cache
+
+
+def test_no_sizes_without_byte_limit() -> None:
+    class Unsized:
+        def __sizeof__(self) -> int:
+            raise AssertionError("sized without a byte limit")
+
+    cache = OutputCache()
+    cache.add(1, Unsized())
+    assert cache.sizeof(1) == 0
+    assert cache.nbytes == 0
@@ -1,9 +1,13 @@
 import os
 import sys
+import time
+import unittest.mock
+from collections import OrderedDict
+from typing import Any
 
 import pytest
 
-from metakernel import Parser
+from metakernel import ParseInfo, Parser
 
 
 def test_parser() -> None:
@@ -30,6 +34,195 @@ def test_parser() -> None:
     assert info["magic"]["type"] == "line"
 
 
+def test_parse_magic() -> None:
+    p = Parser()
+    code = "%%python\nimport os"
+    info = p.parse_magic(code)
+    assert info["magic"] == p.parse_code(code)["magic"]
+    assert info["code"] == code
+    assert p.parse_magic("! ls")["magic"]["name"] == "shell"
+    assert p.parse_magic("x = 1")["magic"] == {}
+
+
+def test_parse_magic_skips_file_system() -> None:
+    p = Parser()
+    with (
+        unittest.mock.patch("os.listdir") as listdir,
+        unittest.mock.patch("os.path.isdir") as isdir,
+    ):
+        p.parse_magic("%cd /usr/bi")
+        p.parse_magic("/usr/bi")
+    listdir.assert_not_called()
+    isdir.assert_not_called()
+
+
+def test_parse_info_is_a_mapping() -> None:
+    p = Parser()
+    info = p.parse_code("x = 1\nprint(os.pa")
+    assert isinstance(info, ParseInfo)
+    assert info["obj"] == "os.pa"
+    assert info["line"] == "print(os.pa"
+    assert info["pre"] == ""
+    assert info["post"] == ""
+    assert "path_matches" in info
+    assert "foo" not in info
+    assert info.get("foo") is None
+    with pytest.raises(KeyError):
+        info["foo"]
+
+    info["obj"] = "%" + info["obj"]
+    info["start"] -= 1
+    info["foo"] = "bar"
+    assert info["obj"] == "%os.pa"
+    assert info["start"] == 11
+    items = info.copy()
+    assert isinstance(items, dict)
+    assert list(items)[-1] == "foo"
+    assert len(items) == len(info)
+    assert items["lines"] == ["x = 1", "print(os.pa"]
+    del info["foo"]
+    assert "foo" not in info
+
+
+def test_parse_info_is_lazy() -> None:
+    p = Parser()
+    code = "x = 1\n" * 50000 + "abc"
+    with unittest.mock.patch.object(p, "_get_path_matches") as get_path_matches:
+        info = p.parse_code(code, 0, len(code) - 1)
+        assert info["obj"] == "ab"
+        assert info["full_obj"] == "abc"
+        assert info["start"] == len(code) - 3
+        assert info["magic"] == {}
+    get_path_matches.assert_not_called()
+    assert "lines" not in info._parsed
+    assert "pre" not in info._parsed
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "",
+        "x",
+        "x\n",
+        "x\ny",
+        "\n\n",
+        "x\r\ny\r",
+        "x\ry\n\x0cz",
+        "x\u2028y\x85",
+        "é\r\n",
+    ],
+)
+def test_line_num(code: str) -> None:
+    p = Parser()
+    for end in range(len(code) + 1):
+        info = p.parse_code(code, 0, end)
+        assert info["line_num"] == len(code[:end].splitlines())
+        assert "lines" not in info._parsed
+
+
+@pytest.mark.parametrize(
+    ("code", "args", "body"),
+    [
+        ("%%time  -n 3 \nx = 1\r\n\ny\n\n", "-n 3", "x = 1\n\ny"),
+        ("  %%python\ny\u2028z", "", "y\nz"),
+        ("!ls -l", "ls -l", ""),
+    ],
+)
+def test_parse_magic_args_and_code(code: str, args: str, body: str) -> None:
+    p = Parser()
+    minfo = p.parse_code(code)["magic"]
+    assert minfo["args"] == args
+    assert minfo["code"] == body
+    assert minfo == p._parse_magic(code + "\nmore", len(code))
+
+
+def test_magic_info_is_a_dict() -> None:
+    p = Parser()
+    minfo = p.parse_code("%%time -n 2\nx = 1\ny")["magic"]
+    assert minfo == {
+        "name": "time",
+        "prefix": "%%",
+        "full_name": "%%time",
+        "type": "cell",
+        "index": 6,
+        "args": "-n 2",
+        "rest": " -n 2\nx = 1\ny",
+        "code": "x = 1\ny",
+    }
+    assert minfo.pop("code") == "x = 1\ny"
+    assert "code" not in minfo
+    assert minfo.get("code") is None
+    minfo["code"] = "z"
+    assert minfo["code"] == "z"
+    del minfo["rest"], minfo["name"]
+    assert len(minfo) == len(minfo.copy()) == 6
+
+
+def test_magic_info_parses_code_in_place() -> None:
+    p = Parser()
+    code = "%%time\nx = 1\nprint(os.pa"
+    info = p.parse_code(code)["magic"].parse_code()
+    expected = p.parse_code("x = 1\nprint(os.pa")
+    assert info.copy() == expected.copy()
+    assert info["pre"] == ""
+    assert info["code"] == "x = 1\nprint(os.pa"
+    assert p.parse_code("%%time\n")["magic"].parse_code() is None
+    # Line breaks that "code" changes are parsed from a copy
+    info = p.parse_code("%%time\r\nx = 1\r\ny")["magic"].parse_code()
+    assert info["code"] == "x = 1\ny"
+    assert info["line_num"] == 2
+
+
+def test_parse_magic_compiles_no_regexes() -> None:
+    p = Parser()
+    with unittest.mock.patch("re.compile") as compile_:
+        p.parse_code("%%time\nx = 1")["magic"]
+        p.parse_code("x?")["magic"]
+    compile_.assert_not_called()
+
+
+def _parse_magics_one_by_one(p: Parser, code: str) -> list[dict[str, object]]:
+    chain = []
+    while code.startswith(("!", "%")):
+        minfo = p.parse_magic(code)["magic"]
+        chain.append(minfo)
+        code = minfo["code"]
+    return chain
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "%time\n%%python\nx = 1\nx",
+        "%%time  \n! ls -l\n%cd /tmp\nrest\n\n",
+        "%lsmagic",
+        "%%python\n",
+        "%a   \n   \n",
+        "%%%html\n<b>hi</b>",
+        "!!ls\n  %not_a_magic",
+    ],
+)
+def test_parse_magic_chain(code: str) -> None:
+    p = Parser()
+    chain = p.parse_magic_chain(code)
+    expected = _parse_magics_one_by_one(p, code)
+    assert len(chain) == len(expected)
+    for minfo, other in zip(chain, expected, strict=True):
+        assert code[minfo.pop("offset") : minfo.pop("end")] == other.pop("code")
+        del other["rest"]
+        assert minfo == other
+
+
+def test_parse_magic_chain_stops() -> None:
+    p = Parser()
+    assert p.parse_magic_chain("x = 1\n%time") == []
+    # Left to parse_magic, which handles these:
+    assert p.parse_magic_chain("%time\n%python x?") == []
+    assert p.parse_magic_chain("%time\r\n%%python\r\nx") == []
+    chain = p.parse_magic_chain("%time\n%python x?\ny")
+    assert [minfo["name"] for minfo in chain] == ["time"]
+
+
 def test_scheme_parser() -> None:
     function_call_regex = r"\(([^\d\W][\w\.]*)[^\)\()]*\Z"
     p = Parser(function_call_regex=function_call_regex)
@@ -148,3 +341,90 @@ def test_complete10() -> None:
     p = get_parser()
     info = p.parse_code("/tmp/Test\\ Dir")
     assert "Dir/test.txt" in info["path_matches"]
+
+
+def _old_dir(path: Any) -> None:
+    """Make *path* look unchanged for a while, so that its listing is kept."""
+    os.utime(path, (time.time() - 60, time.time() - 60))
+
+
+@_skip_posix_paths
+def test_listings_are_cached(tmp_path: Any) -> None:
+    for name in ("alpha.txt", "beta.txt"):
+        (tmp_path / name).touch()
+    (tmp_path / "alps").mkdir()
+    _old_dir(tmp_path)
+    p = Parser()
+    code = f"{tmp_path}/al"
+    with unittest.mock.patch("os.scandir", wraps=os.scandir) as scandir:
+        assert p.parse_code(code)["path_matches"] == ["alpha.txt", "alps/"]
+        assert p.parse_code(code)["path_matches"] == ["alpha.txt", "alps/"]
+    assert scandir.call_count == 1
+
+    # A changed directory is listed again
+    (tmp_path / "alto").touch()
+    os.utime(tmp_path, (time.time() - 30, time.time() - 30))
+    assert "alto" in p.parse_code(code)["path_matches"]
+
+
+@_skip_posix_paths
+def test_relative_listings_follow_cwd(tmp_path: Any, monkeypatch: Any) -> None:
+    mtime = time.time() - 60
+    for name in ("one", "two"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / f"{name}.txt").touch()
+        # Same mtime, as for trees extracted from an archive
+        os.utime(tmp_path / name, (mtime, mtime))
+    p = Parser()
+    monkeypatch.chdir(tmp_path / "one")
+    assert p.parse_code("./")["path_matches"] == ["one.txt"]
+    monkeypatch.chdir(tmp_path / "two")
+    assert p.parse_code("./")["path_matches"] == ["two.txt"]
+
+
+@_skip_posix_paths
+def test_listings_cache_is_bounded(tmp_path: Any, monkeypatch: Any) -> None:
+    from metakernel import parser
+
+    monkeypatch.setattr(parser, "_listings", OrderedDict())
+    monkeypatch.setattr(parser, "_MAX_LISTED_NAMES", 5)
+    for name, count in (("a", 3), ("b", 3), ("c", 6)):
+        (tmp_path / name).mkdir()
+        for i in range(count):
+            (tmp_path / name / f"f{i}").touch()
+        _old_dir(tmp_path / name)
+        parser._listdir(str(tmp_path / name))
+    # "b" pushed out "a", and "c" is too large to keep
+    assert list(parser._listings) == [str(tmp_path / "b")]
+
+
+@_skip_posix_paths
+def test_isdir(tmp_path: Any, monkeypatch: Any) -> None:
+    from metakernel import parser
+
+    monkeypatch.setattr(parser, "_listings", OrderedDict())
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "file").touch()
+    # Not listed yet: the parent is not listed for this
+    with unittest.mock.patch("os.scandir") as scandir:
+        assert parser._isdir(str(tmp_path / "sub"))
+        assert not parser._isdir(str(tmp_path / "file"))
+    scandir.assert_not_called()
+    _old_dir(tmp_path)
+    parser._listdir(str(tmp_path))
+    with unittest.mock.patch("os.path.isdir") as isdir:
+        assert parser._isdir(str(tmp_path / "sub"))
+        assert parser._isdir(str(tmp_path / "sub") + os.sep)
+        assert not parser._isdir(str(tmp_path / "file"))
+        assert not parser._isdir(str(tmp_path / "missing"))
+    isdir.assert_not_called()
+
+
+@_skip_posix_paths
+def test_max_path_matches(tmp_path: Any) -> None:
+    for i in range(20):
+        (tmp_path / f"file{i:02}").touch()
+    p = Parser()
+    p.max_path_matches = 5
+    matches = p.parse_code(f"{tmp_path}/file")["path_matches"]
+    assert matches == ["file00", "file01", "file02", "file03", "file04"]
@@ -1,10 +1,16 @@
 import asyncio
+import os
+import signal
 import sys
+import time
+import unittest.mock
+from typing import Any
 
 import pytest
+from ipykernel.kernelbase import Kernel
 from IPython.display import HTML
 
-from metakernel.process_metakernel import BashKernel
+from metakernel.process_metakernel import BashKernel, TextOutput
 from tests.utils import get_kernel, get_log_text
 
 pytestmark = pytest.mark.skipif(
@@ -36,3 +42,49 @@ def test_process_metakernel() -> None:
     )
     text = get_log_text(kernel)
     assert r"1\r2\r3\r" in text
+
+
+def test_process_metakernel_in_thread() -> None:
+    kernel = get_kernel(BashKernel)
+    kernel.execute_in_thread = True
+    asyncio.run(kernel.do_execute('echo "from thread"', None))
+    assert "from thread" in get_log_text(kernel)
+
+    async def interrupt() -> Any:
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.5, os.kill, os.getpid(), signal.SIGINT)
+        return await kernel.do_execute("sleep 30", None)
+
+    started = time.perf_counter()
+    asyncio.run(interrupt())
+    assert time.perf_counter() - started < 10
+    asyncio.run(kernel.do_execute('echo "after"', None))
+    assert "after" in get_log_text(kernel)
+
+
+def test_process_metakernel_output_limit() -> None:
+    kernel = get_kernel(BashKernel)
+    kernel.output_limit = 1000
+    sent: list[tuple[str, str]] = []
+
+    def send(self: Any, socket: Any, msg_type: str, content: Any, **kw: Any) -> None:
+        if msg_type == "stream":
+            sent.append((content["name"], content["text"]))
+
+    with unittest.mock.patch.object(Kernel, "send_response", send):
+        asyncio.run(kernel.do_execute("yes | head -n 20000", False))
+        asyncio.run(kernel.do_execute("echo done", False))
+    assert sum(len(text) for _, text in sent[:-1]) < 3000
+    assert any("Output limit reached" in text for _, text in sent)
+    assert sent[-1] == ("stdout", "done\r\n")
+
+
+def test_text_output_skips_formatter() -> None:
+    from IPython.core.formatters import DisplayFormatter
+
+    kernel = get_kernel(BashKernel)
+    output = TextOutput("line 1\nline 2\n")
+    expected = DisplayFormatter().format(output)  # type:ignore[no-untyped-call]
+    with unittest.mock.patch.object(DisplayFormatter, "format") as mock_format:
+        assert kernel._format(output) == expected
+    mock_format.assert_not_called()
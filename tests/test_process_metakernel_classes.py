@@ -259,15 +259,19 @@ def test_do_execute_direct_eof_calls_restart_kernel() -> None:
     mock_restart.assert_called_once()
 
 
-def test_do_execute_direct_eof_calls_reload_magics() -> None:
+def test_do_execute_direct_eof_resets_magics() -> None:
     kernel = get_kernel(_TestKernel)
     mock_wrapper = MagicMock()
     mock_wrapper.child.before = ""
     mock_wrapper.run_command.side_effect = EOF("eof")
     kernel.wrapper = mock_wrapper
-    with patch.object(kernel, "reload_magics") as mock_reload:
+    with (
+        patch.object(kernel, "reset_magics") as mock_reset,
+        patch.object(kernel, "reload_magics") as mock_reload,
+    ):
         kernel.do_execute_direct("bad command")
-    mock_reload.assert_called_once()
+    mock_reset.assert_called_once()
+    mock_reload.assert_not_called()
 
 
 def test_do_execute_direct_eof_sets_error_kernel_resp() -> None:
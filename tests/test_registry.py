@@ -0,0 +1,323 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest.mock
+
+from metakernel import MetaKernel
+from metakernel.registry import MagicIndex, MagicWatcher, read_manifest
+from tests.utils import get_kernel, get_log_text
+
+LAZY_MAGIC = """
+import os
+
+from metakernel import Magic, MetaKernel
+
+os.environ["LAZY_TEST_MAGIC_IMPORTED"] = "1"
+
+
+class LazyTestMagic(Magic):
+    def line_lazy_test(self):
+        '''
+        %lazy_test - a magic that is imported on first use
+
+        More help here.
+        '''
+        self.kernel.Print("lazy_test ran")
+
+    def cell_lazy_test(self):
+        '''
+        %%lazy_test - the cell version
+        '''
+
+
+def register_magics(kernel: MetaKernel) -> None:
+    kernel.register_magics(LazyTestMagic)
+"""
+
+DYNAMIC_MAGIC = """
+from metakernel import Magic, MetaKernel
+
+
+class DynamicTestMagic(Magic):
+    def line_dynamic_test(self):
+        '''%dynamic_test - registered conditionally'''
+
+
+def register_magics(kernel: MetaKernel) -> None:
+    if True:
+        kernel.register_magics(DynamicTestMagic)
+"""
+
+
+def _write_magic(dirname: str, module: str, source: str) -> str:
+    path = os.path.join(dirname, module + ".py")
+    with open(path, "w") as f:
+        f.write(source)
+    return path
+
+
+def _kernel_with_local_magics(local_magics_dir: str):
+    with unittest.mock.patch(
+        "metakernel._metakernel.get_local_magics_dir",
+        return_value=local_magics_dir,
+    ):
+        return get_kernel()
+
+
+def test_read_manifest() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = _write_magic(tmpdir, "lazy_manifest_magic", LAZY_MAGIC)
+        manifest = read_manifest("lazy_manifest_magic", path)
+
+    assert manifest is not None
+    assert manifest.magics == {
+        "line": {"lazy_test": "%lazy_test - a magic that is imported on first use"},
+        "cell": {"lazy_test": "%%lazy_test - the cell version"},
+    }
+    assert "lazy_manifest_magic" not in sys.modules
+
+
+def test_read_manifest_dynamic_registration() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = _write_magic(tmpdir, "dynamic_manifest_magic", DYNAMIC_MAGIC)
+        assert read_manifest("dynamic_manifest_magic", path) is None
+
+
+def test_read_manifest_bundled_magics() -> None:
+    magics_dir = os.path.join(os.path.dirname(__file__), "..", "metakernel", "magics")
+    path = os.path.join(magics_dir, "python_magic.py")
+    manifest = read_manifest("python_magic", path)
+    assert manifest is not None
+    assert manifest.magics["line"]["python"] == "%python CODE - evaluate code as Python"
+    assert "python" in manifest.magics["cell"]
+
+
+def test_magic_imported_on_first_use() -> None:
+    os.environ.pop("LAZY_TEST_MAGIC_IMPORTED", None)
+    with tempfile.TemporaryDirectory() as local_magics_dir:
+        _write_magic(local_magics_dir, "lazy_first_use_magic", LAZY_MAGIC)
+        kernel = _kernel_with_local_magics(local_magics_dir)
+
+        assert "lazy_test" in kernel.line_magics
+        assert "lazy_test" in kernel.cell_magics
+        assert not kernel.line_magics.is_loaded("lazy_test")
+        assert "LAZY_TEST_MAGIC_IMPORTED" not in os.environ
+
+        # Listing the magics uses the manifest summaries:
+        asyncio.run(kernel.do_execute("%magic", None))
+        assert "%lazy_test - a magic that is imported on first use" in (
+            get_log_text(kernel)
+        )
+        assert "LAZY_TEST_MAGIC_IMPORTED" not in os.environ
+
+        asyncio.run(kernel.do_execute("%lazy_test", None))
+        assert "lazy_test ran" in get_log_text(kernel)
+        assert os.environ["LAZY_TEST_MAGIC_IMPORTED"] == "1"
+        # Both magic types share one instance once loaded:
+        assert kernel.cell_magics.is_loaded("lazy_test")
+        assert kernel.line_magics["lazy_test"] is kernel.cell_magics["lazy_test"]
+    os.environ.pop("LAZY_TEST_MAGIC_IMPORTED", None)
+
+
+def test_dynamic_magic_imported_eagerly() -> None:
+    with tempfile.TemporaryDirectory() as local_magics_dir:
+        _write_magic(local_magics_dir, "dynamic_eager_magic", DYNAMIC_MAGIC)
+        kernel = _kernel_with_local_magics(local_magics_dir)
+        assert kernel.line_magics.is_loaded("dynamic_test")
+
+
+def test_lazy_magic_load_error() -> None:
+    source = LAZY_MAGIC.replace("import os\n", "import os\nraise ValueError('boom')\n")
+    with tempfile.TemporaryDirectory() as local_magics_dir:
+        path = _write_magic(local_magics_dir, "lazy_broken_magic", source)
+        kernel = _kernel_with_local_magics(local_magics_dir)
+
+        assert "lazy_test" in kernel.line_magics
+        assert kernel.line_magics.get("lazy_test") is None
+        assert "lazy_test" not in kernel.line_magics
+        assert "lazy_test" not in kernel.cell_magics
+        assert kernel.magic_load_errors == [(path, "boom")]
+
+
+def test_lazy_load_keeps_later_registrations() -> None:
+    """Loading a module doesn't override magics that come later in the search order."""
+    source = LAZY_MAGIC.replace(
+        "def line_lazy_test",
+        "def line_lsmagic(self):\n        pass\n\n    def line_lazy_test",
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = _write_magic(tmpdir, "lazy_shadow_magic", source)
+        manifest = read_manifest("lazy_shadow_magic", path)
+        assert manifest is not None
+        assert "lsmagic" in manifest.magics["line"]
+
+        kernel = get_kernel()
+        kernel.line_magics["lazy_test"] = manifest
+        sys.path.insert(0, tmpdir)
+        try:
+            magic = kernel.line_magics["lazy_test"]
+        finally:
+            sys.path.remove(tmpdir)
+        assert type(magic).__name__ == "LazyTestMagic"
+        assert type(kernel.line_magics["lsmagic"]).__name__ == "LSMagicMagic"
+
+
+def test_magic_index_reuses_unchanged_entries() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = _write_magic(tmpdir, "indexed_magic", LAZY_MAGIC)
+        index_file = os.path.join(tmpdir, "magics-index.json")
+
+        index = MagicIndex(index_file)
+        manifest = index.get_manifest("indexed_magic", path)
+        assert manifest is not None
+        assert "lazy_test" in manifest.magics["line"]
+        assert not index.has_ipython_magics(path)
+        index.save([tmpdir])
+        assert os.path.exists(index_file)
+
+        # A fresh index answers from disk without parsing the file again:
+        index = MagicIndex(index_file)
+        with unittest.mock.patch("metakernel.registry._parse") as parse:
+            manifest = index.get_manifest("indexed_magic", path)
+        parse.assert_not_called()
+        assert manifest is not None
+        assert manifest.magics["cell"] == {
+            "lazy_test": "%%lazy_test - the cell version"
+        }
+        assert not index.dirty
+
+        # Changing the file invalidates its entry:
+        _write_magic(tmpdir, "indexed_magic", DYNAMIC_MAGIC)
+        os.utime(path, ns=(0, 0))
+        index = MagicIndex(index_file)
+        assert index.get_manifest("indexed_magic", path) is None
+        assert index.dirty
+
+
+def test_magic_index_touched_file_is_not_parsed() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = _write_magic(tmpdir, "touched_magic", LAZY_MAGIC)
+        index_file = os.path.join(tmpdir, "magics-index.json")
+        index = MagicIndex(index_file)
+        index.get_manifest("touched_magic", path)
+        index.save()
+
+        os.utime(path, ns=(0, 0))
+        index = MagicIndex(index_file)
+        with unittest.mock.patch("metakernel.registry._parse") as parse:
+            assert index.get_manifest("touched_magic", path) is not None
+        parse.assert_not_called()
+
+
+def test_magic_index_drops_deleted_files() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = _write_magic(tmpdir, "deleted_magic", LAZY_MAGIC)
+        index_file = os.path.join(tmpdir, "magics-index.json")
+        index = MagicIndex(index_file)
+        index.get_manifest("deleted_magic", path)
+        index.save([tmpdir])
+
+        os.remove(path)
+        index = MagicIndex(index_file)
+        index.save([tmpdir])
+        assert MagicIndex(index_file).entries == {}
+
+
+def test_magic_index_ignores_corrupt_file() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        index_file = os.path.join(tmpdir, "magics-index.json")
+        with open(index_file, "w") as f:
+            f.write("{not json")
+        assert MagicIndex(index_file).entries == {}
+
+
+def test_reload_magics_uses_index() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        index_file = os.path.join(tmpdir, "magics-index.json")
+        with unittest.mock.patch(
+            "metakernel._metakernel.get_magics_index_file", return_value=index_file
+        ):
+            kernel = get_kernel()
+            with unittest.mock.patch("metakernel.registry._parse") as parse:
+                kernel.reload_magics()
+            parse.assert_not_called()
+        assert not kernel.line_magics.is_loaded("lsmagic")
+        assert "python" in kernel.cell_magics
+
+
+def test_reload_magics_keeps_unchanged_instances() -> None:
+    kernel = get_kernel()
+    shell = kernel.line_magics["shell"]
+    path_len = len(sys.path)
+
+    kernel.reload_magics()
+    assert kernel.line_magics["shell"] is shell
+    assert kernel.cell_magics["shell"] is shell
+    # Magics that were never used stay lazy:
+    assert not kernel.line_magics.is_loaded("lsmagic")
+    assert len(sys.path) == path_len
+
+    kernel.reload_magics(reset=True)
+    assert kernel.line_magics["shell"] is not shell
+
+
+def test_reload_magics_reimports_changed_module() -> None:
+    with tempfile.TemporaryDirectory() as local_magics_dir:
+        path = _write_magic(local_magics_dir, "lazy_changed_magic", LAZY_MAGIC)
+        with unittest.mock.patch(
+            "metakernel._metakernel.get_local_magics_dir",
+            return_value=local_magics_dir,
+        ):
+            kernel = get_kernel()
+            magic = kernel.line_magics["lazy_test"]
+
+            kernel.reload_magics()
+            assert kernel.line_magics["lazy_test"] is magic
+
+            _write_magic(
+                local_magics_dir,
+                "lazy_changed_magic",
+                LAZY_MAGIC.replace("lazy_test ran", "lazy_test changed"),
+            )
+            os.utime(path, ns=(0, 0))
+            kernel.reload_magics()
+        assert not kernel.line_magics.is_loaded("lazy_test")
+        assert kernel.line_magics["lazy_test"] is not magic
+        asyncio.run(kernel.do_execute("%lazy_test", None))
+        assert "lazy_test changed" in get_log_text(kernel)
+
+
+def test_magic_watcher_check() -> None:
+    calls = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        watcher = MagicWatcher([tmpdir], lambda: calls.append(1), interval=60)
+        assert not watcher.check()
+
+        _write_magic(tmpdir, "watched_magic", LAZY_MAGIC)
+        assert watcher.check()
+        assert not watcher.check()
+
+        os.remove(os.path.join(tmpdir, "watched_magic.py"))
+        assert watcher.check()
+    assert calls == [1, 1]
+
+
+def _magic_watcher(kernel: MetaKernel) -> MagicWatcher | None:
+    return kernel.magic_watcher
+
+
+def test_kernel_magic_watcher() -> None:
+    kernel = get_kernel()
+    assert _magic_watcher(kernel) is None
+
+    kernel.start_magic_watcher(interval=60)
+    watcher = _magic_watcher(kernel)
+    assert watcher is not None
+    assert watcher.directories == kernel.magic_search_paths
+    with unittest.mock.patch.object(kernel, "reload_magics") as reload_magics:
+        watcher.callback()
+    reload_magics.assert_called_once_with()
+
+    asyncio.run(kernel.do_shutdown(False))
+    assert _magic_watcher(kernel) is None
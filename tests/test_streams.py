@@ -0,0 +1,178 @@
+import contextvars
+import time
+import unittest.mock
+from collections.abc import Callable
+from typing import Any
+
+from metakernel.streams import StreamBuffer
+
+
+def _buffer(**kwargs: Any) -> tuple[StreamBuffer, list[tuple[str, str]]]:
+    sent: list[tuple[str, str]] = []
+    buffer = StreamBuffer(lambda name, text: sent.append((name, text)), **kwargs)
+    return buffer, sent
+
+
+def test_closed_buffer_sends_at_once() -> None:
+    buffer, sent = _buffer()
+    buffer.write("stdout", "a")
+    buffer.write("stdout", "b")
+    assert sent == [("stdout", "a"), ("stdout", "b")]
+
+
+def test_open_buffer_joins_writes() -> None:
+    buffer, sent = _buffer(interval=10)
+    buffer.open()
+    for text in "abc":
+        buffer.write("stdout", text)
+    assert sent == []
+    buffer.close()
+    assert sent == [("stdout", "abc")]
+    buffer.write("stdout", "d")
+    assert sent[-1] == ("stdout", "d")
+
+
+def test_streams_keep_their_order() -> None:
+    buffer, sent = _buffer(interval=10)
+    buffer.open()
+    buffer.write("stdout", "a")
+    buffer.write("stdout", "b")
+    buffer.write("stderr", "c")
+    buffer.flush()
+    buffer.write("stdout", "d")
+    buffer.close()
+    assert sent == [("stdout", "ab"), ("stderr", "c"), ("stdout", "d")]
+
+
+def test_flush_on_size() -> None:
+    buffer, sent = _buffer(interval=10, max_size=4)
+    buffer.open()
+    buffer.write("stdout", "ab")
+    buffer.write("stdout", "cd")
+    buffer.write("stdout", "e")
+    assert sent == [("stdout", "abcd")]
+    buffer.close()
+    assert sent == [("stdout", "abcd"), ("stdout", "e")]
+
+
+def _timed_buffer(
+    **kwargs: Any,
+) -> tuple[StreamBuffer, list[tuple[str, str]], list[Callable[[], None]]]:
+    """A buffer whose timers are run by the test."""
+    timers: list[Callable[[], None]] = []
+    buffer, sent = _buffer(
+        call_later=lambda delay, callback: timers.append(callback), **kwargs
+    )
+    return buffer, sent, timers
+
+
+def test_flush_on_time() -> None:
+    buffer, sent, timers = _timed_buffer()
+    buffer.open(10)
+    buffer.write("stdout", "a")
+    buffer.write("stdout", "b")
+    assert len(timers) == 1
+    # A timer that fires early waits again
+    timers.pop()()
+    assert sent == []
+    assert len(timers) == 1
+    with unittest.mock.patch("time.monotonic", return_value=time.monotonic() + 20):
+        timers.pop()()
+    assert sent == [("stdout", "ab")]
+    assert timers == []
+    buffer.write("stdout", "c")
+    buffer.close()
+    assert sent == [("stdout", "ab"), ("stdout", "c")]
+    # Timers left after the cell do nothing
+    timers.pop()()
+    assert sent == [("stdout", "ab"), ("stdout", "c")]
+
+
+def test_flush_on_write_after_interval() -> None:
+    # Without timers, e.g. while a cell blocks the IO loop
+    buffer, sent = _buffer()
+    buffer.open(10)
+    buffer.write("stdout", "a")
+    with unittest.mock.patch("time.monotonic", return_value=time.monotonic() + 20):
+        buffer.write("stdout", "b")
+    assert sent == [("stdout", "ab")]
+    buffer.close()
+
+
+def test_zero_interval_disables_buffering() -> None:
+    buffer, sent = _buffer()
+    buffer.open(0)
+    buffer.write("stdout", "a")
+    assert sent == [("stdout", "a")]
+    buffer.close()
+
+
+def test_batching_block() -> None:
+    buffer, sent = _buffer()
+    buffer.open(0)
+    with buffer.batching(10):
+        buffer.write("stdout", "a")
+        buffer.write("stdout", "b")
+        assert sent == []
+    assert sent == [("stdout", "ab")]
+    buffer.write("stdout", "c")
+    assert sent[-1] == ("stdout", "c")
+    buffer.close()
+
+
+def test_timed_flush_runs_in_opening_context() -> None:
+    var: contextvars.ContextVar[str] = contextvars.ContextVar("var", default="")
+    seen: list[str] = []
+    timers: list[Callable[[], None]] = []
+    buffer = StreamBuffer(
+        lambda name, text: seen.append(var.get()),
+        interval=0,
+        call_later=lambda delay, callback: timers.append(callback),
+    )
+    var.set("cell")
+    buffer.open(1e-9)
+    buffer.write("stdout", "a")
+    var.set("other")
+    time.sleep(0.001)
+    timers.pop()()
+    buffer.close()
+    assert seen == ["cell"]
+
+
+def test_byte_limit() -> None:
+    buffer, sent = _buffer(interval=10, tail_size=4)
+    buffer.open(byte_limit=5)
+    buffer.write("stdout", "abc\n")
+    buffer.write("stdout", "def\n")
+    for i in range(10):
+        buffer.write("stdout", f"{i}\n")
+    buffer.close()
+    assert sent[0] == ("stdout", "abc\nd")
+    name, summary = sent[1]
+    assert name == "stderr"
+    assert "21 characters in 10 lines were not shown" in summary
+    assert sent[2:] == [("stdout", "9\n")]
+    # The limit is per cell
+    buffer.open()
+    buffer.write("stdout", "abc\nd")
+    buffer.close()
+    assert sent[-1] == ("stdout", "abc\nd")
+    buffer.open(byte_limit=0)
+    buffer.write("stdout", "abcdef")
+    buffer.close()
+    assert sent[-1] == ("stdout", "abcdef")
+
+
+def test_message_limit_and_spill_file(tmp_path: Any) -> None:
+    buffer, sent = _buffer(interval=0)
+    buffer.open(message_limit=2, spill_dir=str(tmp_path))
+    for i in range(5):
+        buffer.write("stdout", f"{i}\n")
+    buffer.write("stderr", "error\n")
+    buffer.close()
+    assert sent[:2] == [("stdout", "0\n"), ("stdout", "1\n")]
+    assert buffer.spill_file is not None
+    assert buffer.spill_file in sent[2][1]
+    assert sent[3:] == [("stdout", "2\n3\n4\n"), ("stderr", "error\n")]
+    with open(buffer.spill_file) as f:
+        assert f.read() == "2\n3\n4\nerror\n"
@@ -39,6 +39,14 @@ class EvalKernel(MetaKernel):
         python_magic = self.line_magics["python"]
         python_magic.env[name] = value
 
+    def del_variables(self, names: list[str]) -> None:
+        """
+        Remove variables from the kernel language.
+        """
+        python_magic = self.line_magics["python"]
+        for name in names:
+            python_magic.env.pop(name, None)
+
     def get_variable(self, name: str) -> Any:
         """
         Get a variable from the kernel language.